@@ -1,23 +1,165 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, send_from_directory, abort
+import hashlib
+import io
+import json
+import mimetypes
 import os
+import re
+import tempfile
+import threading
+from functools import lru_cache
 from werkzeug.utils import secure_filename
 
+try:
+    import openslide
+except ImportError:  # openslide为可选依赖，缺失时只记录基础文件信息
+    openslide = None
+
+try:
+    import re2
+except ImportError:  # google-re2为可选依赖，缺失时使用标准库re
+    re2 = None
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，缺失时使用标准库json
+    orjson = None
+
+try:
+    import zmq
+except ImportError:  # pyzmq为可选依赖，缺失时瓦片路由不可用
+    zmq = None
+
 # 初始化Flask应用
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'  # 生产环境中应使用安全的密钥
 app.config['UPLOAD_FOLDER'] = 'uploads/'  # 上传文件的保存路径
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 最大上传文件大小16MB
+app.config['MAX_CONTENT_LENGTH'] = 2 * 1024 * 1024 * 1024  # 最大上传文件大小2GB（大尺寸切片走/upload_stream）
+app.config['STREAM_CHUNK_SIZE'] = 4 * 1024 * 1024  # 流式上传每次读取4MB
+app.config['USE_X_ACCEL_REDIRECT'] = False  # 部署在NGINX之后时开启，由NGINX直接发送文件
+app.config['X_ACCEL_REDIRECT_PREFIX'] = '/internal/uploads/'  # 与NGINX中internal location保持一致
+app.config['TILE_SERVER_ADDRESS'] = 'tcp://127.0.0.1:5555'  # tile_server.py监听地址
+app.config['TILE_SERVER_TIMEOUT'] = 5000  # 等待瓦片服务响应的超时时间（毫秒）
 
 # 确保上传文件夹存在
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # 允许的文件扩展名
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'tiff', 'bmp', 'svs'}
+_ALLOWED_SUFFIXES = tuple(f'.{ext}' for ext in ALLOWED_EXTENSIONS)
+# 已经是安全文件名且扩展名合法的上传文件名，一次匹配同时完成清理和类型检查
+_SAFE_UPLOAD_NAME = (re2 or re).compile(
+    r'(?i)^[A-Za-z0-9-][A-Za-z0-9_.-]*\.(?:%s)$' % '|'.join(sorted(ALLOWED_EXTENSIONS))
+)
+
+def dumps_json(obj):
+    """序列化为UTF-8编码的JSON字节（优先使用orjson）"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+def json_response(obj, status=200):
+    """返回JSON响应，代替jsonify"""
+    return app.response_class(dumps_json(obj), status=status, mimetype='application/json')
 
 def allowed_file(filename):
     """检查文件扩展名是否被允许"""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return filename.lower().endswith(_ALLOWED_SUFFIXES)
+
+def clean_upload_filename(filename):
+    """
+    清理上传文件名并检查扩展名
+
+    常见的ASCII文件名由预编译的正则一次匹配完成，其余情况回退到secure_filename。
+
+    Returns:
+        安全的文件名，扩展名不被允许时返回None
+    """
+    if _SAFE_UPLOAD_NAME.match(filename):
+        return filename
+    filename = secure_filename(filename)
+    if filename and allowed_file(filename):
+        return filename
+    return None
+
+def save_uploaded_file(file, filepath):
+    """
+    保存上传的文件
+
+    Werkzeug会把较大的上传内容落盘到临时文件，此时使用os.sendfile在内核态
+    直接复制到目标文件，避免数据经过Python用户空间；内存中的小文件回退到file.save。
+    """
+    try:
+        src_fd = file.stream.fileno()
+    except (AttributeError, io.UnsupportedOperation, OSError):
+        file.save(filepath)
+        return
+    
+    size = os.fstat(src_fd).st_size
+    dst_fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        offset = 0
+        while offset < size:
+            sent = os.sendfile(dst_fd, src_fd, offset, min(size - offset, 1 << 20))
+            if sent == 0:
+                break
+            offset += sent
+    finally:
+        os.close(dst_fd)
+
+def slide_header_path(filepath):
+    """切片头信息缓存文件路径"""
+    return filepath + '.hdr.json'
+
+def write_slide_header(filepath):
+    """
+    解析切片头信息（尺寸、金字塔层级、MPP等）并写入缓存文件
+
+    只在上传完成时解析一次，之后的信息查询直接读取缓存，无需重新解析切片。
+    """
+    header = {
+        'filename': os.path.basename(filepath),
+        'size': os.path.getsize(filepath),
+        'path': filepath
+    }
+    
+    if openslide is not None:
+        try:
+            with openslide.OpenSlide(filepath) as slide:
+                header.update({
+                    'dimensions': slide.dimensions,
+                    'level_count': slide.level_count,
+                    'level_dimensions': slide.level_dimensions,
+                    'level_downsamples': slide.level_downsamples,
+                    'mpp_x': slide.properties.get(openslide.PROPERTY_NAME_MPP_X),
+                    'mpp_y': slide.properties.get(openslide.PROPERTY_NAME_MPP_Y),
+                    'vendor': slide.properties.get(openslide.PROPERTY_NAME_VENDOR)
+                })
+        except Exception as e:
+            app.logger.warning(f"解析切片头信息失败 {filepath}: {e}")
+    
+    # 缓存中保存序列化后的字节，查询时原样返回，无需再次编码
+    with open(slide_header_path(filepath), 'wb') as f:
+        f.write(dumps_json(header))
+
+@lru_cache(maxsize=1024)
+def load_slide_header(header_path, mtime, size):
+    """读取切片头信息缓存（按文件修改时间和大小失效）"""
+    with open(header_path, 'rb') as f:
+        return f.read()
+
+_tile_local = threading.local()
+
+def _tile_socket():
+    """获取当前线程的瓦片服务REQ套接字（REQ套接字不能跨线程共享）"""
+    sock = getattr(_tile_local, 'sock', None)
+    if sock is None:
+        sock = zmq.Context.instance().socket(zmq.REQ)
+        sock.setsockopt(zmq.RCVTIMEO, app.config['TILE_SERVER_TIMEOUT'])
+        sock.setsockopt(zmq.LINGER, 0)
+        sock.connect(app.config['TILE_SERVER_ADDRESS'])
+        _tile_local.sock = sock
+    return sock
 
 # 首页路由
 @app.route('/')
@@ -28,7 +170,7 @@ def index():
 # 上传病理切片路由
 @app.route('/upload', methods=['GET', 'POST'])
 def upload():
-    """处理病理切片上传"""
+    """处理病理切片上传（multipart表单，仅用于缩略图等小文件，大文件请使用/upload_stream）"""
     if request.method == 'POST':
         # 检查请求是否包含文件部分
         if 'file' not in request.files:
@@ -41,10 +183,11 @@ def upload():
             flash('没有选择文件')
             return redirect(request.url)
         
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
+        filename = clean_upload_filename(file.filename)
+        if file and filename:
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            save_uploaded_file(file, filepath)
+            write_slide_header(filepath)
             flash('文件上传成功')
             return redirect(url_for('view_slide', filename=filename))
         else:
@@ -53,6 +196,103 @@ def upload():
     
     return render_template('upload.html')
 
+# 流式上传病理切片路由
+@app.route('/upload_stream', methods=['POST'])
+def upload_stream():
+    """
+    流式上传大尺寸病理切片（SVS/TIFF等）
+
+    客户端直接POST原始字节（Content-Type: application/octet-stream），
+    文件名通过请求头 X-Filename 传递。请求体不经过multipart解析，
+    按大块从 request.stream 读取后直接写入文件描述符。
+
+    写入的同时计算SHA-256，文件以内容摘要命名保存；
+    相同内容的切片已存在时丢弃本次写入，直接返回已有文件。
+    """
+    raw_filename = request.headers.get('X-Filename', '')
+    if not raw_filename:
+        return json_response({'error': '缺少文件名'}, 400)
+    filename = clean_upload_filename(raw_filename)
+    if not filename:
+        return json_response({'error': '不支持的文件类型'}, 400)
+    
+    # 整个上传过程复用同一块缓冲区，每次读取不再分配新的bytes对象
+    buffer = memoryview(bytearray(app.config['STREAM_CHUNK_SIZE']))
+    digest = hashlib.sha256()
+    
+    total = 0
+    fd, temp_path = tempfile.mkstemp(suffix='.part', dir=app.config['UPLOAD_FOLDER'])
+    try:
+        try:
+            while True:
+                n = request.stream.readinto(buffer)
+                if not n:
+                    break
+                chunk = buffer[:n]
+                digest.update(chunk)
+                # os.write可能只写入部分数据，需循环直到写完
+                view = chunk
+                while view:
+                    view = view[os.write(fd, view):]
+                total += n
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        
+        stored_name = digest.hexdigest() + os.path.splitext(filename)[1].lower()
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], stored_name)
+        duplicate = os.path.exists(filepath)
+        if duplicate:
+            os.remove(temp_path)
+        else:
+            # 原子替换，避免读取到写了一半的文件
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, filepath)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    if not duplicate:
+        write_slide_header(filepath)
+    
+    return json_response({
+        'filename': stored_name,
+        'original_filename': filename,
+        'sha256': digest.hexdigest(),
+        'size': total,
+        'duplicate': duplicate,
+        'url': url_for('view_slide', filename=stored_name)
+    }, 200 if duplicate else 201)
+
+# 上传文件下载路由
+@app.route('/file/<name>')
+def serve_file(name):
+    """
+    返回上传的切片文件
+
+    开启USE_X_ACCEL_REDIRECT时只返回X-Accel-Redirect响应头，文件内容由NGINX通过
+    sendfile直接发送，不经过Python。NGINX需配置对应的内部location，例如：
+
+        location /internal/uploads/ {
+            internal;
+            alias /app/uploads/;
+            sendfile on;
+            tcp_nopush on;
+        }
+    """
+    filename = secure_filename(name)
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    if not filename or not os.path.isfile(filepath):
+        abort(404)
+    
+    if app.config['USE_X_ACCEL_REDIRECT']:
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        response = app.response_class(mimetype=mimetype)
+        response.headers['X-Accel-Redirect'] = app.config['X_ACCEL_REDIRECT_PREFIX'] + filename
+        return response
+    
+    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+
 # 查看病理切片路由
 @app.route('/view/<filename>')
 def view_slide(filename):
@@ -63,20 +303,59 @@ def view_slide(filename):
 @app.route('/api/slide/<filename>')
 def get_slide_info(filename):
     """获取切片的元数据信息"""
-    # 这里可以添加实际的切片处理逻辑
     filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     
-    if not os.path.exists(filepath):
-        return jsonify({'error': '文件不存在'}), 404
+    # 只对头信息缓存文件做一次stat，缓存存在即说明切片存在
+    header_path = slide_header_path(filepath)
+    try:
+        st = os.stat(header_path)
+    except FileNotFoundError:
+        # 头信息在上传时已解析并缓存，旧文件缺少缓存时补建
+        if not os.path.isfile(filepath):
+            return json_response({'error': '文件不存在'}, 404)
+        write_slide_header(filepath)
+        st = os.stat(header_path)
     
-    # 模拟获取切片信息
-    slide_info = {
-        'filename': filename,
-        'size': os.path.getsize(filepath),
-        'path': filepath
-    }
+    body = load_slide_header(header_path, st.st_mtime_ns, st.st_size)
+    return app.response_class(body, mimetype='application/json')
+
+# API路由 - 获取切片瓦片
+@app.route('/api/slide/<filename>/tile/<int:level>/<int:row>/<int:col>')
+def get_slide_tile(filename, level, row, col):
+    """
+    获取切片瓦片（JPEG）
+
+    瓦片由独立进程tile_server.py读取和编码，这里只通过ZeroMQ转发请求，
+    避免每个瓦片的解码和编码都占用Web进程。
+    """
+    if zmq is None:
+        return json_response({'error': '瓦片服务不可用'}, 503)
+    
+    request_body = dumps_json({
+        'slide': secure_filename(filename),
+        'level': level,
+        'row': row,
+        'col': col,
+        'encoding': 'jpeg'
+    })
+    
+    sock = _tile_socket()
+    try:
+        sock.send(request_body)
+        header, data = sock.recv_multipart()
+    except zmq.Again:
+        # REQ套接字超时后状态失效，丢弃并在下次请求时重建
+        sock.close()
+        _tile_local.sock = None
+        return json_response({'error': '瓦片服务超时'}, 504)
+    
+    header = json.loads(header)
+    if header.get('status') != 'ok':
+        return json_response({'error': header.get('error', '读取瓦片失败')}, 404)
     
-    return jsonify(slide_info)
+    response = app.response_class(data, mimetype='image/jpeg')
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    return response
 
 # 错误处理
 @app.errorhandler(404)
@@ -3,33 +3,79 @@
 
 该模块提供统一的数据上传、预处理、存储和检索功能，为多模态大模型医学病理诊断系统提供数据支撑。
 """
+import asyncio
+import importlib
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from datetime import datetime
+from functools import cached_property
+
+logger = logging.getLogger(__name__)
 
 # 版本信息
 __version__ = '1.0.0'
 __author__ = 'Medical AI Team'
 __description__ = '多源数据集成底座 - 支持医学图像、病历、检验结果等多模态数据的统一管理'
 
-# 从各子模块导入核心类和函数
-# 数据上传模块
-from .uploaders import (
-    ImageUploader, SystemIntegration, BatchUploadManager,
-    BatchUploadTask, get_image_uploader, get_system_integration,
-    get_batch_manager, supported_image_formats, supported_system_types
-)
+# 导出名称到子模块的映射
+# 子模块在首次访问对应名称时才导入（PEP 562），只使用检索功能的进程无需加载图像处理等重量级依赖
+_LAZY_MAP = {
+    # 数据上传模块
+    'ImageUploader': 'uploaders',
+    'SystemIntegration': 'uploaders',
+    'BatchUploadManager': 'uploaders',
+    'BatchUploadTask': 'uploaders',
+    'get_image_uploader': 'uploaders',
+    'get_system_integration': 'uploaders',
+    'get_batch_manager': 'uploaders',
+    'supported_image_formats': 'uploaders',
+    'supported_system_types': 'uploaders',
+    
+    # 数据预处理模块
+    'ImageQualityEnhancer': 'preprocessors',
+    'TextDataProcessor': 'preprocessors',
+    'TimeSeriesProcessor': 'preprocessors',
+    'preprocess_image': 'preprocessors',
+    'preprocess_text': 'preprocessors',
+    'preprocess_time_series': 'preprocessors',
+    'enhance_image_quality': 'preprocessors',
+    'normalize_color': 'preprocessors',
+    'virtual_staining': 'preprocessors',
+    
+    # 数据存储与检索模块
+    'ImageStorageManager': 'storage',
+    'DocumentStorageManager': 'storage',
+    'MetadataIndexManager': 'storage',
+    'MultiModalRetrievalEngine': 'storage',
+    'BatchingSearcher': 'storage',
+    'StorageFactory': 'storage',
+    'create_default_storage_pipeline': 'storage',
+    'get_storage_manager_by_type': 'storage'
+}
 
-# 数据预处理模块
-from .preprocessors import (
-    ImageQualityEnhancer, TextDataProcessor, TimeSeriesProcessor,
-    preprocess_image, preprocess_text, preprocess_time_series,
-    enhance_image_quality, normalize_color, virtual_staining
-)
+def __getattr__(name):
+    """
+    按需导入子模块中的导出名称，并缓存到模块命名空间
+    """
+    module_name = _LAZY_MAP.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    
+    module = importlib.import_module(f'.{module_name}', __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
 
-# 数据存储与检索模块
-from .storage import (
-    ImageStorageManager, DocumentStorageManager, MetadataIndexManager,
-    MultiModalRetrievalEngine, StorageFactory,
-    create_default_storage_pipeline, get_storage_manager_by_type
-)
+def __dir__():
+    """包含延迟导入名称的属性列表"""
+    return sorted(set(globals()) | set(_LAZY_MAP))
 
 # 统一导出列表
 __all__ = [
@@ -45,7 +91,7 @@ __all__ = [
     
     # 数据存储与检索
     'ImageStorageManager', 'DocumentStorageManager', 'MetadataIndexManager',
-    'MultiModalRetrievalEngine', 'StorageFactory',
+    'MultiModalRetrievalEngine', 'BatchingSearcher', 'StorageFactory',
     'create_default_storage_pipeline', 'get_storage_manager_by_type',
     
     # 版本信息
@@ -63,6 +109,10 @@ def initialize(config=None):
     Returns:
         初始化后的组件字典
     """
+    from .storage import StorageFactory
+    from .uploaders import get_image_uploader, get_system_integration, get_batch_manager
+    from .preprocessors import ImageQualityEnhancer, TextDataProcessor, TimeSeriesProcessor
+    
     components = {}
     
     # 初始化存储工厂和组件
@@ -91,6 +141,23 @@ def initialize(config=None):
     
     return components
 
+# 图像上传校验的默认值（与config.py中storage.image_storage一致）
+_DEFAULT_IMAGE_FORMATS = ('.tif', '.tiff', '.svs', '.ndpi', '.jpg', '.jpeg', '.png')
+_DEFAULT_MAX_IMAGE_MB = 1000
+
+# 扩展名对应的文件头签名，用于识别扩展名与内容不符的文件（SVS/NDPI为TIFF容器）
+_TIFF_SIGNATURES = (b'II*\x00', b'MM\x00*', b'II+\x00', b'MM\x00+')
+_IMAGE_SIGNATURES = {
+    '.tif': _TIFF_SIGNATURES,
+    '.tiff': _TIFF_SIGNATURES,
+    '.svs': _TIFF_SIGNATURES,
+    '.ndpi': _TIFF_SIGNATURES,
+    '.jpg': (b'\xff\xd8\xff',),
+    '.jpeg': (b'\xff\xd8\xff',),
+    '.png': (b'\x89PNG\r\n\x1a\n',),
+}
+_SIGNATURE_BYTES = 8
+
 # 提供一个简单的API类来封装常用功能
 class DataIntegrationAPI:
     """
@@ -98,57 +165,194 @@ class DataIntegrationAPI:
     封装常用的数据处理、存储和检索功能
     """
     
+    # 保留的已结束批量任务数量，更早结束的任务状态不再可查询
+    MAX_FINISHED_BATCH_TASKS = 1024
+    
     def __init__(self, config=None):
         """
         初始化API接口
+        各组件在首次访问时才创建，未使用的组件不会分配
         
         Args:
             config: 配置参数字典
         """
-        self.components = initialize(config)
+        self.config = config
+        # 已创建组件的缓存
+        self.components = {}
+        
+        # 批量任务进度记录，已结束的任务只保留最近MAX_FINISHED_BATCH_TASKS个
+        self._batch_tasks = {}
+        self._finished_batch_tasks = deque()
+        self._batch_lock = threading.Lock()
         
-        # 便捷访问核心组件
-        self.image_uploader = self.components['image_uploader']
-        self.system_integration = self.components['system_integration']
-        self.batch_manager = self.components['batch_manager']
-        self.image_preprocessor = self.components['image_preprocessor']
-        self.text_preprocessor = self.components['text_preprocessor']
-        self.time_series_processor = self.components['time_series_processor']
+        # 存储统计快照，由后台线程定期刷新
+        self._storage_stats = None
+        self._stats_lock = threading.Lock()
+        self._stats_thread = None
+    
+    def _section_config(self, section):
+        """
+        获取配置中的指定部分
         
-        # 存储组件
-        self.storage_pipeline = self.components['storage_pipeline']
-        self.image_storage = self.storage_pipeline['image_storage']
-        self.document_storage = self.storage_pipeline['document_storage']
-        self.metadata_index = self.storage_pipeline['metadata_index']
-        self.retrieval_engine = self.storage_pipeline['retrieval_engine']
+        Args:
+            section: 配置部分名称（如'storage'、'upload'）
+            
+        Returns:
+            对应的配置字典，不存在时返回None
+        """
+        if self.config and section in self.config:
+            return self.config[section]
+        return None
+    
+    def _register(self, name, component):
+        """
+        记录已创建的组件
+        """
+        self.components[name] = component
+        return component
+    
+    # 启动时预热的组件（不含searcher：其后台线程不能跨越gunicorn预加载后的fork）
+    WARMUP_COMPONENTS = ('image_preprocessor', 'image_storage', 'document_storage', 'retrieval_engine')
+    def warmup(self, components=None):
+        """
+        预先创建组件（同时导入其依赖的scipy、skimage等模块），避免首个请求承担初始化开销
+        
+        Args:
+            components: 要预热的组件名称列表，默认为WARMUP_COMPONENTS
+            
+        Returns:
+            预热成功的组件名称列表
+        """
+        warmed = []
+        for name in components or self.WARMUP_COMPONENTS:
+            try:
+                getattr(self, name)
+                warmed.append(name)
+            except Exception as e:
+                logger.warning(f"预热组件失败 {name}: {e}")
+        
+        return warmed
+    
+    # 存储组件
+    @cached_property
+    def storage_factory(self):
+        """存储工厂（首次访问时创建）"""
+        from .storage import StorageFactory
+        return self._register('storage_factory', StorageFactory(self._section_config('storage')))
+    
+    @cached_property
+    def storage_pipeline(self):
+        """完整的存储处理管道（首次访问时创建）"""
+        return self._register('storage_pipeline', self.storage_factory.create_storage_pipeline())
+    
+    @cached_property
+    def image_storage(self):
+        """图像存储管理器（首次访问时创建）"""
+        return self.storage_factory.get_image_storage_manager()
+    
+    @cached_property
+    def document_storage(self):
+        """文档存储管理器（首次访问时创建）"""
+        return self.storage_factory.get_document_storage_manager()
+    
+    @cached_property
+    def metadata_index(self):
+        """元数据索引管理器（首次访问时创建）"""
+        return self.storage_factory.get_metadata_index_manager()
     
-    def upload_and_process_image(self, file_path, metadata=None):
+    @cached_property
+    def retrieval_engine(self):
+        """多模态检索引擎（首次访问时创建）"""
+        return self.storage_factory.get_retrieval_engine()
+    
+    @cached_property
+    def searcher(self):
+        """搜索请求微批处理器（首次访问时创建）"""
+        from .storage import BatchingSearcher
+        search_config = self._section_config('search') or {}
+        return self._register('searcher', BatchingSearcher(
+            self.retrieval_engine,
+            max_batch_size=search_config.get('max_batch_size', 32),
+            max_wait_ms=search_config.get('max_wait_ms', 4.0)
+        ))
+    
+    # 上传组件
+    @cached_property
+    def image_uploader(self):
+        """图像上传器（首次访问时创建）"""
+        from .uploaders import get_image_uploader
+        upload_config = self._section_config('upload')
+        if upload_config:
+            return self._register('image_uploader', get_image_uploader(upload_config))
+        return self._register('image_uploader', get_image_uploader())
+    
+    @cached_property
+    def system_integration(self):
+        """医疗系统集成器（首次访问时创建）"""
+        from .uploaders import get_system_integration
+        upload_config = self._section_config('upload')
+        if upload_config:
+            return self._register('system_integration', get_system_integration(upload_config))
+        return self._register('system_integration', get_system_integration())
+    
+    @cached_property
+    def batch_manager(self):
+        """批量上传管理器（首次访问时创建）"""
+        from .uploaders import get_batch_manager
+        upload_config = self._section_config('upload')
+        if upload_config:
+            return self._register('batch_manager', get_batch_manager(upload_config))
+        return self._register('batch_manager', get_batch_manager())
+    
+    # 预处理组件
+    @cached_property
+    def image_preprocessor(self):
+        """图像预处理器（首次访问时创建）"""
+        from .preprocessors import ImageQualityEnhancer
+        return self._register('image_preprocessor', ImageQualityEnhancer())
+    
+    @cached_property
+    def text_preprocessor(self):
+        """文本预处理器（首次访问时创建）"""
+        from .preprocessors import TextDataProcessor
+        return self._register('text_preprocessor', TextDataProcessor())
+    
+    @cached_property
+    def time_series_processor(self):
+        """时间序列处理器（首次访问时创建）"""
+        from .preprocessors import TimeSeriesProcessor
+        return self._register('time_series_processor', TimeSeriesProcessor())
+    
+    def upload_and_process_image(self, file_path, metadata=None, filename=None):
         """
         上传并处理图像的一站式方法
         
         Args:
-            file_path: 图像文件路径
+            file_path: 图像文件路径，或已打开的二进制文件对象（如上传请求流）
             metadata: 图像元数据
+            filename: 原始文件名（传入文件对象时用于记录来源和判断格式）
             
         Returns:
             处理结果字典
         """
-        # 验证文件
-        validation_result = self.image_uploader.validate_file(file_path)
-        if not validation_result['valid']:
+        metadata = dict(metadata or {})
+        if hasattr(file_path, 'read') and filename:
+            metadata.setdefault('original_filename', filename)
+        
+        # 验证文件（格式、文件头和大小），文件对象与路径使用同一套校验后再交给解码器
+        file_path, error = self._validate_image_source(file_path, filename)
+        if error:
             return {
                 'success': False,
-                'error': validation_result['error'],
+                'error': error,
                 'step': 'validation'
             }
         
         # 预处理图像
         try:
             # 这里只是示例，实际预处理策略应根据需求调整
-            processed_image = self.image_preprocessor.enhance_quality(file_path)
-            preprocessed_path = self.image_preprocessor.save_processed_image(
-                processed_image, file_path + '.processed'
-            )
+            # 处理结果保留在内存中，不再写出.processed中间文件
+            processed_image = self.image_preprocessor.enhance_array(file_path)
         except Exception as e:
             return {
                 'success': False,
@@ -156,10 +360,11 @@ class DataIntegrationAPI:
                 'step': 'preprocessing'
             }
         
-        # 存储图像
+        # 存储图像（upload.processed_format为'npy'时以内存映射数组保存，不做编码）
+        processed_format = (self._section_config('upload') or {}).get('processed_format', 'tif')
         try:
-            storage_result = self.image_storage.store_image(
-                preprocessed_path, metadata=metadata
+            storage_result = self.image_storage.store_image_from_buffer(
+                processed_image, metadata=metadata, format_type=processed_format
             )
             return {
                 'success': True,
@@ -173,13 +378,102 @@ class DataIntegrationAPI:
                 'step': 'storage'
             }
     
-    def upload_and_process_document(self, file_path, metadata=None):
+    def _validate_image_source(self, source, filename=None):
+        """
+        校验待上传图像的扩展名、文件头和大小
+        
+        Args:
+            source: 图像文件路径或二进制文件对象
+            filename: 原始文件名（文件对象时用于判断扩展名）
+            
+        Returns:
+            (可供解码的图像来源, 错误信息)，校验通过时错误信息为None；
+            不可随机访问的文件对象会被读入内存，返回新的文件对象
+        """
+        image_config = (self._section_config('storage') or {}).get('image_storage', {})
+        allowed_formats = image_config.get('allowed_formats', _DEFAULT_IMAGE_FORMATS)
+        max_bytes = int(image_config.get('max_file_size_mb', _DEFAULT_MAX_IMAGE_MB) * 1024 * 1024)
+        
+        is_stream = hasattr(source, 'read')
+        name = filename if is_stream else (filename or source)
+        ext = os.path.splitext(name or '')[1].lower()
+        if ext not in allowed_formats:
+            return source, f"不支持的文件格式: {ext or '未知'}"
+        
+        if not is_stream:
+            try:
+                size = os.path.getsize(source)
+                with open(source, 'rb') as f:
+                    header = f.read(_SIGNATURE_BYTES)
+            except OSError as e:
+                return source, f"无法读取文件: {e}"
+        elif source.seekable():
+            position = source.tell()
+            header = source.read(_SIGNATURE_BYTES)
+            size = source.seek(0, io.SEEK_END) - position
+            source.seek(position)
+        else:
+            # 不可回退的流只读入不超过大小限制的内容
+            data = source.read(max_bytes + 1)
+            size = len(data)
+            header = data[:_SIGNATURE_BYTES]
+            source = io.BytesIO(data)
+        
+        if size > max_bytes:
+            return source, f"文件大小超过限制: {size} > {max_bytes} 字节"
+        signatures = _IMAGE_SIGNATURES.get(ext)
+        if signatures and not header.startswith(signatures):
+            return source, f"文件内容与扩展名不符: {ext}"
+        return source, None
+    
+    async def upload_and_process_image_async(self, file_path, metadata=None, filename=None):
+        """
+        上传并处理图像的异步版本
+        在线程池中执行验证、预处理和存储，不阻塞事件循环
+        
+        Args:
+            file_path: 图像文件路径，或已打开的二进制文件对象
+            metadata: 图像元数据
+            filename: 原始文件名
+            
+        Returns:
+            处理结果字典
+        """
+        return await asyncio.to_thread(self.upload_and_process_image, file_path, metadata, filename)
+    
+    async def upload_and_process_images_async(self, file_paths, metadata_list=None, max_concurrency=4):
+        """
+        并发上传并处理多张图像
+        
+        Args:
+            file_paths: 图像文件路径列表
+            metadata_list: 对应文件的元数据列表
+            max_concurrency: 同时处理的最大图像数
+            
+        Returns:
+            处理结果列表，顺序与file_paths一致
+        """
+        if metadata_list is None:
+            metadata_list = [None] * len(file_paths)
+        
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def _process(file_path, metadata):
+            async with semaphore:
+                return await self.upload_and_process_image_async(file_path, metadata)
+        
+        return await asyncio.gather(
+            *(_process(path, meta) for path, meta in zip(file_paths, metadata_list))
+        )
+    
+    def upload_and_process_document(self, file_path, metadata=None, filename=None):
         """
         上传并处理文档的一站式方法
         
         Args:
-            file_path: 文档文件路径
+            file_path: 文档文件路径，或已打开的二进制文件对象（如上传请求流）
             metadata: 文档元数据
+            filename: 原始文件名（传入文件对象时用于判断文档格式）
             
         Returns:
             处理结果字典
@@ -188,11 +482,22 @@ class DataIntegrationAPI:
         try:
             # 这里应该添加适当的文档格式检测和内容提取
             # 简化示例，实际应用需要更复杂的处理
-            if metadata is None:
-                metadata = {}
+            metadata = dict(metadata or {})
+            
+            if hasattr(file_path, 'read'):
+                # 文件对象直接读取内容，不经过临时文件
+                source_name = filename or ''
+                if filename:
+                    metadata.setdefault('original_filename', filename)
+                content = file_path.read()
+                if isinstance(content, bytes):
+                    content = content.decode('utf-8', errors='replace')
+            else:
+                source_name = file_path
+                content = file_path
             
             # 预处理文档（例如从PDF提取文本）
-            if file_path.lower().endswith('.pdf'):
+            if source_name.lower().endswith('.pdf'):
                 # 这里添加PDF文本提取逻辑
                 pass
                 
@@ -206,7 +511,7 @@ class DataIntegrationAPI:
         # 存储文档
         try:
             storage_result = self.document_storage.store_document(
-                file_path, metadata=metadata
+                content, metadata=metadata
             )
             return {
                 'success': True,
@@ -220,6 +525,21 @@ class DataIntegrationAPI:
                 'step': 'storage'
             }
     
+    async def upload_and_process_document_async(self, file_path, metadata=None, filename=None):
+        """
+        上传并处理文档的异步版本
+        在线程池中执行读取和存储，不阻塞事件循环
+        
+        Args:
+            file_path: 文档文件路径，或已打开的二进制文件对象
+            metadata: 文档元数据
+            filename: 原始文件名
+            
+        Returns:
+            处理结果字典
+        """
+        return await asyncio.to_thread(self.upload_and_process_document, file_path, metadata, filename)
+    
     def search_multimodal(self, query, modalities=None, filters=None):
         """
         执行多模态搜索
@@ -232,7 +552,7 @@ class DataIntegrationAPI:
         Returns:
             搜索结果
         """
-        return self.retrieval_engine.search(
+        return self.searcher.search(
             query=query,
             modalities=modalities,
             filters=filters
@@ -275,6 +595,7 @@ class DataIntegrationAPI:
     def start_batch_upload(self, file_paths, metadata_list=None, priority='medium'):
         """
         启动批量上传任务
+        每个文件作为独立的future提交到进程池并行处理
         
         Args:
             file_paths: 文件路径列表
@@ -283,20 +604,140 @@ class DataIntegrationAPI:
             
         Returns:
             任务ID和状态
+            
+        Raises:
+            ValueError: 元数据列表与文件路径列表长度不一致
         """
-        task = self.batch_manager.add_task(
-            file_paths=file_paths,
-            metadata_list=metadata_list,
-            priority=priority
-        )
+        if metadata_list is None:
+            metadata_list = [None] * len(file_paths)
+        elif len(metadata_list) != len(file_paths):
+            raise ValueError(f"元数据列表长度({len(metadata_list)})与文件数量({len(file_paths)})不一致")
         
-        return {
-            'task_id': task.task_id,
-            'status': task.status,
+        now = datetime.now().isoformat()
+        task = {
+            'task_id': str(uuid.uuid4()),
+            'status': 'processing' if file_paths else 'completed',
+            'priority': priority,
+            'progress': 0.0 if file_paths else 100.0,
             'total_files': len(file_paths),
-            'created_at': task.created_at
+            'completed_files': 0,
+            'failed_files': 0,
+            'results': [None] * len(file_paths),
+            'created_at': now,
+            'updated_at': now
+        }
+        with self._batch_lock:
+            self._batch_tasks[task['task_id']] = task
+            if not file_paths:
+                self._finish_batch_task(task)
+        
+        # 只向子进程传递文件路径、元数据和配置，处理器在子进程内构建
+        for index, (file_path, metadata) in enumerate(zip(file_paths, metadata_list)):
+            future = _batch_executor.submit(_process_batch_file, self.config, file_path, metadata)
+            future.add_done_callback(
+                lambda fut, index=index: self._on_batch_file_done(task, index, fut)
+            )
+        
+        return {
+            'task_id': task['task_id'],
+            'status': task['status'],
+            'total_files': task['total_files'],
+            'created_at': task['created_at']
         }
     
+    def _on_batch_file_done(self, task, index, future):
+        """
+        批量任务中单个文件处理完成后的回调，更新任务进度
+        
+        Args:
+            task: 批量任务记录
+            index: 文件在批次中的位置
+            future: 已完成的future
+        """
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {'success': False, 'error': str(e), 'step': 'executor'}
+        
+        with self._batch_lock:
+            task['results'][index] = result
+            if result.get('success'):
+                task['completed_files'] += 1
+            else:
+                task['failed_files'] += 1
+            
+            finished = task['completed_files'] + task['failed_files']
+            task['progress'] = finished * 100.0 / task['total_files']
+            if finished == task['total_files']:
+                task['status'] = 'completed' if task['failed_files'] == 0 else 'failed'
+                self._finish_batch_task(task)
+            task['updated_at'] = datetime.now().isoformat()
+    
+    def _finish_batch_task(self, task):
+        """
+        记录已结束的批量任务，超出保留数量时删除最早结束的任务（调用方需持有self._batch_lock）
+        
+        Args:
+            task: 批量任务记录
+        """
+        self._finished_batch_tasks.append(task['task_id'])
+        while len(self._finished_batch_tasks) > self.MAX_FINISHED_BATCH_TASKS:
+            self._batch_tasks.pop(self._finished_batch_tasks.popleft(), None)
+    
+    def get_storage_stats(self):
+        """
+        获取图像和文档存储的统计信息
+        统计需要遍历存储目录，由后台线程按storage.stats_refresh_interval（默认10秒）定期刷新，
+        这里只返回最近一次的快照；首次调用时同步计算并启动刷新线程
+        
+        Returns:
+            包含images和documents统计信息的字典
+        """
+        with self._stats_lock:
+            if self._storage_stats is None:
+                self._storage_stats = self._compute_storage_stats()
+            # 线程在首次使用时才启动，不会在gunicorn预加载后被fork丢失
+            if self._stats_thread is None:
+                self._stats_thread = threading.Thread(target=self._refresh_storage_stats, daemon=True)
+                self._stats_thread.start()
+            return self._storage_stats
+    
+    def get_batch_task_counts(self):
+        """
+        统计批量任务数量（只计数，不构建任务状态字典）
+        
+        Returns:
+            {'active': 处理中的任务数, 'queued': 处理中任务里尚未完成的文件数}
+        """
+        active = queued = 0
+        with self._batch_lock:
+            for task in self._batch_tasks.values():
+                if task['status'] == 'processing':
+                    active += 1
+                    queued += task['total_files'] - task['completed_files'] - task['failed_files']
+        return {'active': active, 'queued': queued}
+    
+    def _compute_storage_stats(self):
+        """遍历存储目录计算统计信息"""
+        return {
+            'images': self.image_storage.get_storage_statistics(),
+            'documents': self.document_storage.get_storage_statistics(),
+            'computed_at': datetime.now().isoformat()
+        }
+    
+    def _refresh_storage_stats(self):
+        """后台刷新存储统计快照"""
+        interval = (self._section_config('storage') or {}).get('stats_refresh_interval', 10)
+        while True:
+            time.sleep(interval)
+            try:
+                stats = self._compute_storage_stats()
+            except Exception as e:
+                logger.warning(f"刷新存储统计失败: {e}")
+                continue
+            with self._stats_lock:
+                self._storage_stats = stats
+    
     def get_batch_task_status(self, task_id):
         """
         获取批量任务状态
@@ -307,24 +748,40 @@ class DataIntegrationAPI:
         Returns:
             任务状态信息
         """
-        task = self.batch_manager.get_task(task_id)
-        if not task:
-            return {'success': False, 'error': '任务不存在'}
-        
-        return {
-            'success': True,
-            'task_id': task.task_id,
-            'status': task.status,
-            'progress': task.progress,
-            'total_files': task.total_files,
-            'completed_files': task.completed_files,
-            'failed_files': task.failed_files,
-            'created_at': task.created_at,
-            'updated_at': task.updated_at
-        }
+        with self._batch_lock:
+            task = self._batch_tasks.get(task_id)
+            if not task:
+                return {'success': False, 'error': '任务不存在'}
+            
+            return {
+                'success': True,
+                'task_id': task['task_id'],
+                'status': task['status'],
+                'progress': task['progress'],
+                'total_files': task['total_files'],
+                'completed_files': task['completed_files'],
+                'failed_files': task['failed_files'],
+                'created_at': task['created_at'],
+                'updated_at': task['updated_at']
+            }
+
+# 批量上传进程池（图像预处理受GIL限制，使用进程而非线程）
+# 使用spawn启动子进程：fork会继承父进程的_default_api及其中的数据库连接、文件句柄、锁和线程
+_batch_executor = ProcessPoolExecutor(max_workers=os.cpu_count(), mp_context=get_context('spawn'))
+
+def _process_batch_file(config, file_path, metadata):
+    """
+    在子进程中处理单个批量上传文件
+    每个子进程通过get_api构建并复用自己的API实例
+    """
+    # 路径检查在后台执行，避免大批量请求在HTTP请求内逐个stat
+    if not os.path.exists(file_path):
+        return {'success': False, 'error': f'文件不存在: {file_path}', 'step': 'validation'}
+    return get_api(config).upload_and_process_image(file_path, metadata)
 
 # 创建默认API实例
 _default_api = None
+_api_lock = threading.Lock()
 
 def get_api(config=None):
     """
@@ -337,8 +794,11 @@ def get_api(config=None):
         DataIntegrationAPI实例
     """
     global _default_api
+    # 双重检查：已创建时不加锁，首次并发请求只会创建一个实例
     if _default_api is None:
-        _default_api = DataIntegrationAPI(config)
+        with _api_lock:
+            if _default_api is None:
+                _default_api = DataIntegrationAPI(config)
     return _default_api
 
 # 模块级别的便捷函数
@@ -6,13 +6,99 @@
 import os
 import json
 import logging
-from typing import Dict, Optional, Any
-from pathlib import Path
+import re
+import stat
+import threading
+from types import MappingProxyType
+from typing import Dict, Optional, Any, Tuple, Mapping
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，缺失时使用标准库json
+    orjson = None
+
+try:
+    import jsonschema
+except ImportError:  # jsonschema为可选依赖，缺失时使用内置检查
+    jsonschema = None
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+if orjson is not None:
+    _loads = orjson.loads
+    
+    def _dumps(obj) -> str:
+        """序列化为带缩进的JSON字符串"""
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS).decode('utf-8')
+else:
+    _loads = json.loads
+    
+    def _dumps(obj) -> str:
+        """序列化为带缩进的JSON字符串"""
+        return json.dumps(obj, ensure_ascii=False, indent=2)
+
+def _freeze(config: Dict) -> Mapping:
+    """
+    递归地将配置字典包装为只读视图
+    
+    Args:
+        config: 配置字典
+        
+    Returns:
+        只读的MappingProxyType
+    """
+    return MappingProxyType({
+        key: _freeze(value) if isinstance(value, dict) else value
+        for key, value in config.items()
+    })
+
+def _thaw(config: Mapping) -> Dict:
+    """
+    递归地把只读配置视图复制为普通字典（可修改、可pickle和JSON序列化）
+    
+    Args:
+        config: 只读配置视图
+        
+    Returns:
+        配置字典副本
+    """
+    return {
+        key: _thaw(value) if isinstance(value, Mapping) else value
+        for key, value in config.items()
+    }
+
+def _flatten(config: Mapping, prefix: str = ''):
+    """
+    遍历配置树，生成 (点表示法键, 叶子值) 对
+    
+    Args:
+        config: 配置字典
+        prefix: 键前缀
+    """
+    for key, value in config.items():
+        if isinstance(value, Mapping):
+            yield from _flatten(value, f"{prefix}{key}.")
+        else:
+            yield f"{prefix}{key}", value
+
+# 日志级别名称到数值的映射
+_LEVEL_MAP = {
+    'DEBUG': logging.DEBUG,
+    'INFO': logging.INFO,
+    'WARNING': logging.WARNING,
+    'ERROR': logging.ERROR,
+    'CRITICAL': logging.CRITICAL
+}
+
+# get缓存中表示配置键不存在的标记
+_MISSING = object()
+
+# 环境变量中的数值格式，先匹配再转换，字符串值不必经过异常处理
+_INT_RE = re.compile(r'[-+]?\d+')
+_FLOAT_RE = re.compile(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?')
+
 
 class ConfigManager:
     """
@@ -20,6 +106,9 @@ class ConfigManager:
     负责加载、验证和提供配置参数
     """
     
+    # 实例属性固定，使用__slots__省去实例字典
+    __slots__ = ('environment', 'config', '_raw', '_flat', '_get_cache', '_ensured_dirs')
+    
     # 默认配置
     DEFAULT_CONFIG = {
         # 基础配置
@@ -30,8 +119,8 @@ class ConfigManager:
         
         # 存储配置
         'storage': {
-            'storage_base_path': os.path.join(str(Path.home()), 'medical_data'),
-            'index_path': os.path.join(str(Path.home()), 'medical_indexes'),
+            'storage_base_path': '~/medical_data',
+            'index_path': '~/medical_indexes',
             'temp_path': '/tmp/medical_imaging',
             'image_storage': {
                 'max_file_size_mb': 1000,  # 1GB
@@ -100,7 +189,10 @@ class ConfigManager:
             'secret_key': 'dev_key_change_in_production',
             'max_content_length_mb': 100,
             'temp_dir': '/tmp/medical_flask',
-            'allowed_origins': ['*']
+            'allowed_origins': ['*'],
+            # 部署在支持X-Sendfile/X-Accel-Redirect的反向代理之后时开启，
+            # send_file只返回响应头，文件内容由代理直接从磁盘发送
+            'use_x_sendfile': False
         },
         
         # 医疗系统集成配置
@@ -144,6 +236,31 @@ class ConfigManager:
         'secret_key': 'MEDICAL_SECRET_KEY'
     }
     
+    # 各环境的覆盖配置，按_merge_config合并到当前配置
+    _ENV_OVERLAYS = {
+        'production': {
+            'debug': False,
+            # 调整并发设置
+            'upload': {
+                'max_concurrent_uploads': 10,
+                'batch_processing': {'thread_pool_size': 8}
+            }
+        },
+        'testing': {
+            'debug': True,
+            'log_level': 'DEBUG',
+            # 使用测试专用目录
+            'storage': {
+                'storage_base_path': '/tmp/medical_test_storage',
+                'index_path': '/tmp/medical_test_indexes'
+            }
+        }
+    }
+    
+    # 预先拆分的配置路径 ((路径各级键), 环境变量名)
+    _ENV_PATHS = tuple((tuple(config_key.split('.')), env_key)
+                       for config_key, env_key in ENV_VAR_MAPPINGS.items())
+    
     def __init__(self, config_file: Optional[str] = None, environment: str = 'development'):
         """
         初始化配置管理器
@@ -153,7 +270,13 @@ class ConfigManager:
             environment: 环境名称 ('development', 'testing', 'production')
         """
         self.environment = environment
-        self.config = self.DEFAULT_CONFIG.copy()
+        # 已确认存在的目录，避免重复创建
+        self._ensured_dirs = set()
+        # get的点表示法查询结果缓存，配置修改时清空
+        self._get_cache: Dict[str, Any] = {}
+        # 从序列化快照深拷贝默认配置，避免修改嵌套字典时影响DEFAULT_CONFIG和其他实例
+        # 初始化期间self.config为可修改的字典，完成后替换为只读视图
+        self.config = _loads(_DEFAULT_CONFIG_JSON)
         
         # 从配置文件加载
         if config_file:
@@ -162,14 +285,22 @@ class ConfigManager:
         # 从环境变量加载
         self._load_from_env()
         
+        # 展开路径中的~和环境变量（在实例化时解析，HOME变化后新实例使用新路径）
+        self._resolve_paths()
+        
         # 根据环境调整配置
         self._adjust_for_environment()
         
         # 验证配置
         self._validate_config()
         
-        # 创建必要的目录
-        self._ensure_directories()
+        # 目录在首次获取对应配置时才创建
+        
+        # 冻结配置：可修改的原始字典保存在_raw，对外只暴露只读视图，可直接共享无需拷贝
+        self._raw = self.config
+        self.config = _freeze(self._raw)
+        # 叶子配置的扁平查找表，get直接按完整键查找
+        self._flat = dict(_flatten(self.config))
         
         logger.info(f"配置管理器初始化完成，环境: {environment}")
     
@@ -181,15 +312,29 @@ class ConfigManager:
             config_file: 配置文件路径
         """
         try:
-            if not os.path.exists(config_file):
+            try:
+                fd = os.open(config_file, os.O_RDONLY)
+            except FileNotFoundError:
                 logger.warning(f"配置文件不存在: {config_file}，使用默认配置")
                 return
             
-            with open(config_file, 'r', encoding='utf-8') as f:
-                file_config = json.load(f)
+            # 按文件大小一次读入字节，直接交给JSON解析（UTF-8字节无需先解码）
+            try:
+                remaining = os.fstat(fd).st_size
+                chunks = []
+                while True:
+                    chunk = os.read(fd, max(remaining, 1))
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                    remaining -= len(chunk)
+            finally:
+                os.close(fd)
+            file_config = _loads(b''.join(chunks))
             
             # 合并配置
             self._merge_config(self.config, file_config)
+            self._get_cache.clear()
             logger.info(f"从文件加载配置: {config_file}")
             
         except json.JSONDecodeError as e:
@@ -203,22 +348,39 @@ class ConfigManager:
         """
         从环境变量加载配置
         """
-        for config_key, env_key in self.ENV_VAR_MAPPINGS.items():
+        for path, env_key in self._ENV_PATHS:
             env_value = os.environ.get(env_key)
-            if env_value is not None:
-                # 根据配置键的嵌套结构设置值
-                if '.' in config_key:
-                    parts = config_key.split('.')
-                    target = self.config
-                    for part in parts[:-1]:
-                        if part not in target:
-                            target[part] = {}
-                        target = target[part]
-                    target[parts[-1]] = self._parse_env_value(env_value)
-                else:
-                    self.config[config_key] = self._parse_env_value(env_value)
-                
-                logger.info(f"从环境变量加载配置: {env_key} -> {config_key}")
+            if env_value is None:
+                continue
+            
+            # 根据配置键的嵌套结构设置值
+            target = self.config
+            for part in path[:-1]:
+                if part not in target:
+                    target[part] = {}
+                target = target[part]
+            target[path[-1]] = self._parse_env_value(env_value)
+            
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("从环境变量加载配置: %s -> %s", env_key, '.'.join(path))
+        
+        self._get_cache.clear()
+    
+    def _resolve_paths(self):
+        """
+        展开路径配置中的~和环境变量（如'~/medical_data'、'$DATA_ROOT/indexes'）
+        只处理以_path或_dir结尾的配置项，避免误改密钥等其他字符串
+        """
+        stack = [self.config]
+        while stack:
+            config = stack.pop()
+            for key, value in config.items():
+                if isinstance(value, dict):
+                    stack.append(value)
+                elif isinstance(value, str) and key.endswith(('_path', '_dir')):
+                    config[key] = os.path.expanduser(os.path.expandvars(value))
+        
+        self._get_cache.clear()
     
     def _parse_env_value(self, value: str):
         """
@@ -231,20 +393,15 @@ class ConfigManager:
             解析后的值
         """
         # 尝试解析为布尔值
-        if value.lower() in ('true', 'false'):
-            return value.lower() == 'true'
+        lowered = value.lower()
+        if lowered in ('true', 'false'):
+            return lowered == 'true'
         
-        # 尝试解析为整数
-        try:
+        # 尝试解析为整数或浮点数
+        if _INT_RE.fullmatch(value):
             return int(value)
-        except ValueError:
-            pass
-        
-        # 尝试解析为浮点数
-        try:
+        if _FLOAT_RE.fullmatch(value):
             return float(value)
-        except ValueError:
-            pass
         
         # 尝试解析为列表（逗号分隔）
         if ',' in value:
@@ -257,9 +414,13 @@ class ConfigManager:
         """
         根据环境调整配置
         """
+        # 应用环境覆盖配置
+        overlay = self._ENV_OVERLAYS.get(self.environment)
+        if overlay:
+            self._merge_config(self.config, overlay)
+        
         if self.environment == 'production':
-            # 生产环境配置调整
-            self.config['debug'] = False
+            # 生产环境不输出DEBUG日志
             if self.config['log_level'] == 'DEBUG':
                 self.config['log_level'] = 'INFO'
             
@@ -267,27 +428,25 @@ class ConfigManager:
             if self.config['flask']['secret_key'] == 'dev_key_change_in_production':
                 logger.warning("生产环境使用默认密钥，强烈建议更改!")
             
-            # 调整并发设置
-            self.config['upload']['max_concurrent_uploads'] = 10
-            self.config['upload']['batch_processing']['thread_pool_size'] = 8
-            
-        elif self.environment == 'testing':
-            # 测试环境配置调整
-            self.config['debug'] = True
-            self.config['log_level'] = 'DEBUG'
-            
-            # 使用测试专用目录
-            self.config['storage']['storage_base_path'] = '/tmp/medical_test_storage'
-            self.config['storage']['index_path'] = '/tmp/medical_test_indexes'
-            
         # 设置日志级别
-        numeric_level = getattr(logging, self.config['log_level'].upper(), logging.INFO)
+        numeric_level = _LEVEL_MAP.get(self.config['log_level'].upper(), logging.INFO)
         logging.getLogger().setLevel(numeric_level)
+        
+        self._get_cache.clear()
     
     def _validate_config(self):
         """
         验证配置的有效性
         """
+        if _CONFIG_VALIDATOR is not None:
+            error = jsonschema.exceptions.best_match(_CONFIG_VALIDATOR.iter_errors(self.config))
+            if error is not None:
+                location = '.'.join(str(p) for p in error.absolute_path) or '<root>'
+                logger.error(f"配置验证失败: {location}: {error.message}")
+                raise ValueError(f"配置错误: {location}: {error.message}")
+            logger.debug("配置验证通过")
+            return
+        
         try:
             # 验证存储配置
             storage_config = self.config['storage']
@@ -313,7 +472,7 @@ class ConfigManager:
                 logger.error("最大并发上传数必须大于0")
                 raise ValueError("配置错误: 最大并发上传数无效")
             
-            logger.info("配置验证通过")
+            logger.debug("配置验证通过")
             
         except Exception as e:
             logger.error(f"配置验证失败: {e}")
@@ -323,38 +482,67 @@ class ConfigManager:
         """
         确保必要的目录存在
         """
+        self._ensure_storage_directories()
+        self._ensure_dir(self.config['upload']['temp_upload_path'])
+        logger.debug("配置目录已就绪，共 %d 个", len(self._ensured_dirs))
+    
+    def _ensure_storage_directories(self):
+        """
+        确保存储相关目录存在
+        """
         storage_config = self.config['storage']
-        directories = [
+        for directory in (
             storage_config['storage_base_path'],
             os.path.join(storage_config['storage_base_path'], 'images'),
             os.path.join(storage_config['storage_base_path'], 'documents'),
             storage_config['index_path'],
-            storage_config['temp_path'],
-            self.config['upload']['temp_upload_path']
-        ]
+            storage_config['temp_path']
+        ):
+            self._ensure_dir(directory)
+    
+    def _ensure_dir(self, directory: str):
+        """
+        确保目录存在，每个目录只创建一次
         
-        for directory in directories:
-            try:
-                os.makedirs(directory, exist_ok=True)
-                logger.info(f"确保目录存在: {directory}")
-            except Exception as e:
-                logger.error(f"创建目录失败 {directory}: {e}")
-                raise
+        Args:
+            directory: 目录路径
+        """
+        if directory in self._ensured_dirs:
+            return
+        # 常见情况是目录已存在，一次stat即可确认，无需makedirs逐级检查
+        try:
+            if stat.S_ISDIR(os.stat(directory).st_mode):
+                self._ensured_dirs.add(directory)
+                return
+        except FileNotFoundError:
+            pass
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except Exception as e:
+            logger.error(f"创建目录失败 {directory}: {e}")
+            raise
+        self._ensured_dirs.add(directory)
     
     def _merge_config(self, base: Dict, update: Dict):
         """
-        递归合并配置字典
+        合并配置字典（使用显式栈逐层合并嵌套字典）
         
         Args:
             base: 基础配置
             update: 要合并的配置
         """
-        for key, value in update.items():
-            if key in base and isinstance(base[key], dict) and isinstance(value, dict):
-                # 递归合并嵌套字典
-                self._merge_config(base[key], value)
-            else:
-                base[key] = value
+        stack = [(base, update)]
+        while stack:
+            base, update = stack.pop()
+            # 空字典或同一对象无需合并
+            if not update or update is base:
+                continue
+            for key, value in update.items():
+                base_value = base.get(key)
+                if isinstance(base_value, dict) and isinstance(value, dict):
+                    stack.append((base_value, value))
+                else:
+                    base[key] = value
     
     def get(self, key: str, default: Any = None) -> Any:
         """
@@ -367,15 +555,25 @@ class ConfigManager:
         Returns:
             配置值或默认值
         """
-        keys = key.split('.')
-        value = self.config
-        
-        try:
-            for k in keys:
-                value = value[k]
+        value = self._flat.get(key, _MISSING)
+        if value is not _MISSING:
             return value
-        except (KeyError, TypeError):
+        
+        # 非叶子键（如'storage.image_storage'）按路径查找并缓存
+        value = self._get_cache.get(key, _MISSING)
+        if value is _MISSING and key not in self._get_cache:
+            value = self.config
+            try:
+                for k in key.split('.'):
+                    value = value[k]
+            except (KeyError, TypeError):
+                value = _MISSING
+            self._get_cache[key] = value
+        
+        if value is _MISSING:
             return default
+        # 只读视图只在内部使用，非叶子键返回普通字典副本
+        return _thaw(value) if isinstance(value, Mapping) else value
     
     def set(self, key: str, value: Any):
         """
@@ -386,7 +584,7 @@ class ConfigManager:
             value: 配置值
         """
         keys = key.split('.')
-        config = self.config
+        config = self._raw
         
         # 导航到目标位置
         for k in keys[:-1]:
@@ -398,43 +596,49 @@ class ConfigManager:
         
         # 设置值
         config[keys[-1]] = value
-        logger.info(f"更新配置: {key} = {value}")
+        # 重建只读视图（写入很少发生）
+        self.config = _freeze(self._raw)
+        self._flat = dict(_flatten(self.config))
+        self._get_cache.clear()
+        logger.debug("更新配置: %s = %r", key, value)
     
     def get_storage_config(self) -> Dict:
         """
         获取存储配置
         
         Returns:
-            存储配置字典
+            存储配置字典（副本，修改不影响配置管理器）
         """
-        return self.config['storage'].copy()
+        self._ensure_storage_directories()
+        return _thaw(self.config['storage'])
     
     def get_upload_config(self) -> Dict:
         """
         获取上传配置
         
         Returns:
-            上传配置字典
+            上传配置字典（副本，修改不影响配置管理器）
         """
-        return self.config['upload'].copy()
+        self._ensure_dir(self.config['upload']['temp_upload_path'])
+        return _thaw(self.config['upload'])
     
     def get_preprocessing_config(self) -> Dict:
         """
         获取预处理配置
         
         Returns:
-            预处理配置字典
+            预处理配置字典（副本，修改不影响配置管理器）
         """
-        return self.config['preprocessing'].copy()
+        return _thaw(self.config['preprocessing'])
     
     def get_flask_config(self) -> Dict:
         """
         获取Flask集成配置
         
         Returns:
-            Flask配置字典
+            Flask配置字典（副本，修改不影响配置管理器）
         """
-        return self.config['flask'].copy()
+        return _thaw(self.config['flask'])
     
     def get_medical_system_config(self, system_type: str) -> Optional[Dict]:
         """
@@ -457,7 +661,7 @@ class ConfigManager:
         """
         try:
             with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(self.config, f, ensure_ascii=False, indent=2)
+                f.write(_dumps(self._raw))
             logger.info(f"配置已导出到: {file_path}")
         except Exception as e:
             logger.error(f"导出配置失败: {e}")
@@ -503,12 +707,53 @@ class ConfigManager:
         return self.__str__()
 
 
-# 全局配置实例
-_config_manager = None
+# 配置结构约束
+_POSITIVE_SIZE = {'type': 'number', 'exclusiveMinimum': 0}
+_CONFIG_SCHEMA = {
+    'type': 'object',
+    'required': ['storage', 'upload'],
+    'properties': {
+        'storage': {
+            'type': 'object',
+            'required': ['storage_base_path', 'index_path', 'temp_path'],
+            'properties': {
+                'storage_base_path': {'type': 'string'},
+                'index_path': {'type': 'string'},
+                'temp_path': {'type': 'string'},
+                'image_storage': {
+                    'type': 'object',
+                    'properties': {'max_file_size_mb': _POSITIVE_SIZE}
+                },
+                'document_storage': {
+                    'type': 'object',
+                    'properties': {'max_file_size_mb': _POSITIVE_SIZE}
+                }
+            }
+        },
+        'upload': {
+            'type': 'object',
+            'required': ['max_concurrent_uploads'],
+            'properties': {
+                'max_concurrent_uploads': {'type': 'integer', 'exclusiveMinimum': 0}
+            }
+        }
+    }
+}
+
+# 编译后的校验器，所有实例共用
+_CONFIG_VALIDATOR = jsonschema.Draft7Validator(_CONFIG_SCHEMA) if jsonschema is not None else None
+
+# 默认配置的JSON快照（导入时序列化一次，每个实例反序列化得到独立的深拷贝）
+_DEFAULT_CONFIG_JSON = json.dumps(ConfigManager.DEFAULT_CONFIG)
+
+
+# 配置实例缓存，键为 (配置文件, 环境, 配置文件修改时间)
+_config_cache: Dict[Tuple[Optional[str], str, int], ConfigManager] = {}
+_config_lock = threading.Lock()
 
 def get_config(environment: str = 'development') -> ConfigManager:
     """
-    获取全局配置管理器实例（单例模式）
+    获取全局配置管理器实例（每个环境一个实例）
     
     Args:
         environment: 环境名称
@@ -516,14 +761,20 @@ def get_config(environment: str = 'development') -> ConfigManager:
     Returns:
         ConfigManager实例
     """
-    global _config_manager
-    if _config_manager is None:
-        _config_manager = ConfigManager(environment=environment)
-    return _config_manager
+    key = (None, environment, 0)
+    config = _config_cache.get(key)
+    # 双重检查：并发的首次调用只会创建一个实例
+    if config is None:
+        with _config_lock:
+            config = _config_cache.get(key)
+            if config is None:
+                config = _config_cache[key] = ConfigManager(environment=environment)
+    return config
 
 def load_config_from_file(config_file: str, environment: str = 'development') -> ConfigManager:
     """
     从文件加载配置
+    文件未修改时复用已解析的实例，加载的配置同时作为该环境的全局配置
     
     Args:
         config_file: 配置文件路径
@@ -532,9 +783,22 @@ def load_config_from_file(config_file: str, environment: str = 'development') ->
     Returns:
         ConfigManager实例
     """
-    global _config_manager
-    _config_manager = ConfigManager(config_file=config_file, environment=environment)
-    return _config_manager
+    try:
+        mtime = os.stat(config_file).st_mtime_ns
+    except FileNotFoundError:
+        mtime = 0
+    
+    key = (config_file, environment, mtime)
+    with _config_lock:
+        config = _config_cache.get(key)
+        if config is None:
+            # 丢弃同一文件修改前的缓存
+            for stale_key in [k for k in _config_cache if k[:2] == key[:2]]:
+                del _config_cache[stale_key]
+            config = _config_cache[key] = ConfigManager(config_file=config_file, environment=environment)
+        
+        _config_cache[(None, environment, 0)] = config
+    return config
 
 def create_default_config_file(file_path: str):
     """
@@ -545,7 +809,7 @@ def create_default_config_file(file_path: str):
     """
     try:
         with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(ConfigManager.DEFAULT_CONFIG, f, ensure_ascii=False, indent=2)
+            f.write(_dumps(ConfigManager.DEFAULT_CONFIG))
         logger.info(f"默认配置文件已创建: {file_path}")
     except Exception as e:
         logger.error(f"创建默认配置文件失败: {e}")
@@ -587,6 +851,7 @@ def get_flask_app_config(environment: str = 'development') -> Dict:
         'SECRET_KEY': flask_config['secret_key'],
         'MAX_CONTENT_LENGTH': flask_config['max_content_length_mb'] * 1024 * 1024,
         'TEMP_DIR': flask_config['temp_dir'],
+        'USE_X_SENDFILE': flask_config.get('use_x_sendfile', False),
         'DEBUG': config.is_development()
     }
 
@@ -606,15 +871,17 @@ def main():
     
     args = parser.parse_args()
     
+    # 创建配置文件只需写出DEFAULT_CONFIG，不构造ConfigManager
     if args.create_config:
         create_default_config_file(args.create_config)
         print(f"默认配置文件已创建: {args.create_config}")
-    else:
-        # 显示当前配置
-        config = get_config(args.environment)
-        print(f"当前环境: {args.environment}")
-        print(f"调试模式: {config.is_development()}")
-        print(f"存储路径: {config.get('storage.storage_base_path')}")
+        return
+    
+    # 显示当前配置
+    config = get_config(args.environment)
+    print(f"当前环境: {args.environment}")
+    print(f"调试模式: {config.is_development()}")
+    print(f"存储路径: {config.get('storage.storage_base_path')}")
 
 
 if __name__ == '__main__':
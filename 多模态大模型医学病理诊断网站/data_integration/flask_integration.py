@@ -3,14 +3,30 @@ Flask集成模块
 
 该模块提供将数据集成底座功能集成到Flask应用的工具和接口，包括API蓝图、路由和请求处理函数。
 """
+import asyncio
+import hashlib
 import os
 import json
 import logging
+import threading
+import time
+from collections import OrderedDict
 from flask import Blueprint, request, jsonify, current_app, send_file
-from flask_restful import Api, Resource, reqparse
+from flask.json.provider import DefaultJSONProvider
+from flask_restful import Api, Resource
 from werkzeug.utils import secure_filename
 from werkzeug.exceptions import BadRequest, InternalServerError, NotFound
 
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，缺失时使用标准库json
+    orjson = None
+
+try:
+    import redis
+except ImportError:  # redis为可选依赖，缺失时响应缓存只保存在进程内
+    redis = None
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,46 +35,238 @@ logger = logging.getLogger(__name__)
 from . import DataIntegrationAPI, get_api
 from .uploaders import BatchUploadTask
 
+def json_loads(data):
+    """解析JSON字符串（优先使用orjson，解析失败同样抛出json.JSONDecodeError）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    基于orjson的Flask JSON提供器
+    jsonify直接输出orjson生成的字节，numpy数组无需预先转换为列表
+    """
+    # 与DefaultJSONProvider一致，支持非字符串键；numpy数组和标量原样序列化
+    option = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson is not None else 0
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        data = orjson.dumps(obj, default=self.default, option=self.option)
+        return self._app.response_class(data, mimetype=self.mimetype)
+
+
+def dump_json_bytes(obj):
+    """使用应用的JSON提供器把对象序列化为UTF-8字节"""
+    provider = current_app.json
+    if isinstance(provider, OrjsonProvider):
+        return orjson.dumps(obj, default=provider.default, option=provider.option)
+    return provider.dumps(obj).encode('utf-8')
+
+
+class ResponseCache:
+    """
+    已序列化JSON响应的缓存
+    配置了Redis地址且安装redis时存入Redis（多个worker共享，淘汰策略由Redis的maxmemory-policy决定），
+    否则使用进程内的TTL + LRU缓存
+    """
+    
+    def __init__(self, redis_url=None, max_entries=1024, key_prefix='data_integration:response:'):
+        """
+        初始化响应缓存
+        
+        Args:
+            redis_url: Redis连接地址
+            max_entries: 进程内缓存的最大条目数
+            key_prefix: Redis键前缀
+        """
+        self.key_prefix = key_prefix
+        self.max_entries = max_entries
+        self._redis = redis.Redis.from_url(redis_url) if redis_url and redis is not None else None
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(*parts):
+        """由请求参数生成缓存键"""
+        raw = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+    
+    def get(self, key):
+        """
+        读取缓存的响应字节
+        
+        Returns:
+            响应字节，未命中或已过期时返回None
+        """
+        if self._redis is not None:
+            try:
+                return self._redis.get(self.key_prefix + key)
+            except Exception as e:
+                logger.warning(f"读取Redis缓存失败: {e}")
+                return None
+        
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return data
+    
+    def set(self, key, data, ttl):
+        """
+        写入响应字节
+        
+        Args:
+            key: 缓存键
+            data: 已序列化的响应字节
+            ttl: 过期时间（秒）
+        """
+        if self._redis is not None:
+            try:
+                self._redis.set(self.key_prefix + key, data, ex=ttl)
+            except Exception as e:
+                logger.warning(f"写入Redis缓存失败: {e}")
+            return
+        
+        with self._lock:
+            self._local[key] = (time.monotonic() + ttl, data)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+
+def cached_json_response(cache_key, ttl_key, default_ttl, compute):
+    """
+    返回缓存的JSON响应，未命中时计算结果并缓存序列化后的字节
+    
+    Args:
+        cache_key: 缓存键
+        ttl_key: 应用配置中的过期时间键
+        default_ttl: 默认过期时间（秒）
+        compute: 生成结果的无参函数
+        
+    Returns:
+        JSON响应对象
+    """
+    cache = current_app.extensions.get('data_integration_cache')
+    data = cache.get(cache_key) if cache is not None else None
+    
+    if data is None:
+        data = dump_json_bytes(compute())
+        if cache is not None:
+            cache.set(cache_key, data, current_app.config.get(ttl_key, default_ttl))
+    
+    # 直接返回已序列化的字节，命中时不再重复序列化
+    return current_app.response_class(data, status=200, mimetype='application/json')
+
+
+# 实体ID到文件路径的解析缓存，只缓存磁盘上存在的路径
+PATH_CACHE_SIZE = 4096
+_path_cache = OrderedDict()
+_path_cache_lock = threading.Lock()
+
+
+def resolve_cached_path(entity_type, entity_id, resolver):
+    """
+    解析实体对应的文件路径，命中缓存时不再调用存储层查找
+    
+    Args:
+        entity_type: 实体类型（'image'或'document'）
+        entity_id: 实体ID
+        resolver: 缓存未命中时调用的路径查找函数
+        
+    Returns:
+        存在的文件路径，找不到时返回None
+    """
+    key = (entity_type, entity_id)
+    with _path_cache_lock:
+        path = _path_cache.get(key)
+        if path is not None:
+            _path_cache.move_to_end(key)
+    
+    # 文件被删除后缓存条目随之失效
+    if path is not None and os.path.exists(path):
+        return path
+    
+    path = resolver(entity_id)
+    with _path_cache_lock:
+        if path and os.path.exists(path):
+            _path_cache[key] = path
+            while len(_path_cache) > PATH_CACHE_SIZE:
+                _path_cache.popitem(last=False)
+            return path
+        _path_cache.pop(key, None)
+    return None
+
+
 # 创建Flask蓝图
 data_integration_bp = Blueprint('data_integration', __name__, url_prefix='/api/data')
 data_api = Api(data_integration_bp)
 
-# API请求解析器
-image_upload_parser = reqparse.RequestParser()
-image_upload_parser.add_argument('metadata', type=str, location='form', help='图像元数据（JSON字符串）')
-image_upload_parser.add_argument('patient_id', type=str, location='form', help='患者ID')
-image_upload_parser.add_argument('study_id', type=str, location='form', help='研究ID')
-image_upload_parser.add_argument('image_type', type=str, location='form', help='图像类型')
 
-# 文档上传解析器
-document_upload_parser = reqparse.RequestParser()
-document_upload_parser.add_argument('metadata', type=str, location='form', help='文档元数据（JSON字符串）')
-document_upload_parser.add_argument('patient_id', type=str, location='form', help='患者ID')
-document_upload_parser.add_argument('document_type', type=str, location='form', help='文档类型')
+def _ensure_sync(meth):
+    """flask-restful直接调用资源方法而不经过Flask的ensure_sync，这里补上以支持async方法"""
+    return current_app.ensure_sync(meth)
 
-# 搜索解析器
-search_parser = reqparse.RequestParser()
-search_parser.add_argument('query', type=str, required=True, help='搜索查询')
-search_parser.add_argument('modalities', type=str, help='模态列表（逗号分隔）')
-search_parser.add_argument('filters', type=str, help='过滤条件（JSON字符串）')
-search_parser.add_argument('limit', type=int, default=50, help='结果数量限制')
 
-# 批量上传解析器
-batch_upload_parser = reqparse.RequestParser()
-batch_upload_parser.add_argument('file_paths', type=str, required=True, help='文件路径列表（JSON字符串）')
-batch_upload_parser.add_argument('metadata_list', type=str, help='元数据列表（JSON字符串）')
-batch_upload_parser.add_argument('priority', type=str, default='medium', help='任务优先级')
+class AsyncResource(Resource):
+    """
+    支持async def处理方法的资源基类
+    耗时的磁盘读写和图像处理通过asyncio.to_thread执行，不阻塞事件循环
+    """
+    method_decorators = [_ensure_sync]
+
+
+def check_upload_request(limit_key):
+    """
+    在读取请求体之前检查上传请求的长度和类型
+    被拒绝的请求不会触发multipart解析，也就不会有任何数据写入临时文件
+    
+    Args:
+        limit_key: 应用配置中的大小上限键（未配置时使用MAX_CONTENT_LENGTH）
+        
+    Returns:
+        拒绝时返回(错误响应, 状态码)，通过时返回None
+    """
+    if request.mimetype != 'multipart/form-data':
+        return jsonify({'error': '上传请求必须使用multipart/form-data格式'}), 415
+    
+    content_length = request.content_length
+    if content_length is None:
+        return jsonify({'error': '上传请求缺少Content-Length'}), 411
+    
+    max_bytes = current_app.config.get(limit_key) or current_app.config.get('MAX_CONTENT_LENGTH')
+    if max_bytes and content_length > max_bytes:
+        return jsonify({'error': f'上传内容过大，上限为 {max_bytes} 字节'}), 413
+    
+    return None
 
 
-class ImageUploadResource(Resource):
+class ImageUploadResource(AsyncResource):
     """
     图像上传API资源
     """
-    def post(self):
+    async def post(self):
         """
         上传单个图像
         """
         try:
+            # 先检查请求头，再访问request.files
+            rejection = check_upload_request('MAX_IMAGE_BYTES')
+            if rejection is not None:
+                return rejection
+            
             # 获取上传的文件
             if 'file' not in request.files:
                 return jsonify({'error': '未提供文件'}), 400
@@ -67,61 +275,50 @@ class ImageUploadResource(Resource):
             if file.filename == '':
                 return jsonify({'error': '未选择文件'}), 400
             
-            # 解析其他参数
-            args = image_upload_parser.parse_args()
-            
-            # 构建元数据
+            # 构建元数据（直接读取表单字段）
             metadata = {}
-            if args.metadata:
+            metadata_raw = request.form.get('metadata')
+            if metadata_raw:
                 try:
-                    metadata = json.loads(args.metadata)
+                    metadata = json_loads(metadata_raw)
                 except json.JSONDecodeError:
                     return jsonify({'error': '无效的元数据格式'}), 400
             
             # 添加额外的元数据字段
-            for field in ['patient_id', 'study_id', 'image_type']:
-                if args.get(field):
-                    metadata[field] = args[field]
-            
-            # 保存临时文件
-            temp_dir = current_app.config.get('TEMP_DIR', '/tmp')
-            os.makedirs(temp_dir, exist_ok=True)
+            for field in ('patient_id', 'study_id', 'image_type'):
+                value = request.form.get(field)
+                if value:
+                    metadata[field] = value
             
-            filename = secure_filename(file.filename)
-            temp_path = os.path.join(temp_dir, filename)
-            file.save(temp_path)
+            # 直接把上传流交给数据集成API解码和存储，不再落盘临时文件后重新读取
+            api = get_api()
+            result = await api.upload_and_process_image_async(
+                file.stream, metadata, filename=secure_filename(file.filename))
             
-            try:
-                # 使用数据集成API上传和处理图像
-                api = get_api()
-                result = api.upload_and_process_image(temp_path, metadata)
-                
-                if result.get('success'):
-                    return jsonify(result.get('data')), 201
-                else:
-                    return jsonify({'error': result.get('error')}), 400
-            finally:
-                # 清理临时文件
-                if os.path.exists(temp_path):
-                    try:
-                        os.remove(temp_path)
-                    except Exception as e:
-                        logger.warning(f"清理临时文件失败 {temp_path}: {e}")
+            if result.get('success'):
+                return jsonify(result.get('data')), 201
+            else:
+                return jsonify({'error': result.get('error')}), 400
                         
         except Exception as e:
             logger.error(f"图像上传失败: {e}")
             return jsonify({'error': f'服务器内部错误: {str(e)}'}), 500
 
 
-class DocumentUploadResource(Resource):
+class DocumentUploadResource(AsyncResource):
     """
     文档上传API资源
     """
-    def post(self):
+    async def post(self):
         """
         上传单个文档
         """
         try:
+            # 先检查请求头，再访问request.files
+            rejection = check_upload_request('MAX_DOCUMENT_BYTES')
+            if rejection is not None:
+                return rejection
+            
             # 获取上传的文件
             if 'file' not in request.files:
                 return jsonify({'error': '未提供文件'}), 400
@@ -130,46 +327,30 @@ class DocumentUploadResource(Resource):
             if file.filename == '':
                 return jsonify({'error': '未选择文件'}), 400
             
-            # 解析其他参数
-            args = document_upload_parser.parse_args()
-            
-            # 构建元数据
+            # 构建元数据（直接读取表单字段）
             metadata = {}
-            if args.metadata:
+            metadata_raw = request.form.get('metadata')
+            if metadata_raw:
                 try:
-                    metadata = json.loads(args.metadata)
+                    metadata = json_loads(metadata_raw)
                 except json.JSONDecodeError:
                     return jsonify({'error': '无效的元数据格式'}), 400
             
             # 添加额外的元数据字段
-            for field in ['patient_id', 'document_type']:
-                if args.get(field):
-                    metadata[field] = args[field]
+            for field in ('patient_id', 'document_type'):
+                value = request.form.get(field)
+                if value:
+                    metadata[field] = value
             
-            # 保存临时文件
-            temp_dir = current_app.config.get('TEMP_DIR', '/tmp')
-            os.makedirs(temp_dir, exist_ok=True)
-            
-            filename = secure_filename(file.filename)
-            temp_path = os.path.join(temp_dir, filename)
-            file.save(temp_path)
+            # 直接把上传流交给数据集成API读取和存储，不再落盘临时文件后重新读取
+            api = get_api()
+            result = await api.upload_and_process_document_async(
+                file.stream, metadata, filename=secure_filename(file.filename))
             
-            try:
-                # 使用数据集成API上传和处理文档
-                api = get_api()
-                result = api.upload_and_process_document(temp_path, metadata)
-                
-                if result.get('success'):
-                    return jsonify(result.get('data')), 201
-                else:
-                    return jsonify({'error': result.get('error')}), 400
-            finally:
-                # 清理临时文件
-                if os.path.exists(temp_path):
-                    try:
-                        os.remove(temp_path)
-                    except Exception as e:
-                        logger.warning(f"清理临时文件失败 {temp_path}: {e}")
+            if result.get('success'):
+                return jsonify(result.get('data')), 201
+            else:
+                return jsonify({'error': result.get('error')}), 400
                         
         except Exception as e:
             logger.error(f"文档上传失败: {e}")
@@ -185,32 +366,34 @@ class SearchResource(Resource):
         执行搜索查询
         """
         try:
-            # 解析查询参数
-            args = search_parser.parse_args()
+            # 解析查询参数（查询字符串或表单）
+            query = request.values.get('query')
+            if not query:
+                return jsonify({'error': '缺少搜索查询参数: query'}), 400
             
             # 处理模态列表
             modalities = None
-            if args.modalities:
-                modalities = [m.strip() for m in args.modalities.split(',')]
+            modalities_raw = request.values.get('modalities')
+            if modalities_raw:
+                modalities = [m.strip() for m in modalities_raw.split(',')]
             
             # 处理过滤条件
             filters = None
-            if args.filters:
+            filters_raw = request.values.get('filters')
+            if filters_raw:
                 try:
-                    filters = json.loads(args.filters)
+                    filters = json_loads(filters_raw)
                 except json.JSONDecodeError:
                     return jsonify({'error': '无效的过滤条件格式'}), 400
             
-            # 执行搜索
+            # 执行搜索（相同查询在SEARCH_CACHE_TTL内直接返回缓存结果）
             api = get_api()
-            results = api.search_multimodal(
-                query=args.query,
-                modalities=modalities,
-                filters=filters
+            cache_key = ResponseCache.make_key('search', query, sorted(modalities or []), filters)
+            return cached_json_response(
+                cache_key, 'SEARCH_CACHE_TTL', 60,
+                lambda: api.search_multimodal(query=query, modalities=modalities, filters=filters)
             )
             
-            return jsonify(results), 200
-            
         except Exception as e:
             logger.error(f"搜索失败: {e}")
             return jsonify({'error': f'服务器内部错误: {str(e)}'}), 500
@@ -230,32 +413,40 @@ class PatientDataResource(Resource):
             if request.args.get('modalities'):
                 modalities = [m.strip() for m in request.args['modalities'].split(',')]
             
-            # 获取患者数据
+            # 获取患者数据（PATIENT_CACHE_TTL内直接返回缓存结果）
             api = get_api()
-            results = api.get_patient_data(patient_id, modalities)
-            
-            return jsonify(results), 200
+            cache_key = ResponseCache.make_key('patient', patient_id, sorted(modalities or []))
+            return cached_json_response(
+                cache_key, 'PATIENT_CACHE_TTL', 300,
+                lambda: api.get_patient_data(patient_id, modalities)
+            )
             
         except Exception as e:
             logger.error(f"获取患者数据失败: {e}")
             return jsonify({'error': f'服务器内部错误: {str(e)}'}), 500
 
 
-class BatchUploadResource(Resource):
+class BatchUploadResource(AsyncResource):
     """
     批量上传API资源
     """
-    def post(self):
+    async def post(self):
         """
         创建批量上传任务
         """
         try:
-            # 解析请求参数
-            args = batch_upload_parser.parse_args()
+            # 解析请求参数（JSON请求体或表单）
+            args = request.get_json(silent=True)
+            if not isinstance(args, dict):
+                args = request.form
+            
+            file_paths_raw = args.get('file_paths')
+            if file_paths_raw is None:
+                return jsonify({'error': '缺少文件路径列表参数: file_paths'}), 400
             
             # 解析文件路径列表
             try:
-                file_paths = json.loads(args.file_paths)
+                file_paths = json_loads(file_paths_raw) if isinstance(file_paths_raw, str) else file_paths_raw
                 if not isinstance(file_paths, list):
                     return jsonify({'error': '文件路径必须是列表格式'}), 400
             except json.JSONDecodeError:
@@ -263,25 +454,26 @@ class BatchUploadResource(Resource):
             
             # 解析元数据列表（如果提供）
             metadata_list = None
-            if args.metadata_list:
+            metadata_list_raw = args.get('metadata_list')
+            if metadata_list_raw:
                 try:
-                    metadata_list = json.loads(args.metadata_list)
+                    metadata_list = json_loads(metadata_list_raw) if isinstance(metadata_list_raw, str) else metadata_list_raw
                     if not isinstance(metadata_list, list):
                         return jsonify({'error': '元数据列表必须是列表格式'}), 400
                 except json.JSONDecodeError:
                     return jsonify({'error': '无效的元数据列表格式'}), 400
-            
-            # 验证文件路径
-            for path in file_paths:
-                if not os.path.exists(path):
-                    return jsonify({'error': f'文件不存在: {path}'}), 400
+                if len(metadata_list) != len(file_paths):
+                    return jsonify({'error': '元数据列表长度必须与文件路径列表一致'}), 400
             
             # 启动批量上传任务
+            # 文件是否存在由后台进程池逐个检查，不存在的文件在任务状态中记为失败，
+            # 请求本身只登记任务并立即返回202
             api = get_api()
-            result = api.start_batch_upload(
+            result = await asyncio.to_thread(
+                api.start_batch_upload,
                 file_paths=file_paths,
                 metadata_list=metadata_list,
-                priority=args.priority
+                priority=args.get('priority') or 'medium'
             )
             
             return jsonify(result), 202
@@ -348,9 +540,9 @@ class ImageRetrieveResource(Resource):
         """
         try:
             api = get_api()
-            image_path = api.image_storage.get_image_path(image_id)
+            image_path = resolve_cached_path('image', image_id, api.image_storage.get_image_path)
             
-            if not image_path or not os.path.exists(image_path):
+            if not image_path:
                 return jsonify({'error': '图像不存在'}), 404
             
             # 返回图像文件
@@ -371,9 +563,10 @@ class DocumentRetrieveResource(Resource):
         """
         try:
             api = get_api()
-            document_path = api.document_storage.get_document_path(document_id)
+            document_path = resolve_cached_path('document', document_id,
+                                                api.document_storage.get_document_path)
             
-            if not document_path or not os.path.exists(document_path):
+            if not document_path:
                 return jsonify({'error': '文档不存在'}), 404
             
             # 返回文档文件
@@ -395,21 +588,22 @@ class SystemStatusResource(Resource):
         try:
             api = get_api()
             
-            # 获取存储统计
-            image_stats = api.image_storage.get_storage_stats()
-            document_stats = api.document_storage.get_storage_stats()
+            # 获取存储统计（后台定期刷新的快照，不在请求内遍历存储目录）
+            storage_stats = api.get_storage_stats()
+            task_counts = api.get_batch_task_counts()
             
             # 构建状态信息
             status = {
                 'status': 'operational',
                 'version': '1.0.0',
                 'storage': {
-                    'images': image_stats,
-                    'documents': document_stats
+                    'images': storage_stats['images'],
+                    'documents': storage_stats['documents'],
+                    'computed_at': storage_stats['computed_at']
                 },
                 'batch_tasks': {
-                    'active': len(api.batch_manager.get_active_tasks()),
-                    'queue': len(api.batch_manager.get_queued_tasks())
+                    'active': task_counts['active'],
+                    'queue': task_counts['queued']
                 }
             }
             
@@ -444,6 +638,10 @@ def register_data_integration(app, config=None):
     # 注册蓝图
     app.register_blueprint(data_integration_bp)
     
+    # 安装orjson时替换应用的JSON提供器，加速大体量搜索结果的序列化
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
+    
     # 设置必要的配置
     if not app.config.get('TEMP_DIR'):
         app.config['TEMP_DIR'] = os.path.join(app.root_path, 'temp')
@@ -451,18 +649,27 @@ def register_data_integration(app, config=None):
     # 确保临时目录存在
     os.makedirs(app.config['TEMP_DIR'], exist_ok=True)
     
+    # 搜索和患者数据的响应缓存（配置CACHE_REDIS_URL时使用Redis）
+    app.config.setdefault('SEARCH_CACHE_TTL', 60)
+    app.config.setdefault('PATIENT_CACHE_TTL', 300)
+    app.extensions['data_integration_cache'] = ResponseCache(app.config.get('CACHE_REDIS_URL'))
+    
+    # USE_X_SENDFILE开启时，图像/文档检索接口的send_file只输出X-Sendfile响应头，
+    # 由反向代理零拷贝发送文件内容（未配置代理时开启会导致响应体为空）
+    if app.use_x_sendfile:
+        logger.info("已启用X-Sendfile，文件内容由反向代理发送")
+    
     # 初始化数据集成API
     api = get_api(config)
     
     # 在应用上下文中存储API实例
     app.data_integration_api = api
     
-    # 添加应用启动和关闭处理
-    @app.before_first_request
-    def before_first_request():
-        """应用首次请求前的初始化"""
-        logger.info("数据集成模块已初始化")
+    # 注册时即完成初始化（before_first_request已被Flask弃用，且会让首个请求承担初始化开销）
+    warmed = api.warmup()
+    logger.info(f"数据集成模块已初始化，已预热组件: {', '.join(warmed) or '无'}")
     
+    # 添加应用关闭处理
     @app.teardown_appcontext
     def teardown_appcontext(exception):
         """应用上下文销毁时的清理"""
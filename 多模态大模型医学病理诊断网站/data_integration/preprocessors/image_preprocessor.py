@@ -1,15 +1,70 @@
 """图像预处理模块"""
 import os
+import hashlib
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
 import numpy as np
-from typing import Dict, Optional, Tuple, Union
-from PIL import Image
+from typing import Dict, Optional, List, Tuple, Union
+from PIL import Image, ImageOps
+from scipy import ndimage
+from skimage import color, exposure
 import logging
 
+try:
+    import cv2
+except ImportError:  # OpenCV为可选依赖，缺失时使用scipy进行高斯滤波
+    cv2 = None
+
+try:
+    import tifffile
+except ImportError:  # tifffile为可选依赖，缺失时大图像也整幅读入内存处理
+    tifffile = None
+
+try:
+    import openslide
+except ImportError:  # openslide为可选依赖，缺失时用tifffile/PIL按区域读取
+    openslide = None
+
+try:
+    import numba
+except ImportError:  # numba为可选依赖，缺失时归一化和虚拟染色分两步执行
+    numba = None
+
+# skimage.color.rgb2yuv使用的亮度权重
+_LUMA_WEIGHTS = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def _normalize_stain_kernel(image, offset, scale, bias, mix, out):
+        """
+        融合的归一化+虚拟染色内核，按行并行，每个像素只读写一次
+        逐步复现两步实现的取整：归一化结果先截断为uint8，再参与染色
+        """
+        height, width = image.shape[0], image.shape[1]
+        for y in numba.prange(height):
+            for x in range(width):
+                r = min(max((np.float32(image[y, x, 0]) - offset[0]) * scale[0] + bias, 0.0), 255.0)
+                g = min(max((np.float32(image[y, x, 1]) - offset[1]) * scale[1] + bias, 0.0), 255.0)
+                b = min(max((np.float32(image[y, x, 2]) - offset[2]) * scale[2] + bias, 0.0), 255.0)
+                r = np.float32(np.uint8(r)) / np.float32(255.0)
+                g = np.float32(np.uint8(g)) / np.float32(255.0)
+                b = np.float32(np.uint8(b)) / np.float32(255.0)
+                for c in range(3):
+                    value = r * mix[0, c] + g * mix[1, c] + b * mix[2, c]
+                    value = min(max(value, 0.0), 1.0)
+                    out[y, x, c] = np.uint8(value * np.float32(255.0))
+else:
+    _normalize_stain_kernel = None
+
+
 class ImageQualityEnhancer:
     """
     图像质量提升处理器
@@ -27,12 +82,26 @@ class ImageQualityEnhancer:
         # 设置默认参数
         self.default_params = {
             "denoise_strength": 1.0,
+            "denoise_method": "gaussian",
             "crop_margin": 0.05,
             "normalize_method": "histogram",
             "virtual_stain_intensity": 1.2
         }
         # 更新默认参数
         self.default_params.update(self.config)
+        
+        # 增强结果缓存：(文件内容哈希, 操作参数) -> (输出文件路径, 写出时的文件签名)
+        self._result_cache = OrderedDict()
+        self._result_cache_size = self.config.get("result_cache_size", 256)
+        self._result_cache_lock = threading.Lock()
+        
+        # 虚拟染色查找表：(染色类型, 强度) -> 256x3的uint8表
+        self._stain_luts = {}
+        
+        # 超过该像素数的图像按瓦片处理（需要tifffile，且输出为TIFF）
+        self.tile_threshold_pixels = self.config.get("tile_threshold_pixels", 8192 * 8192)
+        self.tile_size = self.config.get("tile_size", 1024)
+        self.tile_workers = self.config.get("tile_workers", 4)
     
     def enhance_image(self, image_path: str, output_path: Optional[str] = None, 
                      operations: Optional[Dict] = None) -> str:
@@ -50,15 +119,6 @@ class ImageQualityEnhancer:
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"图像文件不存在: {image_path}")
         
-        # 设置默认操作
-        if operations is None:
-            operations = {
-                "denoise": True,
-                "normalize": True,
-                "crop": False,
-                "virtual_stain": False
-            }
-        
         # 确保输出路径有效
         if output_path is None:
             base_name = os.path.basename(image_path)
@@ -66,33 +126,32 @@ class ImageQualityEnhancer:
             output_path = os.path.join(os.path.dirname(image_path), f"{name}_enhanced{ext}")
         
         try:
-            # 读取图像
-            image = Image.open(image_path)
-            image_array = np.array(image)
-            
-            # 执行指定的操作
-            if operations.get("denoise", False):
-                image_array = self._denoise_image(image_array, 
-                                               operations.get("denoise_strength", 
-                                                             self.default_params["denoise_strength"]))
-            
-            if operations.get("normalize", False):
-                method = operations.get("normalize_method", self.default_params["normalize_method"])
-                image_array = self._normalize_color(image_array, method)
+            # 相同内容、相同操作的图像直接复用已有结果，跳过整条增强流水线
+            cache_key = (self._file_digest(image_path), self._operations_key(operations))
+            cached_path = self._get_cached_result(cache_key)
+            if cached_path is not None:
+                if os.path.abspath(cached_path) != os.path.abspath(output_path):
+                    # 复制而不是硬链接：输出文件之后可能被原地覆盖，不能与缓存结果共享inode
+                    shutil.copyfile(cached_path, output_path)
+                logger.info(f"命中图像增强缓存: {output_path}")
+                return output_path
             
-            if operations.get("crop", False):
-                margin = operations.get("crop_margin", self.default_params["crop_margin"])
-                image_array = self._crop_image(image_array, margin)
+            # 全切片等超大图像逐瓦片处理，不把整幅图像读入内存
+            if self._should_tile(image_path, output_path):
+                self.enhance_image_tiled(image_path, output_path, operations)
+                self._put_cached_result(cache_key, output_path)
+                logger.info(f"图像增强完成（分块处理）: {output_path}")
+                return output_path
             
-            if operations.get("virtual_stain", False):
-                stain_type = operations.get("stain_type", "ihc")
-                intensity = operations.get("stain_intensity", 
-                                          self.default_params["virtual_stain_intensity"])
-                image_array = self._virtual_staining(image_array, stain_type, intensity)
+            # 仅裁剪或仅直方图均衡化时直接由PIL处理，不经过NumPy数组
+            result_image = self._enhance_with_pil(image_path, operations)
+            if result_image is None:
+                image_array = self.enhance_array(image_path, operations)
+                result_image = Image.fromarray(image_array)
             
             # 保存处理后的图像
-            result_image = Image.fromarray(image_array)
             result_image.save(output_path)
+            self._put_cached_result(cache_key, output_path)
             
             logger.info(f"图像增强完成: {output_path}")
             return output_path
@@ -101,32 +160,431 @@ class ImageQualityEnhancer:
             logger.error(f"图像增强失败: {e}")
             raise
     
-    def _denoise_image(self, image_array: np.ndarray, strength: float = 1.0) -> np.ndarray:
+    def _should_tile(self, image_path: str, output_path: str) -> bool:
+        """判断是否对图像逐瓦片处理"""
+        if tifffile is None or not output_path.lower().endswith(('.tif', '.tiff')):
+            return False
+        try:
+            (width, height), _, close = self._open_region_reader(image_path)
+        except Exception:
+            return False
+        try:
+            return width * height > self.tile_threshold_pixels
+        finally:
+            close()
+    
+    @staticmethod
+    def _open_region_reader(image_path: str):
+        """
+        打开按区域读取的图像
+        依次尝试OpenSlide、tifffile内存映射和PIL
+        
+        Returns:
+            ((宽, 高), read(x, y, w, h) -> RGB uint8数组, close())
+        """
+        if openslide is not None:
+            try:
+                slide = openslide.OpenSlide(image_path)
+            except Exception:
+                slide = None
+            if slide is not None:
+                def read_slide(x, y, w, h):
+                    region = slide.read_region((x, y), 0, (w, h)).convert('RGB')
+                    return np.asarray(region)
+                return slide.dimensions, read_slide, slide.close
+        
+        if tifffile is not None:
+            try:
+                # 只适用于未压缩、连续存储的TIFF
+                array = tifffile.memmap(image_path, mode='r')
+            except Exception:
+                array = None
+            if array is not None and array.ndim == 3 and array.shape[2] >= 3 \
+                    and array.dtype == np.uint8:
+                def read_memmap(x, y, w, h):
+                    return np.ascontiguousarray(array[y:y + h, x:x + w, :3])
+                return (array.shape[1], array.shape[0]), read_memmap, lambda: None
+        
+        image = Image.open(image_path)
+        # PIL的解码状态不是线程安全的，瓦片线程串行读取
+        read_lock = threading.Lock()
+        
+        def read_pil(x, y, w, h):
+            with read_lock:
+                return np.asarray(image.crop((x, y, x + w, y + h)).convert('RGB'))
+        return image.size, read_pil, image.close
+    
+    def enhance_image_tiled(self, image_path: str, output_path: str,
+                            operations: Optional[Dict] = None):
+        """
+        逐瓦片执行图像增强，并写出分块TIFF
+        每个瓦片在缓存内依次完成去噪、归一化和虚拟染色，内存占用与瓦片大小而非图像大小相关。
+        去噪时瓦片带有高斯核半径的重叠边缘，拼接结果与整幅处理一致；
+        归一化所需的全局统计量（通道极值、均值方差或亮度直方图）先遍历一次原图得到
+        
+        Args:
+            image_path: 输入图像路径
+            output_path: 输出TIFF路径
+            operations: 要执行的操作及其参数（与enhance_array相同）
+        """
+        if operations is None:
+            operations = {"denoise": True, "normalize": True, "crop": False, "virtual_stain": False}
+        
+        (width, height), read, close = self._open_region_reader(image_path)
+        try:
+            # 裁剪只改变读取窗口
+            x0 = y0 = 0
+            out_w, out_h = width, height
+            if operations.get("crop", False):
+                margin = operations.get("crop_margin", self.default_params["crop_margin"])
+                y0, x0 = self._crop_margins(height, width, margin)
+                out_w, out_h = width - 2 * x0, height - 2 * y0
+            
+            tile = self.tile_size
+            origins = [(x0 + tx, y0 + ty) for ty in range(0, out_h, tile) for tx in range(0, out_w, tile)]
+            window = (x0, y0, x0 + out_w, y0 + out_h)
+            
+            method = None
+            stats = None
+            if operations.get("normalize", False):
+                method = operations.get("normalize_method", self.default_params["normalize_method"])
+                if method not in ("histogram", "minmax", "zscore"):
+                    logger.warning(f"未知的归一化方法: {method}，使用默认的直方图均衡化")
+                    method = "histogram"
+                stats = self._tile_statistics(read, origins, window, method)
+            
+            def process(origin):
+                x, y = origin
+                w, h = min(tile, window[2] - x), min(tile, window[3] - y)
+                result = self._enhance_tile(read, x, y, w, h, width, height, operations, method, stats)
+                if (h, w) != (tile, tile):
+                    # 分块TIFF要求每个瓦片尺寸相同，边缘瓦片补零
+                    padded = np.zeros((tile, tile, 3), dtype=np.uint8)
+                    padded[:h, :w] = result
+                    result = padded
+                return result
+            
+            # numpy/cv2/scipy在计算时释放GIL，瓦片可以用线程并行；map保持瓦片顺序
+            with ThreadPoolExecutor(max_workers=self.tile_workers) as executor:
+                with tifffile.TiffWriter(output_path, bigtiff=True) as writer:
+                    writer.write(executor.map(process, origins), shape=(out_h, out_w, 3),
+                                 dtype=np.uint8, tile=(tile, tile), photometric='rgb')
+        finally:
+            close()
+    
+    def _tile_statistics(self, read, origins, window, method: str) -> Dict:
+        """
+        遍历原图瓦片，计算归一化所需的全局统计量
+        
+        Returns:
+            minmax: min/max；zscore: mean/std；histogram: 亮度值到均衡化亮度的映射表
+        """
+        tile = self.tile_size
+        count = 0
+        sums = np.zeros(3, dtype=np.float64)
+        squares = np.zeros(3, dtype=np.float64)
+        mins = np.full(3, 255.0)
+        maxs = np.zeros(3)
+        hist = np.zeros(256, dtype=np.int64)
+        
+        for x, y in origins:
+            pixels = read(x, y, min(tile, window[2] - x), min(tile, window[3] - y)).reshape(-1, 3)
+            if method == "minmax":
+                mins = np.minimum(mins, pixels.min(axis=0))
+                maxs = np.maximum(maxs, pixels.max(axis=0))
+            elif method == "zscore":
+                values = pixels.astype(np.float64)
+                sums += values.sum(axis=0)
+                squares += np.square(values).sum(axis=0)
+                count += len(pixels)
+            else:
+                luma = (pixels.astype(np.float32) @ _LUMA_WEIGHTS) / 255.0
+                hist += np.histogram(luma, bins=256, range=(0.0, 1.0))[0]
+        
+        if method == "minmax":
+            return {"min": mins.astype(np.float32), "max": maxs.astype(np.float32)}
+        if method == "zscore":
+            mean = sums / max(count, 1)
+            std = np.sqrt(np.maximum(squares / max(count, 1) - np.square(mean), 0))
+            return {"mean": mean.astype(np.float32), "std": std.astype(np.float32)}
+        
+        cdf = np.cumsum(hist).astype(np.float64)
+        cdf /= max(cdf[-1], 1)
+        bin_centers = (np.arange(256) + 0.5) / 256
+        return {"bin_centers": bin_centers.astype(np.float32), "cdf": cdf.astype(np.float32)}
+    
+    def _enhance_tile(self, read, x: int, y: int, w: int, h: int, width: int, height: int,
+                      operations: Dict, method: Optional[str], stats: Optional[Dict]) -> np.ndarray:
+        """
+        处理单个瓦片：去噪 -> 归一化 -> 虚拟染色
+        
+        Returns:
+            h x w x 3的uint8瓦片
+        """
+        if operations.get("denoise", False):
+            strength = operations.get("denoise_strength", self.default_params["denoise_strength"])
+            # 读取带重叠边缘的区域，使瓦片边界处的滤波结果与整幅处理一致
+            halo = int(np.ceil(4 * 0.5 * strength)) + 1
+            hx0, hy0 = max(x - halo, 0), max(y - halo, 0)
+            hx1, hy1 = min(x + w + halo, width), min(y + h + halo, height)
+            region = read(hx0, hy0, hx1 - hx0, hy1 - hy0)
+            region = self._denoise_image(region, strength, operations.get(
+                "denoise_method", self.default_params["denoise_method"]))
+            tile = region[y - hy0:y - hy0 + h, x - hx0:x - hx0 + w]
+        else:
+            tile = read(x, y, w, h)
+        
+        if method == "minmax":
+            values = tile.astype(np.float32)
+            values -= stats["min"]
+            values *= 255 / np.maximum(stats["max"] - stats["min"], 1)
+            tile = np.clip(values, 0, 255, out=values).astype(np.uint8)
+        elif method == "zscore":
+            values = tile.astype(np.float32)
+            values -= stats["mean"]
+            values *= 50 / np.maximum(stats["std"], 1)
+            values += 127
+            tile = np.clip(values, 0, 255, out=values).astype(np.uint8)
+        elif method == "histogram":
+            # YUV中只替换亮度：U、V不变时，RGB三个通道的变化量都等于亮度的变化量
+            values = tile.astype(np.float32) / 255.0
+            luma = values @ _LUMA_WEIGHTS
+            equalized = np.interp(luma, stats["bin_centers"], stats["cdf"]).astype(np.float32)
+            values += (equalized - luma)[:, :, None]
+            np.clip(values, 0, 1, out=values)
+            tile = (values * 255).astype(np.uint8)
+        
+        if operations.get("virtual_stain", False):
+            stain_type = operations.get("stain_type", "ihc")
+            intensity = operations.get("stain_intensity", self.default_params["virtual_stain_intensity"])
+            tile = self._virtual_staining(tile, stain_type, intensity)
+        
+        return tile
+    
+    def _enhance_with_pil(self, image_path: str, operations: Optional[Dict]) -> Optional[Image.Image]:
+        """
+        只包含单一简单操作时直接用PIL完成处理
+        
+        Args:
+            image_path: 输入图像路径
+            operations: 要执行的操作及其参数
+            
+        Returns:
+            处理后的PIL图像，不适用快速路径时返回None
+        """
+        if not operations:
+            return None
+        enabled = {name for name in ("denoise", "normalize", "crop", "virtual_stain")
+                   if operations.get(name, False)}
+        
+        if enabled == {"crop"}:
+            image = Image.open(image_path)
+            margin = operations.get("crop_margin", self.default_params["crop_margin"])
+            logger.info(f"执行图像裁剪，边距比例: {margin}")
+            width, height = image.size
+            margin_h, margin_w = self._crop_margins(height, width, margin)
+            return image.crop((margin_w, margin_h, width - margin_w, height - margin_h))
+        
+        method = operations.get("normalize_method", self.default_params["normalize_method"])
+        if enabled == {"normalize"} and method == "histogram":
+            image = Image.open(image_path)
+            if image.mode == "L":
+                logger.info("执行色彩归一化，方法: histogram")
+                return ImageOps.equalize(image)
+            if image.mode == "RGB":
+                # 与数组路径相同，只均衡化亮度通道
+                logger.info("执行色彩归一化，方法: histogram")
+                luma, cb, cr = image.convert("YCbCr").split()
+                return Image.merge("YCbCr", (ImageOps.equalize(luma), cb, cr)).convert("RGB")
+        
+        return None
+    
+    @staticmethod
+    def _file_digest(file_path: str, chunk_size: int = 4 * 1024 * 1024) -> str:
+        """分块计算文件内容的BLAKE2b摘要"""
+        digest = hashlib.blake2b(digest_size=20)
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def _operations_key(self, operations: Optional[Dict]) -> str:
+        """把操作参数（含默认参数）转换为可哈希的缓存键"""
+        items = sorted((operations or {}).items())
+        return repr((operations is None, items, sorted(self.default_params.items())))
+    
+    @staticmethod
+    def _file_signature(file_path: str) -> Optional[Tuple[int, int]]:
+        """文件的(修改时间ns, 大小)，文件不存在时返回None"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    def _get_cached_result(self, cache_key) -> Optional[str]:
+        """查找缓存的增强结果，结果文件已被删除或被覆盖时视为未命中"""
+        with self._result_cache_lock:
+            entry = self._result_cache.get(cache_key)
+            if entry is None:
+                return None
+            cached_path, signature = entry
+            if self._file_signature(cached_path) != signature:
+                del self._result_cache[cache_key]
+                return None
+            self._result_cache.move_to_end(cache_key)
+            return cached_path
+    
+    def _put_cached_result(self, cache_key, output_path: str):
+        """记录增强结果及其文件签名，超出容量时淘汰最久未使用的条目"""
+        signature = self._file_signature(output_path)
+        if signature is None:
+            return
+        with self._result_cache_lock:
+            self._result_cache[cache_key] = (output_path, signature)
+            self._result_cache.move_to_end(cache_key)
+            while len(self._result_cache) > self._result_cache_size:
+                self._result_cache.popitem(last=False)
+    
+    def enhance_array(self, image_path: str, operations: Optional[Dict] = None) -> np.ndarray:
+        """
+        执行图像增强处理，返回内存中的图像数组而不写出文件
+        
+        Args:
+            image_path: 输入图像路径
+            operations: 要执行的操作及其参数
+            
+        Returns:
+            处理后的图像数组
+        """
+        # 设置默认操作
+        if operations is None:
+            operations = {
+                "denoise": True,
+                "normalize": True,
+                "crop": False,
+                "virtual_stain": False
+            }
+        
+        # 读取图像
+        image = Image.open(image_path)
+        image_array = np.array(image)
+        
+        # 执行指定的操作
+        if operations.get("denoise", False):
+            image_array = self._denoise_image(image_array, 
+                                           operations.get("denoise_strength", 
+                                                         self.default_params["denoise_strength"]),
+                                           operations.get("denoise_method",
+                                                         self.default_params["denoise_method"]))
+        
+        stain_type = operations.get("stain_type", "ihc")
+        intensity = operations.get("stain_intensity", 
+                                  self.default_params["virtual_stain_intensity"])
+        
+        # minmax/zscore归一化后接虚拟染色时，安装numba则由融合内核一次完成，
+        # 归一化参数在裁剪前的整幅图像上计算，与分步执行一致
+        fused_params = None
+        if operations.get("normalize", False):
+            method = operations.get("normalize_method", self.default_params["normalize_method"])
+            if _normalize_stain_kernel is not None and operations.get("virtual_stain", False) \
+                    and method in ("minmax", "zscore") and image_array.dtype == np.uint8 \
+                    and image_array.ndim == 3 and image_array.shape[2] == 3 \
+                    and self._stain_matrix(stain_type, intensity) is not None:
+                fused_params = self._normalization_params(image_array, method)
+            else:
+                image_array = self._normalize_color(image_array, method)
+        
+        if operations.get("crop", False):
+            margin = operations.get("crop_margin", self.default_params["crop_margin"])
+            image_array = self._crop_image(image_array, margin)
+        
+        if fused_params is not None:
+            logger.info(f"执行归一化与虚拟染色（融合内核），类型: {stain_type}，强度: {intensity}")
+            offset, scale, bias = fused_params
+            result = np.empty(image_array.shape, dtype=np.uint8)
+            _normalize_stain_kernel(image_array, offset, scale, np.float32(bias),
+                                    self._stain_matrix(stain_type, intensity), result)
+            image_array = result
+        elif operations.get("virtual_stain", False):
+            image_array = self._virtual_staining(image_array, stain_type, intensity)
+        
+        return image_array
+    
+    @staticmethod
+    def _normalization_params(image_array: np.ndarray, method: str) -> Tuple[np.ndarray, np.ndarray, float]:
+        """
+        计算minmax/zscore归一化的逐通道仿射参数：(像素 - offset) * scale + bias
+        统计量直接在原数组上计算，不生成浮点副本
+        
+        Args:
+            image_array: 图像数组
+            method: 归一化方法 ('minmax', 'zscore')
+            
+        Returns:
+            (offset, scale, bias)
+        """
+        if method == "minmax":
+            # 最小-最大归一化
+            min_vals = image_array.min(axis=(0, 1)).astype(np.float32)
+            max_vals = image_array.max(axis=(0, 1)).astype(np.float32)
+            # 避免除零错误
+            range_vals = np.maximum(max_vals - min_vals, 1)
+            return min_vals, (255 / range_vals).astype(np.float32), 0.0
+        
+        # Z-score标准化
+        mean_vals = image_array.mean(axis=(0, 1), dtype=np.float64).astype(np.float32)
+        std_vals = image_array.std(axis=(0, 1), dtype=np.float64).astype(np.float32)
+        # 避免除零错误
+        std_vals = np.maximum(std_vals, 1)
+        return mean_vals, (50 / std_vals).astype(np.float32), 127.0
+    
+    # OpenCV高斯滤波支持的数据类型
+    _CV2_BLUR_DTYPES = (np.uint8, np.uint16, np.int16, np.float32, np.float64)
+    
+    def _denoise_image(self, image_array: np.ndarray, strength: float = 1.0,
+                       method: str = "gaussian") -> np.ndarray:
         """
         图像去噪
         
         Args:
             image_array: 图像数组
             strength: 去噪强度
+            method: 去噪方法 ('gaussian', 'nlmeans')，'nlmeans'需要OpenCV且仅支持8位图像
             
         Returns:
             去噪后的图像数组
         """
-        # 这是一个简化实现
-        # 实际项目中可以使用更复杂的去噪算法，如高斯滤波、中值滤波或小波去噪
-        logger.info(f"执行图像去噪，强度: {strength}")
+        logger.info(f"执行图像去噪，强度: {strength}，方法: {method}")
+        
+        if strength <= 0:
+            return image_array
+        
+        is_color = len(image_array.shape) == 3
+        
+        if cv2 is not None and method == "nlmeans" and image_array.dtype == np.uint8:
+            # 非局部均值去噪，效果更好但明显更慢
+            h = 10.0 * strength
+            if not is_color:
+                return cv2.fastNlMeansDenoising(image_array, None, h, 7, 21)
+            if image_array.shape[2] == 3:
+                # OpenCV按BGR顺序在Lab空间中计算
+                bgr = cv2.cvtColor(image_array, cv2.COLOR_RGB2BGR)
+                denoised = cv2.fastNlMeansDenoisingColored(bgr, None, h, h, 7, 21)
+                return cv2.cvtColor(denoised, cv2.COLOR_BGR2RGB)
         
-        # 模拟去噪操作
-        # 在实际应用中，这里应该使用OpenCV等库进行真实的去噪处理
-        if len(image_array.shape) == 3:  # 彩色图像
-            # 简单的平滑处理模拟
-            from scipy import ndimage
-            sigma = 0.5 * strength
+        sigma = 0.5 * strength
+        
+        if cv2 is not None and image_array.dtype in self._CV2_BLUR_DTYPES \
+                and (not is_color or image_array.shape[2] <= 4):
+            # OpenCV的SIMD高斯滤波，按通道在空间维度上平滑；
+            # BORDER_REFLECT与scipy默认的'reflect'边界处理一致
+            return cv2.GaussianBlur(image_array, (0, 0), sigmaX=sigma, sigmaY=sigma,
+                                    borderType=cv2.BORDER_REFLECT)
+        
+        if is_color:  # 彩色图像，不在通道维度上平滑
             return ndimage.gaussian_filter(image_array, sigma=(sigma, sigma, 0))
-        else:  # 灰度图像
-            from scipy import ndimage
-            sigma = 0.5 * strength
-            return ndimage.gaussian_filter(image_array, sigma=sigma)
+        return ndimage.gaussian_filter(image_array, sigma=sigma)
     
     def _normalize_color(self, image_array: np.ndarray, method: str = "histogram") -> np.ndarray:
         """
@@ -141,55 +599,32 @@ class ImageQualityEnhancer:
         """
         logger.info(f"执行色彩归一化，方法: {method}")
         
-        # 确保图像数组为float类型
-        img_float = image_array.astype(float)
+        # 转换为float32（float64会使内存带宽翻倍，且精度对8位图像没有意义）
+        img_float = image_array.astype(np.float32)
         
         if method == "histogram":
             # 直方图均衡化
             if len(img_float.shape) == 3:  # 彩色图像
                 # 转换到YUV色彩空间进行亮度通道均衡化
-                from skimage import color
                 img_yuv = color.rgb2yuv(img_float / 255.0)
                 # 对Y通道进行直方图均衡化
-                from skimage import exposure
                 img_yuv[:, :, 0] = exposure.equalize_hist(img_yuv[:, :, 0])
                 # 转回RGB
                 result = color.yuv2rgb(img_yuv)
                 return (result * 255).astype(np.uint8)
             else:  # 灰度图像
-                from skimage import exposure
                 result = exposure.equalize_hist(img_float / 255.0)
                 return (result * 255).astype(np.uint8)
         
-        elif method == "minmax":
-            # 最小-最大归一化
-            min_vals = img_float.min(axis=(0, 1))
-            max_vals = img_float.max(axis=(0, 1))
-            # 避免除零错误
-            range_vals = np.maximum(max_vals - min_vals, 1)
+        elif method in ("minmax", "zscore"):
+            offset, scale, bias = self._normalization_params(image_array, method)
             
-            if len(img_float.shape) == 3:  # 彩色图像
-                for i in range(3):
-                    img_float[:, :, i] = 255 * (img_float[:, :, i] - min_vals[i]) / range_vals[i]
-            else:  # 灰度图像
-                img_float = 255 * (img_float - min_vals) / range_vals
+            # 逐通道参数沿(H, W, C)广播，彩色和灰度图像都一次原地完成
+            img_float -= offset
+            img_float *= scale
+            img_float += bias
             
-            return np.clip(img_float, 0, 255).astype(np.uint8)
-        
-        elif method == "zscore":
-            # Z-score标准化
-            mean_vals = img_float.mean(axis=(0, 1))
-            std_vals = img_float.std(axis=(0, 1))
-            # 避免除零错误
-            std_vals = np.maximum(std_vals, 1)
-            
-            if len(img_float.shape) == 3:  # 彩色图像
-                for i in range(3):
-                    img_float[:, :, i] = 127 + 50 * (img_float[:, :, i] - mean_vals[i]) / std_vals[i]
-            else:  # 灰度图像
-                img_float = 127 + 50 * (img_float - mean_vals) / std_vals
-            
-            return np.clip(img_float, 0, 255).astype(np.uint8)
+            return np.clip(img_float, 0, 255, out=img_float).astype(np.uint8)
         
         else:
             logger.warning(f"未知的归一化方法: {method}，使用默认的直方图均衡化")
@@ -209,14 +644,25 @@ class ImageQualityEnhancer:
         logger.info(f"执行图像裁剪，边距比例: {margin_ratio}")
         
         height, width = image_array.shape[:2]
+        margin_h, margin_w = self._crop_margins(height, width, margin_ratio)
+        
+        return image_array[margin_h:height-margin_h, margin_w:width-margin_w]
+    
+    @staticmethod
+    def _crop_margins(height: int, width: int, margin_ratio: float) -> Tuple[int, int]:
+        """
+        计算裁剪边距
+        
+        Returns:
+            (纵向边距, 横向边距)
+        """
         margin_h = int(height * margin_ratio)
         margin_w = int(width * margin_ratio)
         
         # 确保边距有效
         margin_h = max(0, min(margin_h, height // 2))
         margin_w = max(0, min(margin_w, width // 2))
-        
-        return image_array[margin_h:height-margin_h, margin_w:width-margin_w]
+        return margin_h, margin_w
     
     def _virtual_staining(self, image_array: np.ndarray, stain_type: str = "ihc", 
                          intensity: float = 1.2) -> np.ndarray:
@@ -233,66 +679,150 @@ class ImageQualityEnhancer:
         """
         logger.info(f"执行虚拟染色，类型: {stain_type}，强度: {intensity}")
         
+        mix_matrix = self._stain_matrix(stain_type, intensity)
+        if mix_matrix is None:
+            logger.warning(f"未知的染色类型: {stain_type}，使用默认的IHC染色")
+            return self._virtual_staining(image_array, stain_type="ihc", intensity=intensity)
+        
+        is_diagonal = not np.any(mix_matrix - np.diag(np.diag(mix_matrix)))
+        if image_array.dtype == np.uint8 and is_diagonal:
+            # 8位图像的逐通道缩放可查表完成，每个像素不做浮点运算，只分配一次输出
+            lut = self._stain_lut(stain_type.lower(), intensity, mix_matrix)
+            if image_array.ndim == 2:
+                # 灰度图像直接查表得到RGB结果，省去先转RGB的整幅拷贝
+                return lut[image_array]
+            return lut[image_array[:, :, :3], np.arange(3)]
+        
         # 确保图像为RGB格式
         if len(image_array.shape) != 3:
             # 灰度转RGB
-            from skimage import color
-            img_rgb = color.gray2rgb(image_array)
-        else:
-            img_rgb = image_array.copy() / 255.0
-        
-        if stain_type.lower() == "ihc":
-            # 模拟IHC染色（棕色染色）
-            # 增强红色和黄色通道
-            img_rgb[:, :, 0] = np.clip(img_rgb[:, :, 0] * intensity, 0, 1)
-            img_rgb[:, :, 1] = np.clip(img_rgb[:, :, 1] * 0.8, 0, 1)
-            img_rgb[:, :, 2] = np.clip(img_rgb[:, :, 2] * 0.6, 0, 1)
-        
-        elif stain_type.lower() == "he":
-            # 模拟HE染色（苏木精-伊红，蓝色和红色）
-            # 增强蓝色通道（核）和红色通道（细胞质）
-            img_rgb[:, :, 0] = np.clip(img_rgb[:, :, 0] * 0.9, 0, 1)
-            img_rgb[:, :, 1] = np.clip(img_rgb[:, :, 1] * 0.8, 0, 1)
-            img_rgb[:, :, 2] = np.clip(img_rgb[:, :, 2] * intensity, 0, 1)
+            image_array = color.gray2rgb(image_array)
         
-        else:
-            logger.warning(f"未知的染色类型: {stain_type}，使用默认的IHC染色")
-            return self._virtual_staining(image_array, stain_type="ihc", intensity=intensity)
+        # 原地缩放，避免额外的整幅临时数组
+        img_rgb = image_array[:, :, :3].astype(np.float32)
+        img_rgb *= 1 / 255.0
         
-        return (img_rgb * 255).astype(np.uint8)
+        # 三个通道的缩放合并为一次(N, 3) @ (3, 3)矩阵乘，只遍历一遍图像
+        result = img_rgb.reshape(-1, 3) @ mix_matrix
+        np.clip(result, 0, 1, out=result)
+        result *= 255
+        
+        return result.reshape(img_rgb.shape).astype(np.uint8)
+    
+    def _stain_lut(self, stain_type: str, intensity: float, mix_matrix: np.ndarray) -> np.ndarray:
+        """
+        获取（必要时构建）虚拟染色的256x3查找表
+        与矩阵乘路径使用相同的float32计算，结果逐像素一致
+        
+        Args:
+            stain_type: 染色类型
+            intensity: 染色强度
+            mix_matrix: 对角颜色混合矩阵
+            
+        Returns:
+            lut[像素值, 通道] -> 染色后的像素值
+        """
+        key = (stain_type, intensity)
+        lut = self._stain_luts.get(key)
+        if lut is None:
+            levels = np.arange(256, dtype=np.float32)[:, None] / 255.0
+            lut = np.clip(levels * np.diag(mix_matrix), 0, 1)
+            lut = (lut * 255).astype(np.uint8)
+            self._stain_luts[key] = lut
+        return lut
+    
+    @staticmethod
+    def _stain_matrix(stain_type: str, intensity: float) -> Optional[np.ndarray]:
+        """
+        构建虚拟染色的3x3颜色混合矩阵（行向量RGB右乘该矩阵）
+        目前为对角矩阵，即逐通道缩放；可替换为真实的染色分离矩阵（如Ruifrok-Johnston）
+        
+        Args:
+            stain_type: 染色类型 ('ihc', 'he')
+            intensity: 染色强度
+            
+        Returns:
+            混合矩阵，未知染色类型返回None
+        """
+        stain_type = stain_type.lower()
+        if stain_type == "ihc":
+            # 模拟IHC染色（棕色染色）：增强红色和黄色通道
+            scales = [intensity, 0.8, 0.6]
+        elif stain_type == "he":
+            # 模拟HE染色（苏木精-伊红，蓝色和红色）：增强蓝色通道（核）和红色通道（细胞质）
+            scales = [0.9, 0.8, intensity]
+        else:
+            return None
+        return np.diag(scales).astype(np.float32)
     
     def batch_process(self, image_paths: List[str], output_dir: Optional[str] = None, 
-                     operations: Optional[Dict] = None) -> List[str]:
+                     operations: Optional[Dict] = None,
+                     max_workers: Optional[int] = None) -> List[str]:
         """
         批量处理图像
+        各图像互不依赖，在进程池中并行处理（去噪、归一化等计算受GIL限制，线程无法并行）
         
         Args:
             image_paths: 图像路径列表
             output_dir: 输出目录
             operations: 要执行的操作
+            max_workers: 最大进程数（默认使用配置batch_workers或CPU核数）
             
         Returns:
-            处理后的图像路径列表
+            处理后的图像路径列表（处理失败的图像被跳过，其余保持输入顺序）
         """
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        
+        # 确定输出路径
+        out_paths = [
+            os.path.join(output_dir, os.path.basename(img_path)) if output_dir else None
+            for img_path in image_paths
+        ]
+        
+        if max_workers is None:
+            max_workers = self.config.get("batch_workers") or os.cpu_count() or 1
+        max_workers = min(max_workers, len(image_paths))
+        
         result_paths = []
         
-        for img_path in image_paths:
-            try:
-                # 确定输出路径
-                if output_dir:
-                    os.makedirs(output_dir, exist_ok=True)
-                    base_name = os.path.basename(img_path)
-                    out_path = os.path.join(output_dir, base_name)
-                else:
-                    out_path = None
-                
-                # 处理图像
-                result_path = self.enhance_image(img_path, out_path, operations)
-                result_paths.append(result_path)
-                
-            except Exception as e:
-                logger.error(f"处理图像失败 {img_path}: {e}")
-                # 可以选择继续处理下一张图像或抛出异常
-                # raise
-        
-        return result_paths
\ No newline at end of file
+        # 单张图像或单进程时直接在当前进程处理，省去进程启动和序列化开销
+        if max_workers <= 1:
+            for img_path, out_path in zip(image_paths, out_paths):
+                try:
+                    result_paths.append(self.enhance_image(img_path, out_path, operations))
+                except Exception as e:
+                    logger.error(f"处理图像失败 {img_path}: {e}")
+            return result_paths
+        
+        # spawn启动子进程：Web进程中已有后台线程和打开的SQLite连接，fork后的子进程可能继承被占用的锁
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context('spawn')) as executor:
+            futures = [
+                executor.submit(_enhance_in_worker, self.config, img_path, out_path, operations)
+                for img_path, out_path in zip(image_paths, out_paths)
+            ]
+            for img_path, future in zip(image_paths, futures):
+                try:
+                    result_paths.append(future.result())
+                except Exception as e:
+                    logger.error(f"处理图像失败 {img_path}: {e}")
+                    # 可以选择继续处理下一张图像或抛出异常
+                    # raise
+        
+        return result_paths
+
+
+# 子进程内按配置复用的处理器实例
+_worker_enhancers = {}
+
+def _enhance_in_worker(config: Dict, image_path: str, output_path: Optional[str],
+                       operations: Optional[Dict]) -> str:
+    """
+    在子进程中增强单张图像
+    处理器含锁和缓存，不能随任务序列化，因此只传递配置并在子进程中构建
+    """
+    key = repr(sorted(config.items()))
+    enhancer = _worker_enhancers.get(key)
+    if enhancer is None:
+        enhancer = _worker_enhancers[key] = ImageQualityEnhancer(config)
+    return enhancer.enhance_image(image_path, output_path, operations)
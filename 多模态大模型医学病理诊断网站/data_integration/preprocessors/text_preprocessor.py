@@ -1,16 +1,71 @@
 """文本数据预处理模块"""
+import os
 import re
 import json
+import heapq
 import logging
-from typing import Dict, Optional, List, Union
-import jieba
-import jieba.analyse
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import islice
+from multiprocessing import get_context
+from operator import itemgetter
+from typing import Dict, FrozenSet, Iterator, Optional, List, Union
 import zhconv
 
+try:
+    # jieba_fast为C加速的jieba，接口相同
+    import jieba_fast as jieba
+    import jieba_fast.analyse
+except ImportError:  # jieba_fast为可选依赖，缺失时使用jieba
+    import jieba
+    import jieba.analyse
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 预编译的正则表达式
+_WHITESPACE_RE = re.compile(r'\s+')
+# 保留中文、英文、数字和部分医学符号
+_SPECIAL_CHARS_RE = re.compile(r'[^\u4e00-\u9fa5a-zA-Z0-9.+-/():,%]')
+# 同一规则的ASCII转换表：纯ASCII文本（如英文检验报告）走str.translate的ASCII快速路径，
+# 比正则快一个数量级；含中文的文本translate需逐字符查表，反而慢于正则，仍使用正则
+_SPECIAL_CHARS_ASCII_TABLE = {
+    cp: ' ' for cp in range(128) if _SPECIAL_CHARS_RE.match(chr(cp))
+}
+_NUMERIC_RE = re.compile(r'[\d.]+')
+_LAB_INDICATOR_RE = re.compile(r'([a-zA-Z0-9_]+)\s*[:：]\s*([\d.]+)')
+
+# 各文本类型的实体提取规则：(正则, 实体类型)
+# 每种文本类型的实体用一个具名分组的联合正则，一次扫描即可提取所有类别，分组名即实体类型
+_ENTITY_PATTERNS = {
+    "medical_record": re.compile(
+        r'(?P<disease>高血压|糖尿病|冠心病|肺炎|肿瘤|癌症)'
+        r'|(?P<symptom>头痛|发热|咳嗽|恶心|呕吐|胸闷|乏力)'
+    ),
+    "imaging_report": re.compile(r'(?P<finding>结节|肿块|阴影|积液|增厚|扩大|缩小)'),
+}
+
+
+@lru_cache(maxsize=1)
+def _zh_hans_trigger_re():
+    """
+    由zh-hans转换表所有词条的首字符构成的字符类正则
+    文本中不含这些字符时，zhconv不会替换任何内容，可以跳过转换
+    
+    Returns:
+        编译后的正则，无法读取转换表时返回None
+    """
+    try:
+        getdict = getattr(zhconv, 'getdict', None) or zhconv.zhconv.getdict
+        table = getdict('zh-hans')
+    except Exception as e:
+        logger.warning(f"读取繁简转换表失败，将对所有文本执行转换: {e}")
+        return None
+    chars = sorted({key[0] for key in table if key})
+    return re.compile('[' + ''.join(re.escape(char) for char in chars) + ']')
+
 
 class TextDataProcessor:
     """
@@ -26,8 +81,13 @@ class TextDataProcessor:
             config: 配置参数
         """
         self.config = config or {}
+        # 预先加载分词词典，避免首次分词时才构建前缀词典
+        jieba.initialize()
         # 加载停用词
         self.stopwords = self._load_stopwords(self.config.get('stopwords_path'))
+        # 关键词提取器只构建一次，默认停用词之外再合并本处理器的停用词
+        self._tfidf = jieba.analyse.TFIDF()
+        self._tfidf.stop_words = self._tfidf.stop_words | self.stopwords
         # 设置默认参数
         self.default_params = {
             "normalize_chinese": True,
@@ -49,8 +109,36 @@ class TextDataProcessor:
             "X光": "X线检查",
             "血常规": "血液常规检查"
         }
+        # 所有术语合并为一个正则，一次扫描完成替换
+        self._term_lookup, self._terms_re = self._compile_terms(self.medical_terms_map)
+    
+    @staticmethod
+    def _compile_terms(terms_map: Dict[str, str]):
+        """
+        把术语映射编译为单个替换正则
+        中文没有单词边界，不使用\\b；以英文字母开头或结尾的术语（如MRI、CT、X光）
+        在对应一侧要求不与其他英文字母相连。长术语优先，避免被其前缀抢先匹配。
+        英文部分忽略大小写，转小写后的文本同样能匹配
+        
+        Args:
+            terms_map: 术语到标准术语的映射
+            
+        Returns:
+            (小写术语到标准术语的映射, 编译后的正则)
+        """
+        alternatives = []
+        for term in sorted(terms_map, key=len, reverse=True):
+            pattern = re.escape(term)
+            if term[0].isascii() and term[0].isalpha():
+                pattern = r'(?<![A-Za-z])' + pattern
+            if term[-1].isascii() and term[-1].isalpha():
+                pattern += r'(?![A-Za-z])'
+            alternatives.append(pattern)
+        
+        lookup = {term.lower(): standardized for term, standardized in terms_map.items()}
+        return lookup, re.compile('|'.join(alternatives), re.IGNORECASE)
     
-    def _load_stopwords(self, stopwords_path: Optional[str] = None) -> List[str]:
+    def _load_stopwords(self, stopwords_path: Optional[str] = None) -> FrozenSet[str]:
         """
         加载停用词表
         
@@ -58,19 +146,19 @@ class TextDataProcessor:
             stopwords_path: 停用词表路径
             
         Returns:
-            停用词列表
+            停用词集合（逐词过滤时为O(1)查找）
         """
         # 默认停用词
-        default_stopwords = [
+        default_stopwords = frozenset([
             "的", "了", "和", "是", "在", "有", "我", "他", "她", "它", "这", "那", 
             "为", "以", "于", "由", "到", "对", "对于", "关于", "但", "而", "及", 
             "与", "或", "如果", "因为", "所以", "虽然", "但是", "不仅", "而且", "通过"
-        ]
+        ])
         
         if stopwords_path:
             try:
                 with open(stopwords_path, 'r', encoding='utf-8') as f:
-                    return [line.strip() for line in f if line.strip()]
+                    return frozenset(line.strip() for line in f if line.strip())
             except Exception as e:
                 logger.error(f"加载停用词表失败: {e}")
                 return default_stopwords
@@ -109,9 +197,11 @@ class TextDataProcessor:
         if operations.get("remove_extra_spaces", True):
             processed_text = self._remove_extra_spaces(processed_text)
         
-        # 中文规范化（繁转简）
+        # 中文规范化（繁转简），不含可转换字符的文本（简体、纯英文检验报告等）直接跳过
         if operations.get("normalize_chinese", True):
-            processed_text = zhconv.convert(processed_text, 'zh-hans')
+            trigger_re = _zh_hans_trigger_re()
+            if trigger_re is None or trigger_re.search(processed_text):
+                processed_text = zhconv.convert(processed_text, 'zh-hans')
         
         # 转小写
         if operations.get("lowercase", True):
@@ -120,7 +210,10 @@ class TextDataProcessor:
         # 去除特殊字符
         if operations.get("remove_special_chars", True):
             # 保留中文、英文、数字和部分医学符号
-            processed_text = re.sub(r'[^\u4e00-\u9fa5a-zA-Z0-9.+-/():,%]', ' ', processed_text)
+            if processed_text.isascii():
+                processed_text = processed_text.translate(_SPECIAL_CHARS_ASCII_TABLE)
+            else:
+                processed_text = _SPECIAL_CHARS_RE.sub(' ', processed_text)
         
         # 医学术语标准化
         if operations.get("standardize_terms", True):
@@ -131,15 +224,18 @@ class TextDataProcessor:
         if operations.get("extract_entities", True):
             entities = self._extract_medical_entities(processed_text, text_type)
         
+        # 分词，关键词提取复用同一份分词结果
+        tokens = []
+        segmented = None
+        if operations.get("tokenize", True) or operations.get("extract_keywords", True):
+            segmented = self._tokenize_text(processed_text)
+            if operations.get("tokenize", True):
+                tokens = segmented
+        
         # 提取关键词
         keywords = []
         if operations.get("extract_keywords", True):
-            keywords = self._extract_keywords(processed_text)
-        
-        # 分词
-        tokens = []
-        if operations.get("tokenize", True):
-            tokens = self._tokenize_text(processed_text)
+            keywords = self._extract_keywords(processed_text, tokens=segmented)
         
         # 去除停用词
         filtered_tokens = []
@@ -167,7 +263,7 @@ class TextDataProcessor:
             处理后的文本
         """
         # 替换多个空格为单个空格
-        text = re.sub(r'\s+', ' ', text)
+        text = _WHITESPACE_RE.sub(' ', text)
         # 去除首尾空格
         return text.strip()
     
@@ -181,12 +277,15 @@ class TextDataProcessor:
         Returns:
             标准化后的文本
         """
-        # 使用替换映射进行标准化
-        for term, standardized_term in self.medical_terms_map.items():
-            # 使用正则表达式进行精确匹配替换
-            text = re.sub(rf'\b{term}\b', standardized_term, text)
-        
-        return text
+        def replace(match):
+            standardized_term = self._term_lookup[match.group(0).lower()]
+            # 已经是标准写法（如"高血压病"中的"高血压"）时保持不变
+            if match.string.startswith(standardized_term, match.start()):
+                return match.group(0)
+            return standardized_term
+        
+        # 使用替换映射进行标准化，单次扫描
+        return self._terms_re.sub(replace, text)
     
     def _extract_medical_entities(self, text: str, text_type: str) -> List[Dict]:
         """
@@ -203,30 +302,19 @@ class TextDataProcessor:
         # 实际项目中可以使用NLP模型如BERT、CRF等进行实体识别
         entities = []
         
-        # 根据文本类型使用不同的实体提取策略
-        if text_type == "medical_record":
-            # 提取疾病名称（模拟）
-            diseases = re.findall(r'(高血压|糖尿病|冠心病|肺炎|肿瘤|癌症)', text)
-            for disease in diseases:
+        # 根据文本类型使用不同的实体提取策略，实体按在文本中出现的顺序返回
+        pattern = _ENTITY_PATTERNS.get(text_type)
+        if pattern is not None:
+            for match in pattern.finditer(text):
                 entities.append({
-                    "type": "disease",
-                    "value": disease,
-                    "source": "regex"
-                })
-            
-            # 提取症状（模拟）
-            symptoms = re.findall(r'(头痛|发热|咳嗽|恶心|呕吐|胸闷|乏力)', text)
-            for symptom in symptoms:
-                entities.append({
-                    "type": "symptom",
-                    "value": symptom,
+                    "type": match.lastgroup,
+                    "value": match.group(),
                     "source": "regex"
                 })
         
-        elif text_type == "lab_report":
+        if text_type == "lab_report":
             # 提取检验指标（模拟）
-            indicators = re.findall(r'([a-zA-Z0-9_]+)\s*[:：]\s*([\d.]+)', text)
-            for indicator, value in indicators:
+            for indicator, value in _LAB_INDICATOR_RE.findall(text):
                 entities.append({
                     "type": "lab_indicator",
                     "name": indicator,
@@ -234,44 +322,43 @@ class TextDataProcessor:
                     "source": "regex"
                 })
         
-        elif text_type == "imaging_report":
-            # 提取影像发现（模拟）
-            findings = re.findall(r'(结节|肿块|阴影|积液|增厚|扩大|缩小)', text)
-            for finding in findings:
-                entities.append({
-                    "type": "finding",
-                    "value": finding,
-                    "source": "regex"
-                })
-        
         return entities
     
-    def _extract_keywords(self, text: str, top_k: int = 10) -> List[str]:
+    def _extract_keywords(self, text: str, top_k: int = 10,
+                          tokens: Optional[List[str]] = None) -> List[str]:
         """
         提取关键词
+        按jieba.analyse的TF-IDF规则打分（词频 × IDF，未收录的词取IDF中位数），
+        直接使用已有的分词结果，不再对同一文本重复分词
         
         Args:
             text: 输入文本
             top_k: 提取的关键词数量
+            tokens: 文本的分词结果（为None时对text分词）
             
         Returns:
             关键词列表
         """
-        try:
-            # 使用TF-IDF提取关键词
-            keywords = jieba.analyse.extract_tags(text, topK=top_k)
-            return keywords
-        except Exception as e:
-            logger.error(f"关键词提取失败: {e}")
-            # 备用方案：使用简单的词频统计
-            words = jieba.lcut(text)
-            # 过滤停用词和单个字符
-            filtered_words = [word for word in words if word not in self.stopwords and len(word) > 1]
-            # 统计词频
-            from collections import Counter
-            word_counts = Counter(filtered_words)
-            # 返回频率最高的top_k个词
-            return [word for word, _ in word_counts.most_common(top_k)]
+        if tokens is None:
+            tokens = self._tokenize_text(text)
+        
+        # 过滤停用词和单个字符，规则与jieba.analyse.TFIDF一致
+        stop_words = self._tfidf.stop_words
+        word_counts = Counter(
+            word for word in tokens if len(word.strip()) > 1 and word.lower() not in stop_words
+        )
+        
+        idf_freq = self._tfidf.idf_freq
+        if idf_freq:
+            median_idf = self._tfidf.median_idf
+            scores = ((word, count * idf_freq.get(word, median_idf)) for word, count in word_counts.items())
+        else:
+            # 备用方案：IDF表为空时按词频排序
+            logger.warning("IDF词表为空，关键词按词频提取")
+            scores = word_counts.items()
+        
+        # 用堆取得分最高的top_k个词，不对全部词排序；得分相同时保持首次出现的顺序
+        return [word for word, _ in heapq.nlargest(top_k, scores, key=itemgetter(1))]
     
     def _tokenize_text(self, text: str) -> List[str]:
         """
@@ -290,37 +377,89 @@ class TextDataProcessor:
             # 备用方案：简单按字符分割
             return list(text)
     
-    def batch_process(self, texts: List[Dict], operations: Optional[Dict] = None) -> List[Dict]:
+    # 文本数量少于该值时不启用进程池（进程启动和jieba词典加载的开销大于收益）
+    PARALLEL_MIN_BATCH = 64
+    
+    def batch_process(self, texts: List[Dict], operations: Optional[Dict] = None,
+                      max_workers: Optional[int] = None) -> List[Dict]:
         """
         批量处理文本
         
         Args:
             texts: 文本数据列表，每项包含text和text_type
             operations: 处理操作参数
+            max_workers: 最大进程数（默认使用配置batch_workers或CPU核数）
             
         Returns:
-            处理结果列表
+            处理结果列表，顺序与texts一致
+        """
+        return list(self.iter_process(texts, operations, max_workers))
+    
+    def iter_process(self, texts: List[Dict], operations: Optional[Dict] = None,
+                     max_workers: Optional[int] = None) -> Iterator[Dict]:
         """
-        results = []
+        逐条产出批量文本的处理结果，调用方可以边处理边写出，不必持有全部结果
+        各文档互不依赖，批量较大时分块交给进程池处理（jieba分词为纯Python实现，受GIL限制），
+        同时在途的块数有上限，消费方较慢时不会在内存中堆积已完成的结果
         
-        for text_data in texts:
-            try:
-                text = text_data.get('text', '')
-                text_type = text_data.get('text_type', 'medical_record')
-                
-                result = self.process_medical_text(text, text_type, operations)
-                results.append(result)
-                
-            except Exception as e:
-                logger.error(f"处理文本失败: {e}")
-                # 添加错误标记的结果
-                results.append({
-                    "original": text_data.get('text', ''),
-                    "processed": None,
-                    "error": str(e)
-                })
+        Args:
+            texts: 文本数据列表，每项包含text和text_type
+            operations: 处理操作参数
+            max_workers: 最大进程数（默认使用配置batch_workers或CPU核数）
+            
+        Yields:
+            处理结果，顺序与texts一致
+        """
+        if max_workers is None:
+            max_workers = self.config.get("batch_workers") or os.cpu_count() or 1
+        
+        if max_workers <= 1 or len(texts) < self.PARALLEL_MIN_BATCH:
+            for text_data in texts:
+                yield self._process_text_item(text_data, operations)
+            return
+        
+        # 每个进程分到约4个块，兼顾负载均衡和进程间通信次数
+        chunksize = max(1, len(texts) // (4 * max_workers))
+        chunks = (texts[i:i + chunksize] for i in range(0, len(texts), chunksize))
+        pending = deque()
+        # spawn启动子进程，不继承Web进程中的线程和锁；工作进程状态由_init_text_worker重建
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context('spawn'),
+                                 initializer=_init_text_worker,
+                                 initargs=(self.config,)) as executor:
+            # 保持每个进程约两个块在途，既不让进程空闲，也不提前算完整个批量
+            for chunk in islice(chunks, 2 * max_workers):
+                pending.append(executor.submit(_process_text_chunk_in_worker, chunk, operations))
+            while pending:
+                results = pending.popleft().result()
+                for chunk in islice(chunks, 1):
+                    pending.append(executor.submit(_process_text_chunk_in_worker, chunk, operations))
+                yield from results
+    
+    def _process_text_item(self, text_data: Dict, operations: Optional[Dict] = None) -> Dict:
+        """
+        处理批量中的单条文本，失败时返回带错误标记的结果
         
-        return results
+        Args:
+            text_data: 包含text和text_type的文本数据
+            operations: 处理操作参数
+            
+        Returns:
+            处理结果
+        """
+        try:
+            text = text_data.get('text', '')
+            text_type = text_data.get('text_type', 'medical_record')
+            
+            return self.process_medical_text(text, text_type, operations)
+            
+        except Exception as e:
+            logger.error(f"处理文本失败: {e}")
+            # 添加错误标记的结果
+            return {
+                "original": text_data.get('text', ''),
+                "processed": None,
+                "error": str(e)
+            }
     
     def validate_text_format(self, text: str, expected_format: str = "medical_record") -> Dict:
         """
@@ -352,7 +491,7 @@ class TextDataProcessor:
         
         elif expected_format == "lab_report":
             # 检查是否包含数值结果（模拟）
-            if not re.search(r'[\d.]+', text):
+            if not _NUMERIC_RE.search(text):
                 errors.append("未发现检验数值结果")
                 is_valid = False
         
@@ -368,4 +507,17 @@ class TextDataProcessor:
             "errors": errors,
             "warnings": warnings,
             "text_length": len(text)
-        }
\ No newline at end of file
+        }
+
+
+# 子进程内复用的文本处理器，由进程池的initializer构建
+_worker_processor = None
+
+def _init_text_worker(config: Dict):
+    """进程池初始化函数：每个子进程只构建一次处理器（含停用词和术语正则）"""
+    global _worker_processor
+    _worker_processor = TextDataProcessor(config)
+
+def _process_text_chunk_in_worker(texts: List[Dict], operations: Optional[Dict]) -> List[Dict]:
+    """在子进程中处理一块文本"""
+    return [_worker_processor._process_text_item(text_data, operations) for text_data in texts]
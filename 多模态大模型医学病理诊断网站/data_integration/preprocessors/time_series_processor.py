@@ -5,11 +5,50 @@ import logging
 from typing import Dict, Optional, List, Union, Tuple
 from datetime import datetime, timedelta
 
+try:
+    import numba
+except ImportError:  # numba为可选依赖，缺失时Z-score异常检测使用NumPy实现
+    numba = None
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def _zscore_anomaly_kernel(arr, threshold, nan_is_anomaly, out):
+        """
+        Z-score异常标记内核，按列并行，每列在一次遍历中累计均值和标准差
+        忽略缺失值，标准差为样本标准差，为0或无法计算时按1处理
+        """
+        n, k = arr.shape
+        for j in numba.prange(k):
+            count = 0
+            mean = 0.0
+            m2 = 0.0
+            for i in range(n):
+                value = arr[i, j]
+                if not np.isnan(value):
+                    # Welford算法，单次遍历得到均值和平方差和
+                    count += 1
+                    delta = value - mean
+                    mean += delta / count
+                    m2 += delta * (value - mean)
+            std = np.sqrt(m2 / (count - 1)) if count > 1 else 0.0
+            if not std > 0.0:
+                std = 1.0
+            limit = threshold * std
+            for i in range(n):
+                value = arr[i, j]
+                if np.isnan(value):
+                    out[i, j] = nan_is_anomaly
+                else:
+                    out[i, j] = abs(value - mean) > limit
+else:
+    _zscore_anomaly_kernel = None
+
+
 class TimeSeriesProcessor:
     """
     时间序列数据处理器
@@ -89,8 +128,10 @@ class TimeSeriesProcessor:
         
         # 确保数据有时间索引
         if "timestamp" in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            df = df.set_index('timestamp').sort_index()
+            # 不写回timestamp列，避免修改调用方传入的DataFrame
+            timestamps = self._parse_timestamps(df['timestamp'], operations)
+            df = df.drop(columns='timestamp').set_index(
+                pd.DatetimeIndex(timestamps, name='timestamp')).sort_index()
         elif not isinstance(df.index, pd.DatetimeIndex):
             logger.error("数据缺少时间戳列或索引不是日期时间类型")
             return {"error": "数据缺少有效的时间戳"}
@@ -100,7 +141,8 @@ class TimeSeriesProcessor:
         
         # 处理数据
         result = {
-            "original_data": df.copy(),
+            # 后续各步骤都生成新的DataFrame而不修改df，无需复制
+            "original_data": df,
             "data_type": data_type,
             "processing_timestamp": datetime.now().isoformat()
         }
@@ -162,6 +204,37 @@ class TimeSeriesProcessor:
             logger.error("不支持的数据格式")
             return pd.DataFrame()
     
+    @staticmethod
+    def _parse_timestamps(timestamps: pd.Series, operations: Dict) -> pd.Series:
+        """
+        解析时间戳列，尽量走pandas的向量化解析而不是逐行推断格式
+        
+        Args:
+            timestamps: 时间戳列
+            operations: 处理操作参数，可通过timestamp_format指定格式，
+                        数值时间戳通过timestamp_unit指定单位（默认为秒）
+            
+        Returns:
+            日期时间类型的时间戳列
+        """
+        if pd.api.types.is_datetime64_any_dtype(timestamps):
+            return timestamps
+        
+        if pd.api.types.is_numeric_dtype(timestamps):
+            # 数值视为Unix时间戳
+            return pd.to_datetime(timestamps, unit=operations.get("timestamp_unit", "s"))
+        
+        fmt = operations.get("timestamp_format")
+        if fmt:
+            return pd.to_datetime(timestamps, format=fmt, cache=True)
+        
+        try:
+            # pandas 2.0起支持按ISO 8601整列解析
+            return pd.to_datetime(timestamps, format="ISO8601", cache=True)
+        except ValueError:
+            # 旧版pandas或非ISO格式，退回逐行推断
+            return pd.to_datetime(timestamps, cache=True)
+    
     def _clean_time_series(self, df: pd.DataFrame, data_type: str, 
                           data_config: Dict) -> pd.DataFrame:
         """
@@ -175,40 +248,36 @@ class TimeSeriesProcessor:
         Returns:
             清洗后的DataFrame
         """
-        # 创建副本以避免修改原始数据
-        cleaned_df = df.copy()
+        # 布尔索引本身返回新的DataFrame，先合并所有过滤条件，只做一次索引
+        mask = None
         
         # 根据数据类型进行特定的清洗
         if data_type == "blood_pressure":
             # 血压数据通常包含收缩压和舒张压
-            if "systolic" in cleaned_df.columns and "diastolic" in cleaned_df.columns:
+            if "systolic" in df.columns and "diastolic" in df.columns:
                 # 应用正常范围过滤
                 systolic_range = data_config.get("systolic_range", (60, 200))
                 diastolic_range = data_config.get("diastolic_range", (40, 130))
                 
-                # 设置收缩压和舒张压的有效范围
-                cleaned_df = cleaned_df[
-                    (cleaned_df["systolic"] >= systolic_range[0]) & 
-                    (cleaned_df["systolic"] <= systolic_range[1]) &
-                    (cleaned_df["diastolic"] >= diastolic_range[0]) & 
-                    (cleaned_df["diastolic"] <= diastolic_range[1])
-                ]
-                
-                # 确保收缩压大于舒张压
-                cleaned_df = cleaned_df[cleaned_df["systolic"] > cleaned_df["diastolic"]]
+                # 设置收缩压和舒张压的有效范围，并确保收缩压大于舒张压
+                mask = (
+                    df["systolic"].between(*systolic_range) &
+                    df["diastolic"].between(*diastolic_range) &
+                    (df["systolic"] > df["diastolic"])
+                )
         
         else:
             # 对于其他类型的数据，应用通用的范围过滤
             value_range = data_config.get("range", None)
             if value_range and len(df.columns) == 1:
-                value_col = df.columns[0]
-                cleaned_df = cleaned_df[
-                    (cleaned_df[value_col] >= value_range[0]) & 
-                    (cleaned_df[value_col] <= value_range[1])
-                ]
+                mask = df.iloc[:, 0].between(*value_range)
         
         # 移除重复的时间戳，保留最后一个值
-        cleaned_df = cleaned_df[~cleaned_df.index.duplicated(keep='last')]
+        if mask is None:
+            cleaned_df = df[~df.index.duplicated(keep='last')]
+        else:
+            cleaned_df = df.loc[mask.to_numpy()]
+            cleaned_df = cleaned_df[~cleaned_df.index.duplicated(keep='last')]
         
         # 检查数据点数量是否达到最小要求
         min_points = self.default_params["min_data_points"]
@@ -228,10 +297,11 @@ class TimeSeriesProcessor:
         Returns:
             处理后的DataFrame
         """
-        # 使用Z-score方法识别异常值
-        z_scores = np.abs((df - df.mean()) / df.std())
-        # 保留Z-score小于阈值的数据点
-        filtered_df = df[(z_scores < threshold).all(axis=1)]
+        # 使用Z-score方法识别异常值，直接在底层数组上计算，避免生成中间DataFrame
+        arr = df.to_numpy(dtype=np.float64, copy=False)
+        # 保留所有列都不是异常值的数据点（含缺失值的行与原实现一致被移除）
+        anomalies = self._zscore_anomalies(arr, threshold, nan_is_anomaly=True)
+        filtered_df = df.iloc[~anomalies.any(axis=1)]
         
         outliers_removed = len(df) - len(filtered_df)
         if outliers_removed > 0:
@@ -239,6 +309,34 @@ class TimeSeriesProcessor:
         
         return filtered_df
     
+    @staticmethod
+    def _zscore_anomalies(arr: np.ndarray, threshold: float,
+                          nan_is_anomaly: bool = False) -> np.ndarray:
+        """
+        按列标记偏离均值超过阈值倍标准差的元素
+        
+        Args:
+            arr: 二维数值数组
+            threshold: 标准差阈值
+            nan_is_anomaly: 缺失值是否视为异常
+            
+        Returns:
+            与arr形状相同的布尔数组，标准差为0或无法计算的列按1处理，避免除零
+        """
+        if _zscore_anomaly_kernel is not None:
+            out = np.empty(arr.shape, dtype=np.bool_)
+            _zscore_anomaly_kernel(arr, float(threshold), nan_is_anomaly, out)
+            return out
+        
+        with np.errstate(invalid='ignore'):
+            mean = np.nanmean(arr, axis=0)
+            std = np.nanstd(arr, axis=0, ddof=1)
+        std[~(std > 0)] = 1.0
+        out = np.abs(arr - mean) > threshold * std
+        if nan_is_anomaly:
+            out |= np.isnan(arr)
+        return out
+    
     def _fill_missing_values(self, df: pd.DataFrame, method: str = "linear") -> pd.DataFrame:
         """
         填充缺失值
@@ -250,28 +348,61 @@ class TimeSeriesProcessor:
         Returns:
             处理后的DataFrame
         """
-        filled_df = df.copy()
-        
+        # 各填充方法都返回新的DataFrame，无需预先复制输入
         if method == "linear":
             # 线性插值
-            filled_df = filled_df.interpolate(method='linear')
+            filled_df = df.interpolate(method='linear')
         elif method == "ffill":
             # 前向填充
-            filled_df = filled_df.ffill()
+            filled_df = df.ffill()
         elif method == "bfill":
             # 后向填充
-            filled_df = filled_df.bfill()
+            filled_df = df.bfill()
         elif method == "mean":
             # 使用列均值填充
-            filled_df = filled_df.fillna(filled_df.mean())
+            filled_df = df.fillna(df.mean())
         else:
             logger.warning(f"未知的填充方法: {method}，使用线性插值")
-            filled_df = filled_df.interpolate(method='linear')
+            filled_df = df.interpolate(method='linear')
         
-        # 处理边界处的缺失值
-        filled_df = filled_df.fillna(method='bfill').fillna(method='ffill')
+        # 处理边界处的缺失值：先后向填充，剩余的再前向填充
+        return self._fill_edges(filled_df)
+    
+    @staticmethod
+    def _fill_edges(df: pd.DataFrame) -> pd.DataFrame:
+        """
+        用后向填充、再前向填充的方式补齐剩余缺失值，在NumPy上一次完成
         
-        return filled_df
+        Args:
+            df: 输入DataFrame
+            
+        Returns:
+            填充后的DataFrame，没有缺失值时原样返回
+        """
+        try:
+            arr = df.to_numpy(dtype=np.float64, copy=False)
+        except (TypeError, ValueError):
+            # 含非数值列时交给pandas处理
+            return df.bfill().ffill()
+        
+        missing = np.isnan(arr)
+        if not missing.any():
+            return df
+        
+        n = arr.shape[0]
+        rows = np.arange(n)[:, None]
+        # 每个位置之后（含自身）最近的有效行号，不存在时为n
+        next_valid = np.where(missing, n, rows)
+        next_valid = np.minimum.accumulate(next_valid[::-1], axis=0)[::-1]
+        # 每个位置之前（含自身）最近的有效行号，不存在时为-1
+        prev_valid = np.where(missing, -1, rows)
+        np.maximum.accumulate(prev_valid, axis=0, out=prev_valid)
+        
+        source = np.where(next_valid < n, next_valid, prev_valid)
+        filled = arr[np.maximum(source, 0), np.arange(arr.shape[1])]
+        # 整列缺失时保持缺失
+        filled[source < 0] = np.nan
+        return pd.DataFrame(filled, index=df.index, columns=df.columns)
     
     def _resample_data(self, df: pd.DataFrame, freq: str = "1H") -> pd.DataFrame:
         """
@@ -285,12 +416,66 @@ class TimeSeriesProcessor:
             重采样后的DataFrame
         """
         # 重采样，使用均值作为聚合函数
-        resampled_df = df.resample(freq).mean()
+        resampled_df = self._resample_mean(df, freq)
+        if resampled_df is None:
+            resampled_df = df.resample(freq).mean()
         
         logger.info(f"数据从 {len(df)} 个时间点重采样到 {len(resampled_df)} 个时间点，频率: {freq}")
         
         return resampled_df
     
+    @staticmethod
+    def _resample_mean(df: pd.DataFrame, freq: str) -> Optional[pd.DataFrame]:
+        """
+        固定频率的均值重采样：用searchsorted划分区间，np.add.reduceat按区间求和
+        分箱规则与df.resample(freq).mean()一致（左闭右开、左端点标记、以首日零点为起点），
+        缺失值不计入均值，空区间结果为NaN
+        
+        Args:
+            df: 按时间升序排列的DataFrame
+            freq: 重采样频率
+            
+        Returns:
+            重采样后的DataFrame；频率不是固定时长、索引带时区或未排序、含非数值列时返回None，
+            由调用方改用pandas重采样
+        """
+        try:
+            offset = pd.tseries.frequencies.to_offset(freq)
+        except ValueError:
+            return None
+        index = df.index
+        if (not isinstance(offset, pd.tseries.offsets.Tick) or len(df) == 0
+                or index.tz is not None or not index.is_monotonic_increasing):
+            return None
+        try:
+            values = df.to_numpy(dtype=np.float64, copy=False)
+        except (TypeError, ValueError):
+            return None
+        
+        step = offset.nanos
+        # pandas 2.0起索引精度不一定是纳秒，统一换算为纳秒整数
+        timestamps = index.to_numpy(dtype='datetime64[ns]').view(np.int64)
+        # 区间起点对齐到首个时间点所在日期的零点
+        day = 24 * 3600 * 10 ** 9
+        origin = timestamps[0] - timestamps[0] % day
+        first = origin + (timestamps[0] - origin) // step * step
+        last = origin + (timestamps[-1] - origin) // step * step
+        edges = np.arange(first, last + step, step, dtype=np.int64)
+        starts = np.searchsorted(timestamps, edges, side='left')
+        
+        valid = ~np.isnan(values)
+        sums = np.add.reduceat(np.where(valid, values, 0.0), starts, axis=0)
+        counts = np.add.reduceat(valid.astype(np.int64), starts, axis=0)
+        # reduceat对空区间返回起点处的值而不是0，按区间长度修正
+        empty = np.diff(np.append(starts, len(timestamps))) == 0
+        counts[empty] = 0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = np.where(counts > 0, sums / counts, np.nan)
+        
+        return pd.DataFrame(means, index=pd.DatetimeIndex(edges.view('datetime64[ns]'), freq=offset,
+                                                          name=index.name),
+                            columns=df.columns)
+    
     def _calculate_time_series_features(self, df: pd.DataFrame, data_type: str) -> Dict:
         """
         计算时间序列特征
@@ -315,19 +500,16 @@ class TimeSeriesProcessor:
         }
         
         # 趋势特征
-        # 计算线性趋势斜率
-        for col in df.columns:
-            # 使用线性回归计算趋势
-            try:
-                from scipy import stats
-                x = np.arange(len(df))
-                slope, _, r_value, _, _ = stats.linregress(x, df[col].values)
+        # 所有列一次性用最小二乘闭式解计算线性趋势斜率
+        if len(df) >= 2:
+            slopes, r_squared = self._linear_trends(df.to_numpy(dtype=np.float64, copy=False))
+            for i, col in enumerate(df.columns):
                 features[f"{col}_trend"] = {
-                    "slope": slope,
-                    "r_squared": r_value ** 2
+                    "slope": float(slopes[i]),
+                    "r_squared": float(r_squared[i])
                 }
-            except Exception as e:
-                logger.warning(f"计算 {col} 的趋势特征失败: {e}")
+        else:
+            logger.warning(f"数据点数量 {len(df)} 不足，无法计算趋势特征")
         
         # 波动性特征
         features["volatility"] = {
@@ -353,6 +535,29 @@ class TimeSeriesProcessor:
         
         return features
     
+    @staticmethod
+    def _linear_trends(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        对每一列按样本序号做一元线性回归
+        
+        Args:
+            values: 二维数值数组（行为时间点，列为指标）
+            
+        Returns:
+            (斜率, 决定系数R²)，含缺失值的列结果为NaN，常数列R²为0
+        """
+        x = np.arange(values.shape[0], dtype=np.float64)
+        x_dev = (x - x.mean())[:, None]
+        y_dev = values - values.mean(axis=0)
+        
+        slopes = (x_dev * y_dev).sum(axis=0) / (x_dev * x_dev).sum()
+        ss_res = ((y_dev - slopes * x_dev) ** 2).sum(axis=0)
+        ss_tot = (y_dev * y_dev).sum(axis=0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r_squared = np.where(ss_tot > 0, 1.0 - ss_res / ss_tot, 0.0)
+        r_squared[np.isnan(ss_tot)] = np.nan
+        return slopes, r_squared
+    
     def _assess_data_quality(self, df: pd.DataFrame, data_config: Dict) -> Dict:
         """
         评估数据质量
@@ -381,14 +586,16 @@ class TimeSeriesProcessor:
         
         # 评估数据的时间分布均匀性
         if len(df) > 1:
-            # 计算时间间隔的标准差
-            time_diffs = df.index.to_series().diff().dropna()
+            # 直接在纳秒整数时间戳上计算时间间隔的均值和标准差
+            # （pandas 2的索引可能是秒/毫秒精度，asi8的单位随之变化，先统一为纳秒）
+            timestamps = df.index.to_numpy(dtype='datetime64[ns]').view(np.int64)
+            time_diffs = np.diff(timestamps).astype(np.float64)
             avg_interval = time_diffs.mean()
-            std_interval = time_diffs.std()
+            std_interval = time_diffs.std(ddof=1) if len(time_diffs) > 1 else np.nan
             # 计算变异系数（标准差/均值）作为均匀性指标
-            cv_interval = std_interval / avg_interval if avg_interval.total_seconds() > 0 else 0
+            cv_interval = std_interval / avg_interval if avg_interval > 0 else 0
             quality["temporal_uniformity"] = {
-                "average_interval_seconds": avg_interval.total_seconds(),
+                "average_interval_seconds": avg_interval / 1e9,
                 "interval_cv": cv_interval
             }
         
@@ -412,24 +619,27 @@ class TimeSeriesProcessor:
         
         result_df = df.copy()
         
-        for col in df.columns:
-            if method == "zscore":
-                # Z-score方法
-                threshold = params.get("threshold", 3.0)
-                z_scores = np.abs((df[col] - df[col].mean()) / df[col].std())
-                result_df[f"{col}_is_anomaly"] = z_scores > threshold
-            
-            elif method == "iqr":
-                # IQR方法（四分位距）
-                factor = params.get("factor", 1.5)
-                Q1 = df[col].quantile(0.25)
-                Q3 = df[col].quantile(0.75)
-                IQR = Q3 - Q1
-                lower_bound = Q1 - factor * IQR
-                upper_bound = Q3 + factor * IQR
-                result_df[f"{col}_is_anomaly"] = (df[col] < lower_bound) | (df[col] > upper_bound)
-            
-            else:
-                logger.warning(f"未知的异常检测方法: {method}")
+        if method == "zscore":
+            # Z-score方法，所有列一次性在底层数组上计算
+            threshold = params.get("threshold", 3.0)
+            anomalies = self._zscore_anomalies(df.to_numpy(dtype=np.float64, copy=False), threshold)
+        
+        elif method == "iqr":
+            # IQR方法（四分位距），所有列的四分位数一次算出
+            factor = params.get("factor", 1.5)
+            arr = df.to_numpy(dtype=np.float64, copy=False)
+            with np.errstate(invalid='ignore'):
+                Q1, Q3 = np.nanquantile(arr, [0.25, 0.75], axis=0)
+            IQR = Q3 - Q1
+            lower_bound = Q1 - factor * IQR
+            upper_bound = Q3 + factor * IQR
+            anomalies = (arr < lower_bound) | (arr > upper_bound)
+        
+        else:
+            logger.warning(f"未知的异常检测方法: {method}")
+            return result_df
+        
+        for i, col in enumerate(df.columns):
+            result_df[f"{col}_is_anomaly"] = anomalies[:, i]
         
-        return result_df
\ No newline at end of file
+        return result_df
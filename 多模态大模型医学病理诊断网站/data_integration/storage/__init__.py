@@ -7,7 +7,8 @@
 from .image_storage import ImageStorageManager
 from .document_storage import DocumentStorageManager
 from .metadata_index import MetadataIndexManager
-from .retrieval_engine import MultiModalRetrievalEngine
+from .retrieval_engine import MultiModalRetrievalEngine, BatchingSearcher
+from .vector_index import Int8VectorIndex, quantize_int8
 from .storage_factory import StorageFactory
 
 __all__ = [
@@ -15,6 +16,9 @@ __all__ = [
     'DocumentStorageManager', 
     'MetadataIndexManager',
     'MultiModalRetrievalEngine',
+    'BatchingSearcher',
+    'Int8VectorIndex',
+    'quantize_int8',
     'StorageFactory'
 ]
 
@@ -6,16 +6,108 @@
 import os
 import json
 import uuid
+import sqlite3
 import logging
 import hashlib
+import threading
+from collections import Counter, OrderedDict, deque
 from datetime import datetime
+from itertools import islice
 from typing import Dict, Optional, List, Any
 import re
 
+try:
+    import fcntl
+except ImportError:  # Windows上没有fcntl，段文件只在进程内加锁
+    fcntl = None
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 文档内容追加写入的段文件，写满后轮转到新段
+SEGMENT_DIR = 'segments'
+DEFAULT_SEGMENT_MAX_BYTES = 1 << 30  # 1GB
+_SEGMENT_NAME_RE = re.compile(r'^seg-(\d+)\.dat$')
+# 单次writev提交的缓冲区数量上限（Linux的IOV_MAX）
+_WRITEV_MAX_BUFFERS = 1024
+# 段文件中不再被引用的字节达到该比例时才重写（压缩）
+DEFAULT_COMPACT_DEAD_RATIO = 0.5
+
+# 关键词提取：长度不少于3的单词，过滤常见英文停用词
+_KEYWORD_RE = re.compile(r'\b\w{3,}\b')
+_KEYWORD_STOP_WORDS = frozenset({
+    'the', 'and', 'is', 'in', 'to', 'of', 'a', 'with', 'for', 'on', 'are',
+    'as', 'by', 'this', 'from', 'that', 'have', 'it', 'at', 'be', 'or',
+    'which', 'an', 'but', 'not', 'has', 'all', 'were', 'when', 'been'
+})
+MAX_KEYWORDS = 50
+# 文档分块时优先切分的句子边界字符
+_SENTENCE_BOUNDARIES = ('.', '?', '!', '\n')
+# 未启用全文索引时倒排表的查询词切分
+_QUERY_TERM_RE = re.compile(r'\b\w+\b')
+
+# 全文索引分词：连续的汉字为一段，其余按单词切分
+_FULLTEXT_TOKEN_RE = re.compile(r'[\u4e00-\u9fff]+|[^\W\u4e00-\u9fff]+')
+# 全文索引格式版本（保存在PRAGMA user_version），检索单元的切分方式变化时递增以触发重建
+FULLTEXT_INDEX_VERSION = 2
+
+
+def _is_cjk(token: str) -> bool:
+    """判断词是否为汉字段"""
+    return '\u4e00' <= token[0] <= '\u9fff'
+
+
+def _fulltext_segments(text: str, index: bool = False) -> List[List[str]]:
+    """
+    把文本切分为全文索引的检索单元
+    FTS5的unicode61分词器会把一整段连续汉字当作一个词，无法检索其中的部分词语，
+    因此汉字段切为重叠的二元组（单字保持不变），查询时以短语匹配连续的二元组，
+    效果等同于子串匹配；其他单词转小写。
+    写入索引时汉字段末尾再追加最后一个字，使每个字都是某个检索单元的首字，
+    单字查询用前缀匹配即可命中
+    
+    Args:
+        text: 输入文本
+        index: 是否为写入索引切分（追加汉字段末字）
+        
+    Returns:
+        每个词对应的检索单元列表
+    """
+    segments = []
+    for token in _FULLTEXT_TOKEN_RE.findall(text):
+        if _is_cjk(token):
+            units = [token[i:i + 2] for i in range(len(token) - 1)] or [token]
+            if index and len(token) > 1:
+                units.append(token[-1])
+            segments.append(units)
+        else:
+            segments.append([token.lower()])
+    return segments
+
+
+def _fulltext_text(text: str) -> str:
+    """把文本转换为写入全文索引的空格分隔检索单元"""
+    return ' '.join(unit for segment in _fulltext_segments(text, index=True) for unit in segment)
+
+
+def _fulltext_query(query_text: str) -> str:
+    """
+    把查询文本转换为FTS5的MATCH表达式，任一查询词命中即匹配
+    检索单元只含单词字符，用双引号包成短语即可安全转义；单个汉字使用前缀匹配
+    """
+    terms = []
+    for segment in _fulltext_segments(query_text):
+        if len(segment) == 1 and len(segment[0]) == 1 and _is_cjk(segment[0]):
+            terms.append(f'"{segment[0]}"*')
+        else:
+            terms.append(f'"{" ".join(segment)}"')
+    return ' OR '.join(terms)
+
+
+class _StaleContentError(Exception):
+    """复用的段文件内容在写入元数据前已被释放或迁移"""
+
 
 class DocumentStorageManager:
     """
@@ -33,19 +125,188 @@ class DocumentStorageManager:
                 - index_path: 索引存储路径
                 - supported_formats: 支持的文档格式列表
                 - chunk_size: 文档分块大小（字符数）
+                - segment_max_bytes: 单个段文件的大小上限（字节）
+                - deduplicate_content: 内容相同的文档是否共用段文件中的同一份内容
         """
         self.config = config
         self.storage_path = config.get('storage_path', './data/documents')
         self.index_path = config.get('index_path', './data/indexes')
         self.supported_formats = config.get('supported_formats', ['txt', 'json', 'xml', 'pdf', 'docx'])
         self.chunk_size = config.get('chunk_size', 1000)
+        self.metadata_cache_size = config.get('metadata_cache_size', 4096)
+        self.segment_path = os.path.join(self.storage_path, SEGMENT_DIR)
+        self.segment_max_bytes = config.get('segment_max_bytes', DEFAULT_SEGMENT_MAX_BYTES)
+        self.deduplicate_content = config.get('deduplicate_content', True)
         
         # 创建必要的目录
         os.makedirs(self.storage_path, exist_ok=True)
         os.makedirs(self.index_path, exist_ok=True)
+        os.makedirs(self.segment_path, exist_ok=True)
+        
+        # 文档内容追加写入段文件，元数据目录中记录 (段号, 偏移, 长度)，
+        # 不再为每个文档单独创建文件
+        self._segment_lock = threading.Lock()
+        self._segment_id = self._latest_segment_id()
+        
+        # 文档元数据目录（SQLite），列表、过滤和统计都由SQL完成，不再逐个读取元数据文件
+        self._db_lock = threading.Lock()
+        # 最近读取的元数据（LRU），与数据库共用self._db_lock
+        self._metadata_cache = OrderedDict()
+        # 目录的PRAGMA data_version，变化说明其他进程修改过目录，缓存需要失效
+        self._data_version = None
+        # 全文索引（FTS5倒排索引），SQLite未编译FTS5时使用内存中的倒排表
+        self._fulltext_enabled = False
+        # 内存倒排表：词 -> {文档ID: 得分}（标题命中2分，关键词命中1分），首次搜索时由索引文件构建
+        self._postings = None
+        self._posting_terms = {}
+        self._postings_lock = threading.Lock()
+        self._db = self._open_catalog(os.path.join(self.index_path, 'catalog.db'))
         
         logger.info(f"文档存储管理器初始化完成，存储路径: {self.storage_path}")
     
+    def _open_catalog(self, db_path: str) -> sqlite3.Connection:
+        """
+        打开文档元数据目录，首次创建时导入旧版的逐文档元数据文件
+        
+        Args:
+            db_path: 数据库文件路径
+            
+        Returns:
+            数据库连接（多线程共享，访问时需持有self._db_lock）
+        """
+        db = sqlite3.connect(db_path, check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        with db:
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS documents (
+                    id TEXT PRIMARY KEY,
+                    document_type TEXT,
+                    format TEXT,
+                    file_path TEXT,
+                    content_size INTEGER,
+                    content_hash TEXT,
+                    storage_date TEXT,
+                    metadata TEXT
+                )
+            ''')
+            db.execute('CREATE INDEX IF NOT EXISTS idx_documents_type ON documents(document_type)')
+            db.execute('CREATE INDEX IF NOT EXISTS idx_documents_date ON documents(storage_date)')
+            db.execute('CREATE INDEX IF NOT EXISTS idx_documents_hash ON documents(content_hash)')
+            # 每个段文件中不再被任何文档引用的字节数，用于判断是否需要压缩
+            db.execute('''
+                CREATE TABLE IF NOT EXISTS segments (
+                    id INTEGER PRIMARY KEY,
+                    dead_bytes INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+        
+        if db.execute('SELECT 1 FROM documents LIMIT 1').fetchone() is None:
+            self._import_legacy_metadata(db)
+        
+        fulltext_exists = db.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'doc_fts'").fetchone() is not None
+        fulltext_current = db.execute('PRAGMA user_version').fetchone()[0] >= FULLTEXT_INDEX_VERSION
+        try:
+            with db:
+                db.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS doc_fts
+                    USING fts5(doc_id UNINDEXED, title, keywords, content, tokenize='unicode61')
+                ''')
+            self._fulltext_enabled = True
+        except sqlite3.OperationalError as e:
+            logger.warning(f"SQLite不支持FTS5，全文检索将使用内存倒排表: {e}")
+        
+        if self._fulltext_enabled and not (fulltext_exists and fulltext_current):
+            self._rebuild_fulltext_index(db)
+        return db
+    
+    def _rebuild_fulltext_index(self, db: sqlite3.Connection):
+        """
+        为目录中已有的文档重建全文索引（从旧版数据目录或旧版索引格式升级时）
+        
+        Args:
+            db: 数据库连接
+        """
+        rows = []
+        for document_id, raw_metadata in db.execute('SELECT id, metadata FROM documents'):
+            try:
+                metadata = json.loads(raw_metadata)
+                content = self._read_content(metadata)
+                rows.append(self._fulltext_row(document_id, content, metadata.get('metadata', {})))
+            except Exception as e:
+                logger.warning(f"为文档 {document_id} 建立全文索引失败: {e}")
+        
+        with db:
+            db.execute('DELETE FROM doc_fts')
+            db.executemany('INSERT INTO doc_fts VALUES (?, ?, ?, ?)', rows)
+            db.execute(f'PRAGMA user_version = {FULLTEXT_INDEX_VERSION}')
+        if rows:
+            logger.info(f"已为 {len(rows)} 个文档建立全文索引")
+    
+    def _fulltext_row(self, document_id: str, content: str, metadata: Dict) -> tuple:
+        """
+        构建doc_fts表的一行
+        
+        Args:
+            document_id: 文档唯一标识符
+            content: 文档内容
+            metadata: 文档元数据
+            
+        Returns:
+            与doc_fts表列顺序一致的元组
+        """
+        return (
+            document_id,
+            _fulltext_text(metadata.get('title', '')),
+            _fulltext_text(' '.join(self._extract_keywords(content))),
+            _fulltext_text(content)
+        )
+    
+    def _import_legacy_metadata(self, db: sqlite3.Connection):
+        """
+        把旧版保存在index_path下的 <id>_metadata.json 导入元数据目录
+        
+        Args:
+            db: 数据库连接
+        """
+        rows = []
+        for file_name in os.listdir(self.index_path):
+            if not file_name.endswith('_metadata.json'):
+                continue
+            try:
+                with open(os.path.join(self.index_path, file_name), 'r', encoding='utf-8') as f:
+                    rows.append(self._metadata_row(json.load(f)))
+            except Exception as e:
+                logger.warning(f"导入元数据文件 {file_name} 失败: {e}")
+        
+        if rows:
+            with db:
+                db.executemany('INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            logger.info(f"已将 {len(rows)} 个元数据文件导入文档目录")
+    
+    @staticmethod
+    def _metadata_row(metadata: Dict) -> tuple:
+        """
+        把元数据字典转换为documents表的一行，完整元数据以JSON保存在metadata列
+        
+        Args:
+            metadata: 元数据字典
+            
+        Returns:
+            与documents表列顺序一致的元组
+        """
+        return (
+            metadata['id'],
+            metadata.get('document_type', 'general'),
+            metadata.get('format', 'txt'),
+            metadata.get('file_path'),
+            metadata.get('content_size', 0),
+            metadata.get('content_hash'),
+            metadata.get('storage_date'),
+            json.dumps(metadata, ensure_ascii=False)
+        )
+    
     def store_document(self, content: str, metadata: Dict, document_type: str = 'report', 
                       format_type: str = 'txt') -> str:
         """
@@ -60,70 +321,356 @@ class DocumentStorageManager:
         Returns:
             文档的唯一标识符（UUID）
         """
+        return self.store_documents_batch([{
+            'content': content,
+            'metadata': metadata,
+            'document_type': document_type,
+            'format_type': format_type
+        }])[0]
+    
+    def store_documents_batch(self, documents: List[Dict]) -> List[str]:
+        """
+        批量存储文档
+        整批内容一次追加到段文件，元数据和全文索引在同一个数据库事务中写入，只提交一次；
+        任一文档失败时整批都不会写入元数据目录
+        
+        Args:
+            documents: 文档列表，每项包含content、metadata，可选document_type（默认'report'）
+                       和format_type（默认'txt'）
+            
+        Returns:
+            文档的唯一标识符列表，顺序与documents一致
+        """
+        entries = [
+            self._prepare_document(
+                document['content'],
+                document.get('metadata', {}),
+                document.get('document_type', 'report'),
+                document.get('format_type', 'txt')
+            )
+            for document in documents
+        ]
+        
+        try:
+            try:
+                self._store_entries(entries, self.deduplicate_content)
+            except _StaleContentError:
+                # 复用的内容在提交前被删除或压缩迁移，整批改为全部追加写入
+                logger.info("复用的文档内容已被释放，重新写入内容")
+                self._store_entries(entries, False)
+        except Exception as e:
+            # 已追加的内容没有元数据引用，不会被读取
+            logger.error(f"存储文档失败: {e}")
+            raise
+        
+        document_ids = [full_metadata['id'] for full_metadata, _, _ in entries]
+        if len(document_ids) == 1:
+            logger.info(f"文档 {document_ids[0]} 存储成功")
+        else:
+            logger.info(f"{len(document_ids)} 个文档存储成功")
+        return document_ids
+    
+    def _store_entries(self, entries: List[tuple], deduplicate: bool):
+        """
+        为一批文档写入内容并提交元数据
+        
+        Args:
+            entries: _prepare_document生成的 (完整元数据, 文档内容, UTF-8编码的内容) 列表
+            deduplicate: 是否复用段文件中已存储的相同内容
+        """
+        # 内容已存储过的文档直接引用已有位置，其余整批一次追加到段文件
+        pending = []
+        reused = []
+        stored = {}
+        for full_metadata, _, data in entries:
+            content_hash = full_metadata['content_hash']
+            if content_hash in stored:
+                # 同一批中重复的内容，写入后再填充位置
+                full_metadata['segment'] = stored[content_hash]
+                continue
+            location = self._find_stored_content(content_hash) if deduplicate else None
+            if location is None:
+                location = {}
+                pending.append((location, data))
+            else:
+                reused.append((content_hash, location))
+            full_metadata['segment'] = location
+            stored[content_hash] = location
+        
+        locations = self._append_to_segment([data for _, data in pending])
+        for (location, _), written in zip(pending, locations):
+            location.update(written)
+        self._commit_documents([(full_metadata, content) for full_metadata, content, _ in entries], reused)
+    
+    def _find_stored_content(self, content_hash: str) -> Optional[Dict]:
+        """
+        按内容哈希查找段文件中已存储的相同内容（只复用段文件中的内容，
+        旧版单独存放的文件会随文档删除，不能共用）
+        
+        Args:
+            content_hash: 内容的SHA-256摘要
+            
+        Returns:
+            内容位置 {'id': 段号, 'offset': 偏移, 'length': 长度}，不存在时返回None
+        """
+        with self._db_lock:
+            row = self._db.execute(
+                'SELECT metadata FROM documents WHERE content_hash = ? AND file_path IS NULL LIMIT 1',
+                (content_hash,)).fetchone()
+        if row is None:
+            return None
+        location = json.loads(row[0]).get('segment')
+        return dict(location) if location else None
+    
+    def _prepare_document(self, content: str, metadata: Dict, document_type: str,
+                          format_type: str) -> tuple:
+        """
+        校验文档并生成完整元数据（段文件位置在写入后填充）
+        
+        Args:
+            content: 文档内容
+            metadata: 文档元数据
+            document_type: 文档类型
+            format_type: 文档格式类型
+            
+        Returns:
+            (完整元数据, 文档内容, UTF-8编码的内容)
+        """
         # 生成唯一标识符
         document_id = str(uuid.uuid4())
         
         # 验证格式
         if format_type not in self.supported_formats:
             raise ValueError(f"不支持的文档格式: {format_type}")
+        if format_type not in ('txt', 'json'):
+            # 对于其他格式，目前仍然以文本方式保存（json假设内容已经是JSON字符串）
+            logger.warning(f"格式 {format_type} 未实现专用保存逻辑，以文本方式保存")
         
         # 计算内容哈希值以检查重复
-        content_hash = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        data, content_hash = self._encode_content(content)
         
-        # 创建存储子目录（基于文档类型）
-        type_dir = os.path.join(self.storage_path, document_type)
-        os.makedirs(type_dir, exist_ok=True)
+        # 准备元数据
+        full_metadata = {
+            'id': document_id,
+            'document_type': document_type,
+            'format': format_type,
+            'file_name': f"{document_id}.{format_type}",
+            'file_path': None,
+            'content_size': len(content),
+            'content_hash': content_hash,
+            'storage_date': datetime.now().isoformat(),
+            'metadata': metadata
+        }
+        return full_metadata, content, data
+    
+    @staticmethod
+    def _encode_content(content: str) -> tuple:
+        """
+        把文档内容编码为UTF-8并计算哈希，编码结果同时用于哈希和写入，只生成一份副本
         
-        # 保存文档文件
-        file_name = f"{document_id}.{format_type}"
-        file_path = os.path.join(type_dir, file_name)
+        Args:
+            content: 文档内容
+            
+        Returns:
+            (UTF-8编码的内容, SHA-256十六进制摘要)
+        """
+        data = content.encode('utf-8')
+        return data, hashlib.sha256(data).hexdigest()
+    
+    @staticmethod
+    def _write_buffers(fd: int, blobs: List[bytes]):
+        """
+        把多个缓冲区按顺序写入文件，支持writev时一次系统调用提交多个缓冲区，
+        不需要先拼接成一整块
         
-        try:
-            # 根据格式类型保存内容
-            if format_type == 'txt':
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-            elif format_type == 'json':
-                # 假设内容已经是JSON字符串
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
+        Args:
+            fd: 文件描述符
+            blobs: 待写入的缓冲区列表
+        """
+        pending = deque(memoryview(blob) for blob in blobs if blob)
+        while pending:
+            if hasattr(os, 'writev'):
+                written = os.writev(fd, list(islice(pending, _WRITEV_MAX_BUFFERS)))
             else:
-                # 对于其他格式，目前仍然以文本方式保存
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                logger.warning(f"格式 {format_type} 未实现专用保存逻辑，以文本方式保存")
+                written = os.write(fd, pending[0])
+            # 丢弃已完整写入的缓冲区，部分写入的缓冲区保留剩余部分
+            while written:
+                head = pending[0]
+                if written >= len(head):
+                    written -= len(head)
+                    pending.popleft()
+                else:
+                    pending[0] = head[written:]
+                    written = 0
+    
+    def _segment_file(self, segment_id: int) -> str:
+        """段文件路径"""
+        return os.path.join(self.segment_path, f"seg-{segment_id:06d}.dat")
+    
+    def _latest_segment_id(self) -> int:
+        """磁盘上编号最大的段（正在追加写入的段），没有段文件时为1"""
+        return max(
+            (int(match.group(1)) for match in map(_SEGMENT_NAME_RE.match, os.listdir(self.segment_path))
+             if match),
+            default=1
+        )
+    
+    def _append_to_segment(self, blobs: List[bytes]) -> List[Dict]:
+        """
+        把一批内容一次追加到当前段文件，当前段写满时轮转到下一个段
+        进程内用锁、进程间用flock串行化追加，保证记录的偏移与实际写入位置一致
+        
+        Args:
+            blobs: 待写入的内容列表
             
-            # 准备元数据
-            full_metadata = {
-                'id': document_id,
-                'document_type': document_type,
-                'format': format_type,
-                'file_name': file_name,
-                'file_path': file_path,
-                'content_size': len(content),
-                'content_hash': content_hash,
-                'storage_date': datetime.now().isoformat(),
-                'metadata': metadata
-            }
+        Returns:
+            每项内容的位置 {'id': 段号, 'offset': 偏移, 'length': 长度}
+        """
+        with self._segment_lock:
+            return self._append_to_segment_locked(blobs)
+    
+    def _append_to_segment_locked(self, blobs: List[bytes]) -> List[Dict]:
+        """
+        _append_to_segment的实现，调用方需持有self._segment_lock
+        
+        Args:
+            blobs: 待写入的内容列表
             
-            # 保存元数据
-            self._save_metadata(document_id, full_metadata)
+        Returns:
+            每项内容的位置 {'id': 段号, 'offset': 偏移, 'length': 长度}
+        """
+        if not blobs:
+            return []
+        total_length = sum(len(blob) for blob in blobs)
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+        
+        while True:
+            fd = os.open(self._segment_file(self._segment_id), flags, 0o644)
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            stat = os.fstat(fd)
+            if stat.st_nlink == 0:
+                # 等待flock期间该段已被其他进程压缩删除，改写到最新的段
+                os.close(fd)
+                self._segment_id = max(self._segment_id + 1, self._latest_segment_id())
+                continue
+            offset = stat.st_size
+            if offset == 0 and self._segment_id < self._latest_segment_id():
+                # 新建的段号落在已压缩删除的旧段上（其他进程已轮转到更新的段），不复用旧段号
+                os.remove(self._segment_file(self._segment_id))
+                os.close(fd)
+                self._segment_id = self._latest_segment_id()
+                continue
+            if offset == 0 or offset + total_length <= self.segment_max_bytes:
+                break
+            os.close(fd)
+            self._segment_id += 1
+        
+        try:
+            self._write_buffers(fd, blobs)
+        finally:
+            # 关闭文件同时释放flock
+            os.close(fd)
+        segment_id = self._segment_id
+        
+        locations = []
+        for blob in blobs:
+            locations.append({'id': segment_id, 'offset': offset, 'length': len(blob)})
+            offset += len(blob)
+        return locations
+    
+    def _read_content(self, metadata: Dict) -> str:
+        """
+        读取文档内容，兼容旧版每个文档一个文件的存储方式
+        
+        Args:
+            metadata: 文档的完整元数据
             
-            # 为文档创建索引（用于全文搜索）
-            self._create_document_index(document_id, content, metadata)
+        Returns:
+            文档内容
+        """
+        segment = metadata.get('segment')
+        if segment is None:
+            file_path = metadata.get('file_path')
+            if not file_path or not os.path.exists(file_path):
+                raise FileNotFoundError(f"文档文件不存在: {file_path}")
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return f.read()
+        
+        segment_file = self._segment_file(segment['id'])
+        with open(segment_file, 'rb') as f:
+            f.seek(segment['offset'])
+            data = f.read(segment['length'])
+        if len(data) != segment['length']:
+            raise IOError(f"段文件 {segment_file} 数据不完整")
+        return data.decode('utf-8')
+    
+    def _commit_documents(self, entries: List[tuple], reused: Optional[List[tuple]] = None):
+        """
+        在一个事务中写入一批新文档的元数据和全文索引
+        
+        Args:
+            entries: (完整元数据, 文档内容) 列表
+            reused: 复用的已存储内容 (内容哈希, 位置) 列表，提交前确认仍被引用
             
-            logger.info(f"文档 {document_id} 存储成功")
-            return document_id
+        Raises:
+            _StaleContentError: 复用的内容已被释放或迁移，整批都没有写入
+        """
+        rows = [self._metadata_row(full_metadata) for full_metadata, _ in entries]
+        fulltext_rows = []
+        if self._fulltext_enabled:
+            fulltext_rows = [self._fulltext_row(full_metadata['id'], content, full_metadata['metadata'])
+                             for full_metadata, content in entries]
+        
+        with self._db_lock, self._db:
+            # 立即取得写锁，确认复用的内容仍被引用后，压缩或删除无法在提交前释放它
+            self._db.execute('BEGIN IMMEDIATE')
+            for content_hash, location in reused or ():
+                if not self._content_in_use(content_hash, location):
+                    raise _StaleContentError(f"段 {location['id']} 中的内容已被释放")
+            self._db.executemany('INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            # 未启用FTS5时doc_fts表不存在，即使参数为空，预编译语句也会失败
+            if self._fulltext_enabled:
+                self._db.executemany('INSERT INTO doc_fts VALUES (?, ?, ?, ?)', fulltext_rows)
+        
+        if not self._fulltext_enabled:
+            # 未启用全文索引时为每个文档写索引文件
+            for full_metadata, content in entries:
+                self._create_document_index(full_metadata['id'], content, full_metadata['metadata'])
+    
+    def _content_in_use(self, content_hash: str, location: Dict) -> bool:
+        """
+        段文件中的内容是否仍被某个文档引用（调用方需持有self._db_lock）
+        
+        Args:
+            content_hash: 内容的SHA-256摘要
+            location: 内容位置
             
-        except Exception as e:
-            logger.error(f"存储文档失败: {e}")
-            # 如果保存失败，尝试清理已创建的文件
-            if os.path.exists(file_path):
-                try:
-                    os.remove(file_path)
-                except:
-                    pass
-            raise
+        Returns:
+            仍被引用时返回True
+        """
+        row = self._db.execute(
+            "SELECT 1 FROM documents WHERE content_hash = ? AND file_path IS NULL "
+            "AND json_extract(metadata, '$.segment.id') = ? "
+            "AND json_extract(metadata, '$.segment.offset') = ? LIMIT 1",
+            (content_hash, location['id'], location['offset'])).fetchone()
+        return row is not None
+    
+    def _release_content(self, content_hash: str, location: Optional[Dict]):
+        """
+        文档不再引用某段内容后，若没有其他文档共用该内容，把它计入段的失效字节
+        （调用方需持有self._db_lock，且与删除/替换元数据处于同一事务）
+        
+        Args:
+            content_hash: 内容的SHA-256摘要
+            location: 内容位置，旧版单独存放的文档为None
+        """
+        if not location or self._content_in_use(content_hash, location):
+            return
+        self._db.execute(
+            'INSERT INTO segments (id, dead_bytes) VALUES (?, ?) '
+            'ON CONFLICT(id) DO UPDATE SET dead_bytes = dead_bytes + excluded.dead_bytes',
+            (location['id'], location['length']))
     
     def retrieve_document(self, document_id: str) -> Dict:
         """
@@ -146,14 +693,20 @@ class DocumentStorageManager:
         if not metadata:
             raise FileNotFoundError(f"未找到ID为 {document_id} 的文档")
         
-        # 读取文档文件
-        file_path = metadata.get('file_path')
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"文档文件不存在: {file_path}")
-        
+        # 读取文档内容
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            try:
+                content = self._read_content(metadata)
+            except FileNotFoundError:
+                if metadata.get('segment') is None:
+                    raise
+                # 读取期间所在的段被压缩删除，内容已迁移，重新读取元数据
+                with self._db_lock:
+                    self._metadata_cache.pop(document_id, None)
+                metadata = self.get_metadata(document_id)
+                if not metadata:
+                    raise FileNotFoundError(f"未找到ID为 {document_id} 的文档")
+                content = self._read_content(metadata)
             
             result = {
                 'id': document_id,
@@ -175,20 +728,44 @@ class DocumentStorageManager:
             document_id: 文档唯一标识符
             
         Returns:
-            元数据字典，如果不存在返回None
+            元数据字典，如果不存在返回None。结果会被缓存并在多次调用间共享，调用方不应修改
         """
-        metadata_file = os.path.join(self.index_path, f"{document_id}_metadata.json")
-        
-        if not os.path.exists(metadata_file):
-            return None
-        
-        try:
-            with open(metadata_file, 'r', encoding='utf-8') as f:
-                metadata = json.load(f)
+        with self._db_lock:
+            self._validate_metadata_cache()
+            metadata = self._metadata_cache.get(document_id)
+            if metadata is not None:
+                self._metadata_cache.move_to_end(document_id)
+                return metadata
+            
+            try:
+                row = self._db.execute('SELECT metadata FROM documents WHERE id = ?',
+                                       (document_id,)).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"读取元数据失败: {e}")
+                return None
+            if row is None:
+                return None
+            
+            metadata = json.loads(row[0])
+            self._metadata_cache[document_id] = metadata
+            if len(self._metadata_cache) > self.metadata_cache_size:
+                self._metadata_cache.popitem(last=False)
             return metadata
-        except Exception as e:
-            logger.error(f"读取元数据失败: {e}")
-            return None
+    
+    def _validate_metadata_cache(self):
+        """
+        其他进程提交过目录写入时清空元数据缓存（调用方需持有self._db_lock）
+        PRAGMA data_version只在其他连接提交后变化，本进程的写入已在写入处逐条失效
+        """
+        try:
+            data_version = self._db.execute('PRAGMA data_version').fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning(f"读取目录版本失败，清空元数据缓存: {e}")
+            self._metadata_cache.clear()
+            return
+        if data_version != self._data_version:
+            self._metadata_cache.clear()
+            self._data_version = data_version
     
     def update_document(self, document_id: str, new_content: str, new_metadata: Optional[Dict] = None) -> bool:
         """
@@ -202,42 +779,50 @@ class DocumentStorageManager:
         Returns:
             更新是否成功
         """
-        # 获取现有元数据
+        # 获取现有元数据（缓存中的对象是共享的，在副本上修改）
         existing_metadata = self.get_metadata(document_id)
         if not existing_metadata:
             logger.error(f"未找到ID为 {document_id} 的文档元数据")
             return False
+        existing_metadata = dict(existing_metadata, metadata=dict(existing_metadata.get('metadata', {})))
         
-        file_path = existing_metadata.get('file_path')
-        if not os.path.exists(file_path):
-            logger.error(f"文档文件不存在: {file_path}")
-            return False
+        # 旧版单独存放的文档文件，更新后迁移到段文件
+        old_file_path = existing_metadata.get('file_path')
+        old_content_hash = existing_metadata.get('content_hash')
+        old_location = existing_metadata.get('segment')
         
         try:
-            # 更新文档内容
+            # 新内容追加到段文件，旧内容没有其他文档引用时计入段的失效字节
             format_type = existing_metadata.get('format', 'txt')
-            if format_type == 'txt' or format_type == 'json':
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(new_content)
-            else:
+            if format_type not in ('txt', 'json'):
                 logger.warning(f"格式 {format_type} 未实现专用更新逻辑，以文本方式更新")
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    f.write(new_content)
+            data, content_hash = self._encode_content(new_content)
+            existing_metadata['file_path'] = None
             
             # 更新元数据
             existing_metadata['content_size'] = len(new_content)
-            existing_metadata['content_hash'] = hashlib.sha256(new_content.encode('utf-8')).hexdigest()
+            existing_metadata['content_hash'] = content_hash
             existing_metadata['last_modified'] = datetime.now().isoformat()
             
             if new_metadata:
                 existing_metadata['metadata'].update(new_metadata)
             
-            # 保存更新后的元数据
-            self._save_metadata(document_id, existing_metadata)
+            # 保存更新后的元数据；复用的内容在提交前被释放时改为重新写入
+            location = self._find_stored_content(content_hash) if self.deduplicate_content else None
+            try:
+                existing_metadata['segment'] = location or self._append_to_segment([data])[0]
+                self._replace_content(document_id, existing_metadata, old_content_hash, old_location,
+                                      reused=location is not None)
+            except _StaleContentError:
+                existing_metadata['segment'] = self._append_to_segment([data])[0]
+                self._replace_content(document_id, existing_metadata, old_content_hash, old_location)
             
             # 更新索引
             self._create_document_index(document_id, new_content, existing_metadata['metadata'])
             
+            if old_file_path and os.path.exists(old_file_path):
+                os.remove(old_file_path)
+            
             logger.info(f"文档 {document_id} 更新成功")
             return True
             
@@ -261,25 +846,31 @@ class DocumentStorageManager:
             logger.error(f"未找到ID为 {document_id} 的文档元数据")
             return False
         
-        # 删除文档文件
+        # 删除旧版单独存放的文档文件；段文件中的内容在删除元数据时计入段的失效字节
         file_path = metadata.get('file_path')
-        if os.path.exists(file_path):
+        if file_path and os.path.exists(file_path):
             try:
                 os.remove(file_path)
             except Exception as e:
                 logger.error(f"删除文档文件失败: {e}")
                 return False
         
-        # 删除元数据文件
-        metadata_file = os.path.join(self.index_path, f"{document_id}_metadata.json")
-        if os.path.exists(metadata_file):
-            try:
-                os.remove(metadata_file)
-            except Exception as e:
-                logger.error(f"删除元数据文件失败: {e}")
-                return False
+        # 删除元数据和全文索引
+        try:
+            with self._db_lock, self._db:
+                self._db.execute('DELETE FROM documents WHERE id = ?', (document_id,))
+                self._metadata_cache.pop(document_id, None)
+                self._release_content(metadata.get('content_hash'), metadata.get('segment'))
+                if self._fulltext_enabled:
+                    self._db.execute('DELETE FROM doc_fts WHERE doc_id = ?', (document_id,))
+        except sqlite3.Error as e:
+            logger.error(f"删除元数据失败: {e}")
+            return False
         
-        # 删除索引文件
+        # 删除索引文件和倒排表条目（未启用全文索引时使用）
+        with self._postings_lock:
+            if self._postings is not None:
+                self._remove_postings(document_id)
         index_file = os.path.join(self.index_path, f"{document_id}_index.json")
         if os.path.exists(index_file):
             try:
@@ -306,72 +897,145 @@ class DocumentStorageManager:
         Returns:
             匹配的文档列表
         """
+        metadata_filters = metadata_filters or {}
+        if query_text and not self._fulltext_enabled:
+            return self._search_postings(query_text, metadata_filters, document_type, limit)
+        
+        params = []
+        if query_text:
+            match = _fulltext_query(query_text)
+            if not match:
+                return []
+            # 倒排索引只返回命中查询词的文档，按BM25排序（标题权重为2，关键词和正文为1）
+            sql = ('SELECT d.metadata FROM doc_fts JOIN documents d ON d.id = doc_fts.doc_id '
+                   'WHERE doc_fts MATCH ?')
+            params.append(match)
+            if document_type:
+                sql += ' AND d.document_type = ?'
+                params.append(document_type)
+            sql += ' ORDER BY bm25(doc_fts, 0.0, 2.0, 1.0, 1.0)'
+        else:
+            sql = 'SELECT metadata FROM documents'
+            if document_type:
+                sql += ' WHERE document_type = ?'
+                params.append(document_type)
+            sql += ' ORDER BY storage_date DESC'
+        
+        # 元数据过滤条件在结果流上检查，凑够limit条即停止读取
         results = []
-        scores = {}
+        with self._db_lock:
+            for (raw_metadata,) in self._db.execute(sql, params):
+                metadata = json.loads(raw_metadata)
+                if self._match_filters(metadata.get('metadata', {}), metadata_filters):
+                    results.append(metadata)
+                    if len(results) >= limit:
+                        break
+        return results
+    
+    @staticmethod
+    def _match_filters(metadata: Dict, metadata_filters: Dict) -> bool:
+        """
+        检查文档元数据是否满足所有过滤条件
         
-        # 遍历所有索引文件
-        for file_name in os.listdir(self.index_path):
-            if not file_name.endswith('_index.json'):
-                continue
+        Args:
+            metadata: 文档元数据
+            metadata_filters: 元数据过滤条件
             
-            document_id = file_name.replace('_index.json', '')
-            index_path = os.path.join(self.index_path, file_name)
+        Returns:
+            是否满足
+        """
+        return all(key in metadata and metadata[key] == value
+                   for key, value in metadata_filters.items())
+    
+    def _search_postings(self, query_text: str, metadata_filters: Dict,
+                         document_type: Optional[str], limit: int) -> List[Dict]:
+        """
+        用内存倒排表搜索文档（SQLite不支持FTS5时使用），只访问查询词的倒排列表
+        
+        Args:
+            query_text: 搜索文本
+            metadata_filters: 元数据过滤条件
+            document_type: 文档类型过滤
+            limit: 结果数量限制
             
-            try:
-                with open(index_path, 'r', encoding='utf-8') as f:
-                    index = json.load(f)
-                
-                # 检查文档类型
-                if document_type and index.get('document_type') != document_type:
+        Returns:
+            按得分排序的文档元数据列表
+        """
+        postings = self._load_postings()
+        scores = Counter()
+        with self._postings_lock:
+            for term in _QUERY_TERM_RE.findall(query_text.lower()):
+                for document_id, weight in postings.get(term, {}).items():
+                    scores[document_id] += weight
+        
+        results = []
+        for document_id, _ in scores.most_common():
+            metadata = self.get_metadata(document_id)
+            if not metadata:
+                continue
+            if document_type and metadata.get('document_type') != document_type:
+                continue
+            if not self._match_filters(metadata.get('metadata', {}), metadata_filters):
+                continue
+            results.append(metadata)
+            if len(results) >= limit:
+                break
+        return results
+    
+    def _load_postings(self) -> Dict[str, Dict[str, int]]:
+        """
+        获取内存倒排表，首次调用时由索引文件构建
+        
+        Returns:
+            词 -> {文档ID: 得分}
+        """
+        with self._postings_lock:
+            if self._postings is not None:
+                return self._postings
+            self._postings = {}
+            for file_name in os.listdir(self.index_path):
+                if not file_name.endswith('_index.json'):
                     continue
-                
-                # 检查元数据过滤条件
-                if metadata_filters:
-                    metadata_match = True
-                    for key, value in metadata_filters.items():
-                        if key not in index.get('metadata', {}) or index['metadata'][key] != value:
-                            metadata_match = False
-                            break
-                    if not metadata_match:
-                        continue
-                
-                # 文本搜索
-                score = 0
-                if query_text:
-                    # 简单的关键词匹配计分
-                    query_terms = re.findall(r'\b\w+\b', query_text.lower())
-                    
-                    # 检查标题
-                    title = index.get('metadata', {}).get('title', '').lower()
-                    for term in query_terms:
-                        if term in title:
-                            score += 2  # 标题匹配权重更高
-                    
-                    # 检查内容关键词
-                    keywords = index.get('keywords', [])
-                    for term in query_terms:
-                        if term in keywords:
-                            score += 1
-                    
-                    # 只有得分大于0的才添加到结果
-                    if score == 0:
-                        continue
-                
-                # 获取完整的元数据
-                metadata = self.get_metadata(document_id)
-                if metadata:
-                    scores[document_id] = score
-                    results.append(metadata)
-                    
-            except Exception as e:
-                logger.warning(f"处理索引文件 {file_name} 时出错: {e}")
+                try:
+                    with open(os.path.join(self.index_path, file_name), 'r', encoding='utf-8') as f:
+                        index = json.load(f)
+                    self._add_postings(index['id'], index.get('title', ''), index.get('keywords', []))
+                except Exception as e:
+                    logger.warning(f"处理索引文件 {file_name} 时出错: {e}")
+            return self._postings
+    
+    def _add_postings(self, document_id: str, title: str, keywords: List[str]):
+        """
+        把文档加入倒排表（调用方需持有self._postings_lock）
         
-        # 按相关性得分排序
-        if query_text:
-            results.sort(key=lambda x: scores.get(x['id'], 0), reverse=True)
+        Args:
+            document_id: 文档唯一标识符
+            title: 文档标题
+            keywords: 文档关键词
+        """
+        self._remove_postings(document_id)
+        weights = Counter()
+        for term in set(_QUERY_TERM_RE.findall(title.lower())):
+            weights[term] += 2  # 标题匹配权重更高
+        for term in keywords:
+            weights[term] += 1
+        for term, weight in weights.items():
+            self._postings.setdefault(term, {})[document_id] = weight
+        self._posting_terms[document_id] = list(weights)
+    
+    def _remove_postings(self, document_id: str):
+        """
+        从倒排表中移除文档（调用方需持有self._postings_lock）
         
-        # 限制结果数量
-        return results[:limit]
+        Args:
+            document_id: 文档唯一标识符
+        """
+        for term in self._posting_terms.pop(document_id, ()):
+            documents = self._postings.get(term)
+            if documents is not None:
+                documents.pop(document_id, None)
+                if not documents:
+                    del self._postings[term]
     
     def list_documents(self, document_type: Optional[str] = None, 
                       start_date: Optional[datetime] = None, 
@@ -389,55 +1053,75 @@ class DocumentStorageManager:
         Returns:
             文档元数据列表
         """
-        results = []
+        conditions = []
+        params = []
+        if document_type:
+            conditions.append('document_type = ?')
+            params.append(document_type)
+        # storage_date为ISO格式字符串，按字典序比较即按时间比较
+        if start_date:
+            conditions.append('storage_date >= ?')
+            params.append(start_date.isoformat())
+        if end_date:
+            conditions.append('storage_date <= ?')
+            params.append(end_date.isoformat())
         
-        # 遍历所有元数据文件
-        for file_name in os.listdir(self.index_path):
-            if not file_name.endswith('_metadata.json'):
-                continue
-            
-            document_id = file_name.replace('_metadata.json', '')
-            
-            # 获取元数据
-            metadata = self.get_metadata(document_id)
-            if not metadata:
-                continue
-            
-            # 检查文档类型
-            if document_type and metadata.get('document_type') != document_type:
-                continue
-            
-            # 检查日期范围
-            if start_date or end_date:
-                storage_date = datetime.fromisoformat(metadata['storage_date'])
-                if start_date and storage_date < start_date:
-                    continue
-                if end_date and storage_date > end_date:
-                    continue
-            
-            results.append(metadata)
-            
-            # 检查是否达到限制
-            if len(results) >= limit:
-                return results
-        
-        # 按存储日期排序
-        results.sort(key=lambda x: x['storage_date'], reverse=True)
+        sql = 'SELECT metadata FROM documents'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        # 按存储日期倒序
+        sql += ' ORDER BY storage_date DESC LIMIT ?'
+        params.append(limit)
         
-        return results
+        with self._db_lock:
+            rows = self._db.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
     
-    def _save_metadata(self, document_id: str, metadata: Dict):
+    def _replace_content(self, document_id: str, metadata: Dict, old_content_hash: Optional[str],
+                         old_location: Optional[Dict], reused: bool = False):
         """
-        保存元数据到文件
+        在一个事务中保存更新后的元数据，并释放文档不再引用的旧内容
         
         Args:
             document_id: 文档唯一标识符
-            metadata: 元数据字典
+            metadata: 更新后的元数据（segment为新内容的位置）
+            old_content_hash: 旧内容的SHA-256摘要
+            old_location: 旧内容的位置，旧版单独存放的文档为None
+            reused: 新内容是否复用已存储的内容
+            
+        Raises:
+            _StaleContentError: 复用的内容已被释放或迁移，元数据没有写入
+        """
+        row = self._metadata_row(dict(metadata, id=document_id))
+        with self._db_lock, self._db:
+            self._db.execute('BEGIN IMMEDIATE')
+            if reused and not self._content_in_use(metadata['content_hash'], metadata['segment']):
+                raise _StaleContentError(f"段 {metadata['segment']['id']} 中的内容已被释放")
+            self._db.execute('INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?)', row)
+            self._metadata_cache.pop(document_id, None)
+            self._release_content(old_content_hash, old_location)
+    
+    def _extract_keywords(self, content: str) -> List[str]:
+        """
+        提取文档关键词
+        
+        Args:
+            content: 文档内容
+            
+        Returns:
+            按词频降序的关键词列表（最多50个）
         """
-        metadata_file = os.path.join(self.index_path, f"{document_id}_metadata.json")
+        # 提取关键词（简单实现，实际可能需要更复杂的NLP处理）
+        # 逐个匹配并单独转小写，不生成整篇文档的小写副本和全部单词的列表，
+        # 内存占用只与不同单词的数量有关
+        word_freq = Counter()
+        for match in _KEYWORD_RE.finditer(content):
+            word = match.group().lower()
+            if word not in _KEYWORD_STOP_WORDS:
+                word_freq[word] += 1
         
-        with open(metadata_file, 'w', encoding='utf-8') as f:
-            json.dump(metadata, f, indent=2, ensure_ascii=False)
+        # 获取最常见的关键词，most_common(n)用堆选取，不对全部词排序
+        return [word for word, _ in word_freq.most_common(MAX_KEYWORDS)]
     
     def _create_document_index(self, document_id: str, content: str, metadata: Dict):
         """
@@ -448,31 +1132,20 @@ class DocumentStorageManager:
             content: 文档内容
             metadata: 文档元数据
         """
-        # 提取关键词（简单实现，实际可能需要更复杂的NLP处理）
-        # 去除特殊字符，提取单词
-        words = re.findall(r'\b\w{3,}\b', content.lower())
-        
-        # 过滤常见停用词
-        stop_words = {'the', 'and', 'is', 'in', 'to', 'of', 'a', 'with', 'for', 'on', 'are', 
-                     'as', 'by', 'this', 'from', 'that', 'have', 'it', 'at', 'be', 'or', 
-                     'which', 'an', 'but', 'not', 'has', 'all', 'were', 'when', 'been'}
-        keywords = [word for word in words if word not in stop_words]
-        
-        # 统计词频，只保留出现次数大于1的词
-        word_freq = {}
-        for word in keywords:
-            word_freq[word] = word_freq.get(word, 0) + 1
-        
-        # 获取最常见的关键词（最多50个）
-        sorted_keywords = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
-        top_keywords = [word for word, freq in sorted_keywords[:50]]
+        if self._fulltext_enabled:
+            # 写入倒排索引，更新文档时先删除旧的索引行
+            row = self._fulltext_row(document_id, content, metadata)
+            with self._db_lock, self._db:
+                self._db.execute('DELETE FROM doc_fts WHERE doc_id = ?', (document_id,))
+                self._db.execute('INSERT INTO doc_fts VALUES (?, ?, ?, ?)', row)
+            return
         
         # 构建索引
         index = {
             'id': document_id,
             'document_type': metadata.get('document_type', 'general'),
             'title': metadata.get('title', ''),
-            'keywords': top_keywords,
+            'keywords': self._extract_keywords(content),
             'metadata': metadata,
             'index_date': datetime.now().isoformat()
         }
@@ -481,6 +1154,11 @@ class DocumentStorageManager:
         index_file = os.path.join(self.index_path, f"{document_id}_index.json")
         with open(index_file, 'w', encoding='utf-8') as f:
             json.dump(index, f, indent=2, ensure_ascii=False)
+        
+        # 倒排表已构建时增量更新，未构建时首次搜索会从索引文件读取
+        with self._postings_lock:
+            if self._postings is not None:
+                self._add_postings(document_id, index['title'], index['keywords'])
     
     def chunk_document(self, content: str) -> List[Dict]:
         """
@@ -501,11 +1179,11 @@ class DocumentStorageManager:
             
             # 尝试在句子边界分割
             if end < length:
-                # 寻找最近的句号、问号、感叹号或换行符
-                for i in range(end, max(start, end - 50), -1):
-                    if content[i] in ['.', '?', '!', '\n']:
-                        end = i + 1
-                        break
+                # 在end之前50个字符内寻找最近的句号、问号、感叹号或换行符
+                window_start = max(start, end - 50) + 1
+                cut = max(content.rfind(ch, window_start, end + 1) for ch in _SENTENCE_BOUNDARIES)
+                if cut >= 0:
+                    end = cut + 1
             
             chunks.append({
                 'content': content[start:end],
@@ -518,6 +1196,99 @@ class DocumentStorageManager:
         
         return chunks
     
+    def compact_segments(self, min_dead_ratio: float = DEFAULT_COMPACT_DEAD_RATIO) -> Dict:
+        """
+        压缩失效字节占比较高的段：把其中仍被引用的内容重写到当前段，更新元数据后删除旧段文件
+        正在追加写入的最新段不参与压缩
+        
+        Args:
+            min_dead_ratio: 失效字节占段文件大小的比例达到该值时才压缩
+            
+        Returns:
+            压缩结果 {'compacted_segments': 压缩的段数, 'reclaimed_bytes': 释放的字节数}
+        """
+        result = {'compacted_segments': 0, 'reclaimed_bytes': 0}
+        with self._segment_lock:
+            latest_segment_id = self._latest_segment_id()
+            # 其他进程可能已轮转到更新的段，迁移的内容必须写到待压缩的段之后
+            self._segment_id = max(self._segment_id, latest_segment_id)
+            with self._db_lock:
+                candidates = self._db.execute(
+                    'SELECT id, dead_bytes FROM segments WHERE id < ? AND dead_bytes > 0',
+                    (latest_segment_id,)).fetchall()
+            
+            for segment_id, dead_bytes in candidates:
+                segment_file = self._segment_file(segment_id)
+                try:
+                    segment_size = os.path.getsize(segment_file)
+                except FileNotFoundError:
+                    # 段文件已被其他进程压缩删除
+                    continue
+                if dead_bytes < segment_size * min_dead_ratio:
+                    continue
+                try:
+                    live_bytes = self._compact_segment(segment_id)
+                except Exception as e:
+                    logger.error(f"压缩段 {segment_id} 失败: {e}")
+                    continue
+                result['compacted_segments'] += 1
+                result['reclaimed_bytes'] += segment_size - live_bytes
+        
+        if result['compacted_segments']:
+            logger.info(f"已压缩 {result['compacted_segments']} 个段，"
+                        f"释放 {self._human_readable_size(result['reclaimed_bytes'])}")
+        return result
+    
+    def _compact_segment(self, segment_id: int) -> int:
+        """
+        把一个段中仍被引用的内容重写到当前段并删除该段（调用方需持有self._segment_lock）
+        持有段文件的flock和数据库写锁完成迁移，其他进程不会再向该段追加或引用其中的内容
+        
+        Args:
+            segment_id: 段号
+            
+        Returns:
+            迁移的有效字节数
+        """
+        segment_file = self._segment_file(segment_id)
+        with open(segment_file, 'rb') as f:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            with self._db_lock, self._db:
+                self._db.execute('BEGIN IMMEDIATE')
+                rows = self._db.execute(
+                    "SELECT id, metadata FROM documents WHERE file_path IS NULL "
+                    "AND json_extract(metadata, '$.segment.id') = ?", (segment_id,)).fetchall()
+                
+                # 共用同一份内容的文档只迁移一次
+                documents = []
+                offsets = {}
+                blobs = []
+                for document_id, raw_metadata in rows:
+                    metadata = json.loads(raw_metadata)
+                    location = metadata['segment']
+                    key = (location['offset'], location['length'])
+                    if key not in offsets:
+                        f.seek(location['offset'])
+                        data = f.read(location['length'])
+                        if len(data) != location['length']:
+                            raise IOError(f"段文件 {segment_file} 数据不完整")
+                        offsets[key] = len(blobs)
+                        blobs.append(data)
+                    documents.append((document_id, metadata, offsets[key]))
+                
+                locations = self._append_to_segment_locked(blobs)
+                updates = []
+                for document_id, metadata, index in documents:
+                    metadata['segment'] = locations[index]
+                    updates.append((json.dumps(metadata, ensure_ascii=False), document_id))
+                    self._metadata_cache.pop(document_id, None)
+                self._db.executemany('UPDATE documents SET metadata = ? WHERE id = ?', updates)
+                self._db.execute('DELETE FROM segments WHERE id = ?', (segment_id,))
+            # 元数据已提交后再删除段文件；关闭文件时释放flock
+            os.remove(segment_file)
+        return sum(len(blob) for blob in blobs)
+    
     def get_storage_statistics(self) -> Dict:
         """
         获取存储统计信息
@@ -530,41 +1301,29 @@ class DocumentStorageManager:
             'total_size_bytes': 0,
             'type_distribution': {},
             'format_distribution': {},
-            'monthly_distribution': {}
+            'monthly_distribution': {},
+            'segment_dead_bytes': 0
         }
         
-        # 统计元数据文件
-        for file_name in os.listdir(self.index_path):
-            if not file_name.endswith('_metadata.json'):
-                continue
-            
-            stats['total_documents'] += 1
-            
-            # 读取元数据获取更多信息
-            document_id = file_name.replace('_metadata.json', '')
-            metadata = self.get_metadata(document_id)
-            if metadata:
-                # 累加文档大小
-                stats['total_size_bytes'] += metadata.get('content_size', 0)
-                
-                # 更新类型分布
-                doc_type = metadata.get('document_type', 'general')
-                stats['type_distribution'][doc_type] = \
-                    stats['type_distribution'].get(doc_type, 0) + 1
-                
-                # 更新格式分布
-                doc_format = metadata.get('format', 'txt')
-                stats['format_distribution'][doc_format] = \
-                    stats['format_distribution'].get(doc_format, 0) + 1
-                
-                # 更新月度分布
-                try:
-                    storage_date = datetime.fromisoformat(metadata['storage_date'])
-                    month_key = storage_date.strftime('%Y-%m')
-                    stats['monthly_distribution'][month_key] = \
-                        stats['monthly_distribution'].get(month_key, 0) + 1
-                except Exception as e:
-                    logger.warning(f"解析存储日期失败: {e}")
+        with self._db_lock:
+            total = self._db.execute(
+                'SELECT COUNT(*), COALESCE(SUM(content_size), 0) FROM documents').fetchone()
+            by_type = self._db.execute(
+                'SELECT document_type, COUNT(*) FROM documents GROUP BY document_type').fetchall()
+            by_format = self._db.execute(
+                'SELECT format, COUNT(*) FROM documents GROUP BY format').fetchall()
+            # storage_date为ISO格式，前7个字符即YYYY-MM
+            by_month = self._db.execute(
+                'SELECT substr(storage_date, 1, 7), COUNT(*) FROM documents '
+                'WHERE storage_date IS NOT NULL GROUP BY 1').fetchall()
+            # 段文件中不再被引用、等待压缩回收的字节数
+            stats['segment_dead_bytes'] = self._db.execute(
+                'SELECT COALESCE(SUM(dead_bytes), 0) FROM segments').fetchone()[0]
+        
+        stats['total_documents'], stats['total_size_bytes'] = total
+        stats['type_distribution'] = dict(by_type)
+        stats['format_distribution'] = dict(by_format)
+        stats['monthly_distribution'] = dict(by_month)
         
         # 转换为人类可读的格式
         stats['total_size_human'] = self._human_readable_size(stats['total_size_bytes'])
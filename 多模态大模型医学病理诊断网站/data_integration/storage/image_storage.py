@@ -3,19 +3,37 @@
 
 该模块负责医学图像数据（如病理切片、医学影像等）的存储、检索和管理。
 """
+import io
 import os
 import json
 import uuid
 import logging
 import hashlib
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, Optional, List, Tuple, Any
+from typing import Dict, Optional, List, Tuple, Any, BinaryIO, Iterable, Union
 import numpy as np
+from PIL import Image
+
+try:
+    import h5py
+except ImportError:  # h5py为可选依赖，仅分块存储需要
+    h5py = None
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 图像写入缓冲区及分块读取大小（1MB）
+WRITE_BUFFER_SIZE = 1 << 20
+
+# 分块存储（HDF5）的文件扩展名和默认瓦片边长
+TILE_FORMAT = '.h5'
+# 未编码数组的存储格式（可按内存映射方式读取）
+ARRAY_FORMAT = '.npy'
+DEFAULT_TILE_SIZE = 256
+
 
 class ImageStorageManager:
     """
@@ -33,12 +51,22 @@ class ImageStorageManager:
                 - metadata_path: 元数据存储路径
                 - supported_formats: 支持的图像格式列表
                 - enable_compression: 是否启用压缩
+                - tile_size: 分块存储的瓦片边长
+                - max_open_tile_files: 保持打开的HDF5文件句柄数量
         """
         self.config = config
         self.storage_path = config.get('storage_path', './data/images')
         self.metadata_path = config.get('metadata_path', './data/metadata')
         self.supported_formats = config.get('supported_formats', ['.tif', '.tiff', '.jpg', '.jpeg', '.png', '.svs', '.ndpi'])
         self.enable_compression = config.get('enable_compression', False)
+        self.tile_size = config.get('tile_size', DEFAULT_TILE_SIZE)
+        self.max_open_tile_files = config.get('max_open_tile_files', 16)
+        # 遍历存储目录时识别的文件格式（包含分块存储格式）
+        self.stored_formats = set(self.supported_formats) | {TILE_FORMAT, ARRAY_FORMAT}
+        
+        # 最近使用的HDF5文件句柄，避免每次读取瓦片都重新打开文件
+        self._tile_files = OrderedDict()
+        self._tile_lock = threading.Lock()
         
         # 创建必要的目录
         os.makedirs(self.storage_path, exist_ok=True)
@@ -46,12 +74,14 @@ class ImageStorageManager:
         
         logger.info(f"图像存储管理器初始化完成，存储路径: {self.storage_path}")
     
-    def store_image(self, image_data: bytes, metadata: Dict, format_type: str = 'tif') -> str:
+    def store_image(self, image_data: Union[bytes, BinaryIO, Iterable[bytes]], metadata: Dict,
+                    format_type: str = 'tif') -> str:
         """
         存储图像数据
+        目标文件只打开一次，数据分块连续写入，同时增量计算哈希值
         
         Args:
-            image_data: 图像二进制数据
+            image_data: 图像二进制数据、可读的文件对象或字节块迭代器
             metadata: 图像元数据
             format_type: 图像格式类型
             
@@ -65,8 +95,13 @@ class ImageStorageManager:
         if f".{format_type}" not in self.supported_formats:
             raise ValueError(f"不支持的图像格式: {format_type}")
         
-        # 计算文件哈希值以检查重复
-        file_hash = hashlib.sha256(image_data).hexdigest()
+        # 统一为字节块迭代
+        if isinstance(image_data, (bytes, bytearray, memoryview)):
+            chunks = (image_data,)
+        elif hasattr(image_data, 'read'):
+            chunks = iter(lambda: image_data.read(WRITE_BUFFER_SIZE), b'')
+        else:
+            chunks = image_data
         
         # 创建存储子目录（基于ID的前两位，避免单目录文件过多）
         sub_dir = image_id[:2]
@@ -78,8 +113,14 @@ class ImageStorageManager:
         file_path = os.path.join(image_dir, file_name)
         
         try:
-            with open(file_path, 'wb') as f:
-                f.write(image_data)
+            # 计算文件哈希值以检查重复
+            hasher = hashlib.sha256()
+            size_bytes = 0
+            with open(file_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    hasher.update(chunk)
+                    size_bytes += len(chunk)
             
             # 准备元数据
             full_metadata = {
@@ -87,8 +128,8 @@ class ImageStorageManager:
                 'file_name': file_name,
                 'file_path': file_path,
                 'format': format_type,
-                'size_bytes': len(image_data),
-                'hash': file_hash,
+                'size_bytes': size_bytes,
+                'hash': hasher.hexdigest(),
                 'storage_date': datetime.now().isoformat(),
                 'compression': self.enable_compression,
                 'metadata': metadata
@@ -110,6 +151,212 @@ class ImageStorageManager:
                     pass
             raise
     
+    def store_image_from_buffer(self, image_array: np.ndarray, metadata: Dict,
+                                format_type: str = 'tif') -> str:
+        """
+        直接存储内存中的图像数组
+        图像在内存中编码后一次写入存储目录，无需先落盘中间文件
+        
+        Args:
+            image_array: 图像数组
+            metadata: 图像元数据
+            format_type: 图像格式类型（'npy'表示不编码，直接写入内存映射数组）
+            
+        Returns:
+            图像的唯一标识符（UUID）
+        """
+        if f".{format_type}" == ARRAY_FORMAT:
+            return self.store_image_array(image_array, metadata)
+        
+        pil_format = Image.registered_extensions().get(f".{format_type}")
+        if pil_format is None:
+            raise ValueError(f"不支持的图像格式: {format_type}")
+        
+        buffer = io.BytesIO()
+        Image.fromarray(image_array).save(buffer, format=pil_format)
+        return self.store_image(buffer.getbuffer(), metadata, format_type)
+    
+    def store_image_array(self, image_array: np.ndarray, metadata: Dict) -> str:
+        """
+        以.npy格式存储未编码的图像数组
+        数组通过内存映射直接写入最终文件，读取时同样按需映射，不经过编码和解码
+        
+        Args:
+            image_array: 图像数组
+            metadata: 图像元数据
+            
+        Returns:
+            图像的唯一标识符（UUID）
+        """
+        image_id = str(uuid.uuid4())
+        
+        sub_dir = image_id[:2]
+        image_dir = os.path.join(self.storage_path, sub_dir)
+        os.makedirs(image_dir, exist_ok=True)
+        
+        file_name = f"{image_id}{ARRAY_FORMAT}"
+        file_path = os.path.join(image_dir, file_name)
+        
+        try:
+            mm = np.lib.format.open_memmap(file_path, mode='w+',
+                                           dtype=image_array.dtype, shape=image_array.shape)
+            mm[:] = image_array
+            mm.flush()
+            del mm
+            
+            full_metadata = {
+                'id': image_id,
+                'file_name': file_name,
+                'file_path': file_path,
+                'format': ARRAY_FORMAT.lstrip('.'),
+                'size_bytes': os.path.getsize(file_path),
+                'shape': list(image_array.shape),
+                'dtype': str(image_array.dtype),
+                'storage_date': datetime.now().isoformat(),
+                'metadata': metadata
+            }
+            self._save_metadata(image_id, full_metadata)
+            
+            logger.info(f"图像数组 {image_id} 存储成功")
+            return image_id
+            
+        except Exception as e:
+            logger.error(f"存储图像数组失败: {e}")
+            if os.path.exists(file_path):
+                try:
+                    os.remove(file_path)
+                except:
+                    pass
+            raise
+    
+    def open_image_array(self, image_id: str) -> np.ndarray:
+        """
+        以只读内存映射方式打开.npy格式存储的图像
+        只有实际访问到的区域才会读入内存
+        
+        Args:
+            image_id: 图像唯一标识符
+            
+        Returns:
+            只读的numpy.memmap数组
+        """
+        metadata = self.get_metadata(image_id)
+        if not metadata or metadata.get('format') != ARRAY_FORMAT.lstrip('.'):
+            raise FileNotFoundError(f"未找到ID为 {image_id} 的数组格式图像")
+        return np.load(metadata['file_path'], mmap_mode='r')
+    
+    def store_image_tiles(self, image_array: np.ndarray, metadata: Dict) -> str:
+        """
+        以HDF5分块格式存储整张切片图像
+        每个瓦片对应一个HDF5数据块，读取单个瓦片时只需读取对应的数据块
+        
+        Args:
+            image_array: 图像数组（H x W 或 H x W x C）
+            metadata: 图像元数据
+            
+        Returns:
+            图像的唯一标识符（UUID）
+        """
+        if h5py is None:
+            raise ImportError("分块存储需要安装h5py")
+        
+        image_id = str(uuid.uuid4())
+        
+        sub_dir = image_id[:2]
+        image_dir = os.path.join(self.storage_path, sub_dir)
+        os.makedirs(image_dir, exist_ok=True)
+        
+        file_name = f"{image_id}{TILE_FORMAT}"
+        file_path = os.path.join(image_dir, file_name)
+        
+        tile = self.tile_size
+        height, width = image_array.shape[:2]
+        chunks = (min(tile, height), min(tile, width)) + image_array.shape[2:]
+        
+        try:
+            with h5py.File(file_path, 'w', libver='latest') as f:
+                dataset = f.create_dataset('image', shape=image_array.shape,
+                                           dtype=image_array.dtype,
+                                           chunks=chunks, compression='lzf')
+                # 按瓦片行写入，每次写满一行数据块
+                for top in range(0, height, tile):
+                    dataset[top:top + tile] = image_array[top:top + tile]
+            
+            full_metadata = {
+                'id': image_id,
+                'file_name': file_name,
+                'file_path': file_path,
+                'format': TILE_FORMAT.lstrip('.'),
+                'size_bytes': os.path.getsize(file_path),
+                'shape': list(image_array.shape),
+                'tile_size': tile,
+                'tile_grid': [-(-height // tile), -(-width // tile)],
+                'storage_date': datetime.now().isoformat(),
+                'compression': 'lzf',
+                'metadata': metadata
+            }
+            self._save_metadata(image_id, full_metadata)
+            
+            logger.info(f"图像 {image_id} 分块存储成功")
+            return image_id
+            
+        except Exception as e:
+            logger.error(f"分块存储图像失败: {e}")
+            if os.path.exists(file_path):
+                try:
+                    os.remove(file_path)
+                except:
+                    pass
+            raise
+    
+    def get_tile(self, image_id: str, row: int, col: int) -> np.ndarray:
+        """
+        读取分块存储图像中的单个瓦片
+        
+        Args:
+            image_id: 图像唯一标识符
+            row: 瓦片行号
+            col: 瓦片列号
+            
+        Returns:
+            瓦片图像数组
+        """
+        metadata = self.get_metadata(image_id)
+        if not metadata or metadata.get('format') != TILE_FORMAT.lstrip('.'):
+            raise FileNotFoundError(f"未找到ID为 {image_id} 的分块存储图像")
+        
+        tile = metadata['tile_size']
+        rows, cols = metadata['tile_grid']
+        if not (0 <= row < rows and 0 <= col < cols):
+            raise IndexError(f"瓦片坐标超出范围: ({row}, {col})")
+        
+        # 持有锁完成读取，避免其他线程淘汰句柄时在读取过程中关闭文件
+        with self._tile_lock:
+            dataset = self._open_tile_file(metadata['file_path'])['image']
+            return dataset[row * tile:(row + 1) * tile, col * tile:(col + 1) * tile]
+    
+    def _open_tile_file(self, file_path: str):
+        """
+        获取HDF5文件句柄，超出数量限制时关闭最久未使用的句柄（调用方需持有self._tile_lock）
+        
+        Args:
+            file_path: HDF5文件路径
+            
+        Returns:
+            只读的h5py.File对象
+        """
+        handle = self._tile_files.get(file_path)
+        if handle is not None:
+            self._tile_files.move_to_end(file_path)
+            return handle
+        
+        handle = h5py.File(file_path, 'r')
+        self._tile_files[file_path] = handle
+        if len(self._tile_files) > self.max_open_tile_files:
+            _, oldest = self._tile_files.popitem(last=False)
+            oldest.close()
+        return handle
+    
     def retrieve_image(self, image_id: str) -> Dict:
         """
         检索图像数据
@@ -223,6 +470,11 @@ class ImageStorageManager:
         
         # 删除图像文件
         file_path = metadata.get('file_path')
+        # 先关闭可能仍打开的HDF5句柄
+        with self._tile_lock:
+            handle = self._tile_files.pop(file_path, None)
+        if handle is not None:
+            handle.close()
         if os.path.exists(file_path):
             try:
                 os.remove(file_path)
@@ -264,7 +516,7 @@ class ImageStorageManager:
             for file_name in os.listdir(sub_dir_path):
                 # 跳过非图像文件
                 _, ext = os.path.splitext(file_name)
-                if ext.lower() not in self.supported_formats:
+                if ext.lower() not in self.stored_formats:
                     continue
                 
                 # 提取ID
@@ -316,7 +568,7 @@ class ImageStorageManager:
             for file_name in os.listdir(sub_dir_path):
                 # 跳过非图像文件
                 _, ext = os.path.splitext(file_name)
-                if ext.lower() not in self.supported_formats:
+                if ext.lower() not in self.stored_formats:
                     continue
                 
                 # 提取ID
@@ -361,7 +613,7 @@ class ImageStorageManager:
         for root, _, files in os.walk(self.storage_path):
             for file_name in files:
                 _, ext = os.path.splitext(file_name)
-                if ext.lower() in self.supported_formats:
+                if ext.lower() in self.stored_formats:
                     file_path = os.path.join(root, file_name)
                     stats['total_images'] += 1
                     
@@ -7,9 +7,13 @@ import os
 import json
 import logging
 import re
+import threading
+import time
+from concurrent.futures import Future
 from datetime import datetime
 from typing import Dict, Optional, List, Any, Union, Tuple
 from collections import defaultdict
+from queue import Queue, Empty
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -33,6 +37,7 @@ class MultiModalRetrievalEngine:
                 - document_storage_manager: 文档存储管理器实例（可选）
                 - default_limit: 默认结果数量限制
                 - enable_ranking: 是否启用结果排序
+                - vector_index_path: 嵌入向量索引目录（可选）
         """
         self.config = config
         self.metadata_index_manager = config.get('metadata_index_manager')
@@ -41,6 +46,12 @@ class MultiModalRetrievalEngine:
         self.default_limit = config.get('default_limit', 50)
         self.enable_ranking = config.get('enable_ranking', True)
         
+        # 嵌入向量索引（int8量化存储）
+        self.vector_index = None
+        if config.get('vector_index_path'):
+            from .vector_index import Int8VectorIndex
+            self.vector_index = Int8VectorIndex(config['vector_index_path'])
+        
         logger.info("多模态检索引擎初始化完成")
     
     def search(self, query: Union[str, Dict], 
@@ -84,6 +95,128 @@ class MultiModalRetrievalEngine:
         else:
             raise ValueError("查询必须是字符串或字典类型")
         
+        return self._finalize_results(results, sort_by)
+    
+    def search_batch(self, queries: List[Union[str, Dict]], 
+                     modalities: Optional[List[str]] = None,
+                     filters: Optional[Dict] = None,
+                     sort_by: Optional[str] = 'relevance',
+                     limit: Optional[int] = None) -> List[Dict]:
+        """
+        批量搜索接口
+        所有文本查询共享一次元数据扫描，结果与逐个调用search一致
+        
+        Args:
+            queries: 搜索查询列表（字符串或字典）
+            modalities: 模态过滤列表
+            filters: 额外过滤条件
+            sort_by: 排序方式
+            limit: 结果数量限制
+            
+        Returns:
+            与queries一一对应的搜索结果列表
+        """
+        if limit is None:
+            limit = self.default_limit
+        
+        for query in queries:
+            if not isinstance(query, (str, dict)):
+                raise ValueError("查询必须是字符串或字典类型")
+        
+        # 一次扫描元数据，同时匹配所有文本查询
+        texts = [query for query in queries if isinstance(query, str)]
+        text_matches = dict(zip(texts, self._search_metadata_with_texts(texts, modalities)))
+        
+        batch_results = []
+        for query in queries:
+            results = {
+                'query': query,
+                'timestamp': datetime.now().isoformat(),
+                'total_results': 0,
+                'modality_results': {},
+                'aggregations': {}
+            }
+            if isinstance(query, str):
+                results['modality_results'].update(
+                    self._search_text(query, modalities, filters, limit,
+                                      metadata_matches=text_matches[query])
+                )
+            else:
+                results['modality_results'].update(
+                    self._search_structured(query, modalities, filters, limit)
+                )
+            batch_results.append(self._finalize_results(results, sort_by))
+        
+        return batch_results
+    
+    def add_embedding(self, entity_id: str, entity_type: str, embedding) -> None:
+        """
+        为实体添加嵌入向量
+        
+        Args:
+            entity_id: 实体唯一标识符
+            entity_type: 实体类型
+            embedding: 嵌入向量
+        """
+        if self.vector_index is None:
+            raise ValueError("向量索引未启用")
+        self.vector_index.add(entity_id, entity_type, embedding)
+    
+    def save_embeddings(self) -> None:
+        """将嵌入向量索引保存到磁盘"""
+        if self.vector_index is not None:
+            self.vector_index.save()
+    
+    def search_by_embedding(self, embedding, 
+                            modalities: Optional[List[str]] = None,
+                            limit: Optional[int] = None) -> Dict:
+        """
+        按嵌入向量检索相似实体
+        
+        Args:
+            embedding: 查询向量
+            modalities: 模态过滤列表
+            limit: 结果数量限制
+            
+        Returns:
+            搜索结果字典
+        """
+        if self.vector_index is None:
+            raise ValueError("向量索引未启用")
+        if limit is None:
+            limit = self.default_limit
+        
+        items = []
+        for hit in self.vector_index.search(embedding, limit, modalities):
+            entry = None
+            if self.metadata_index_manager:
+                entry = self.metadata_index_manager.get_index_entry(hit['id'], hit['type'])
+            items.append({
+                'id': hit['id'],
+                'type': hit['type'],
+                'metadata': entry.get('metadata', {}) if entry else {},
+                'score': hit['score']
+            })
+        
+        grouped_results = self._group_by_modality(items)
+        return {
+            'timestamp': datetime.now().isoformat(),
+            'total_results': len(items),
+            'modality_results': grouped_results,
+            'aggregations': self._generate_aggregations(grouped_results)
+        }
+    
+    def _finalize_results(self, results: Dict, sort_by: Optional[str]) -> Dict:
+        """
+        计算总数、聚合统计并排序
+        
+        Args:
+            results: 已填充modality_results的搜索结果
+            sort_by: 排序方式
+            
+        Returns:
+            完整的搜索结果
+        """
         # 计算总结果数
         results['total_results'] = sum(len(items) for items in results['modality_results'].values())
         
@@ -260,7 +393,8 @@ class MultiModalRetrievalEngine:
     def _search_text(self, query_text: str, 
                     modalities: Optional[List[str]] = None,
                     filters: Optional[Dict] = None,
-                    limit: int = 50) -> Dict[str, List[Dict]]:
+                    limit: int = 50,
+                    metadata_matches: Optional[List[Dict]] = None) -> Dict[str, List[Dict]]:
         """
         执行文本搜索
         
@@ -269,6 +403,7 @@ class MultiModalRetrievalEngine:
             modalities: 模态过滤列表
             filters: 额外过滤条件
             limit: 结果数量限制
+            metadata_matches: 已完成的元数据匹配结果（批量搜索时传入）
             
         Returns:
             按模态分组的结果
@@ -279,7 +414,8 @@ class MultiModalRetrievalEngine:
         if self.metadata_index_manager:
             # 简单实现：搜索包含查询关键词的元数据字段
             # 注意：实际应用中可能需要更复杂的全文搜索实现
-            metadata_matches = self._search_metadata_with_text(query_text, modalities)
+            if metadata_matches is None:
+                metadata_matches = self._search_metadata_with_text(query_text, modalities)
             results.update(self._group_by_modality(metadata_matches))
         
         # 2. 使用文档存储管理器搜索文本内容
@@ -357,11 +493,25 @@ class MultiModalRetrievalEngine:
         Returns:
             匹配的结果列表
         """
-        matches = []
-        query_lower = query_text.lower()
+        return self._search_metadata_with_texts([query_text], modalities)[0]
+    
+    def _search_metadata_with_texts(self, query_texts: List[str], 
+                                   modalities: Optional[List[str]] = None) -> List[List[Dict]]:
+        """
+        在元数据中同时搜索多个文本，只遍历一次索引
+        
+        Args:
+            query_texts: 搜索文本列表
+            modalities: 模态过滤列表
+            
+        Returns:
+            与query_texts一一对应的匹配结果列表
+        """
+        matches = [[] for _ in query_texts]
+        queries_lower = [query_text.lower() for query_text in query_texts]
         
         # 获取所有索引条目（简化实现，实际应该有更高效的方式）
-        if self.metadata_index_manager:
+        if self.metadata_index_manager and query_texts:
             # 由于没有直接的方法获取所有条目，这里使用一个小技巧：
             # 1. 先获取所有类型
             # 2. 对每种类型，尝试使用一个可能存在的通用字段进行查询
@@ -371,7 +521,6 @@ class MultiModalRetrievalEngine:
             # 这不是最高效的方法，但可以作为演示
             try:
                 # 这里假设我们可以访问患者索引
-                import os
                 patient_index_file = os.path.join(self.metadata_index_manager.index_path, 'patient_index.json')
                 if os.path.exists(patient_index_file):
                     with open(patient_index_file, 'r', encoding='utf-8') as f:
@@ -383,9 +532,10 @@ class MultiModalRetrievalEngine:
                         )
                         
                         for result in patient_results:
-                            # 检查元数据中是否包含查询文本
-                            if self._check_text_in_metadata(result['metadata'], query_lower):
-                                matches.append(result)
+                            # 检查元数据中是否包含各查询文本
+                            for i, query_lower in enumerate(queries_lower):
+                                if self._check_text_in_metadata(result['metadata'], query_lower):
+                                    matches[i].append(result)
             except Exception as e:
                 logger.warning(f"元数据文本搜索失败: {e}")
         
@@ -676,4 +826,142 @@ class MultiModalRetrievalEngine:
                 'total_results': 0,
                 'modality_results': {},
                 'aggregations': {'by_modality': {}, 'total': 0}
-            }
\ No newline at end of file
+            }
+
+
+# BatchingSearcher.search等待结果的默认超时（秒）
+DEFAULT_SEARCH_TIMEOUT = 30.0
+
+
+class BatchingSearcher:
+    """
+    搜索请求微批处理器
+    将短时间窗口内到达的搜索请求合并为一次search_batch调用，
+    多个并发请求共享同一次元数据扫描
+    """
+    
+    def __init__(self, retrieval_engine: MultiModalRetrievalEngine,
+                 max_batch_size: int = 32, max_wait_ms: float = 4.0):
+        """
+        初始化批处理器
+        
+        Args:
+            retrieval_engine: 检索引擎实例
+            max_batch_size: 单批最大请求数
+            max_wait_ms: 收集一批请求的最长等待时间（毫秒）
+        """
+        self.retrieval_engine = retrieval_engine
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = Queue()
+        self._worker = threading.Thread(target=self._run, name='batching-searcher', daemon=True)
+        self._worker.start()
+    
+    def submit(self, query: Union[str, Dict],
+               modalities: Optional[List[str]] = None,
+               filters: Optional[Dict] = None,
+               sort_by: Optional[str] = 'relevance',
+               limit: Optional[int] = None) -> Future:
+        """
+        提交搜索请求
+        查询类型和分组键在调用方线程中校验，参数错误直接抛给调用方，不进入批处理线程
+        
+        Returns:
+            搜索结果的Future对象
+        """
+        if not isinstance(query, (str, dict)):
+            raise ValueError("查询必须是字符串或字典类型")
+        key = (tuple(modalities) if modalities else None,
+               json.dumps(filters, sort_keys=True, default=str),
+               sort_by, limit)
+        hash(key)  # 模态列表中含不可哈希元素时在此抛出TypeError
+        
+        future = Future()
+        self._queue.put((key, query, modalities, filters, sort_by, limit, future))
+        return future
+    
+    def search(self, query: Union[str, Dict],
+               modalities: Optional[List[str]] = None,
+               filters: Optional[Dict] = None,
+               sort_by: Optional[str] = 'relevance',
+               limit: Optional[int] = None,
+               timeout: Optional[float] = DEFAULT_SEARCH_TIMEOUT) -> Dict:
+        """
+        提交搜索请求并等待结果，参数与MultiModalRetrievalEngine.search一致
+        
+        Args:
+            timeout: 等待结果的最长时间（秒），超时抛出concurrent.futures.TimeoutError
+        """
+        return self.submit(query, modalities, filters, sort_by, limit).result(timeout=timeout)
+    
+    def _run(self):
+        """后台线程：收集请求并批量执行"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except Empty:
+                    break
+            try:
+                self._flush(batch)
+            except Exception as e:
+                # 保证后台线程不退出，未完成的请求以该异常结束
+                logger.error(f"批量搜索失败: {e}")
+                for item in batch:
+                    if not item[-1].done():
+                        item[-1].set_exception(e)
+    
+    def _flush(self, batch: List[Tuple]):
+        """
+        按搜索参数分组后执行批量搜索，并把结果分发到各请求的Future
+        批量搜索失败时逐个重试，单个请求的错误不影响同组其他请求
+        
+        Args:
+            batch: (key, query, modalities, filters, sort_by, limit, future) 列表
+        """
+        groups = defaultdict(list)
+        for item in batch:
+            groups[item[0]].append(item)
+        
+        for items in groups.values():
+            _, _, modalities, filters, sort_by, limit, _ = items[0]
+            try:
+                results = self.retrieval_engine.search_batch(
+                    [item[1] for item in items],
+                    modalities=modalities,
+                    filters=filters,
+                    sort_by=sort_by,
+                    limit=limit
+                )
+            except Exception as e:
+                if len(items) == 1:
+                    items[0][-1].set_exception(e)
+                else:
+                    self._search_each(items)
+                continue
+            
+            for item, result in zip(items, results):
+                item[-1].set_result(result)
+    
+    def _search_each(self, items: List[Tuple]):
+        """
+        逐个执行同组请求，批量搜索失败时使用
+        
+        Args:
+            items: 同一分组的请求列表
+        """
+        for _, query, modalities, filters, sort_by, limit, future in items:
+            try:
+                result = self.retrieval_engine.search(
+                    query, modalities=modalities, filters=filters,
+                    sort_by=sort_by, limit=limit
+                )
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            future.set_result(result)
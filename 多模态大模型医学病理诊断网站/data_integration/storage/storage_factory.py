@@ -199,6 +199,7 @@ class StorageFactory:
         merged_config['metadata_index_manager'] = self.get_metadata_index_manager()
         merged_config['image_storage_manager'] = self.get_image_storage_manager()
         merged_config['document_storage_manager'] = self.get_document_storage_manager()
+        merged_config.setdefault('vector_index_path', os.path.join(self.config['index_path'], 'vectors'))
         
         # 导入类（避免循环导入）
         from .retrieval_engine import MultiModalRetrievalEngine
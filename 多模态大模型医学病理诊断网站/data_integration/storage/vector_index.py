@@ -0,0 +1,208 @@
+"""
+向量索引模块
+
+该模块提供int8量化的嵌入向量索引，用于按特征向量检索相似实体。
+向量按对称量化（每个向量一个缩放因子）以int8存储，内存占用为float32的1/4。
+"""
+import os
+import json
+import logging
+import threading
+from typing import Dict, Optional, List, Tuple
+
+import numpy as np
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    对称int8量化，每个向量使用独立的缩放因子
+
+    Args:
+        vectors: 向量或向量矩阵（d 或 n x d）
+
+    Returns:
+        (int8量化结果, 缩放因子)，原向量约等于 量化结果 * 缩放因子
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    max_abs = np.abs(vectors).max(axis=1)
+    scales = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+    quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+    return quantized, scales
+
+
+class Int8VectorIndex:
+    """
+    int8量化向量索引
+    暴力检索实现，按块反量化后计算内积，避免一次性展开整个索引
+    """
+
+    # 每次参与计算的向量数量
+    SCORE_BLOCK_SIZE = 65536
+
+    def __init__(self, index_path: str, dimension: Optional[int] = None):
+        """
+        初始化向量索引
+
+        Args:
+            index_path: 索引文件保存目录
+            dimension: 向量维度（为None时由第一个加入的向量确定）
+        """
+        self.index_path = index_path
+        self.dimension = dimension
+        self._lock = threading.Lock()
+
+        # 预留容量的存储数组，前self._size行有效
+        self._vectors = np.empty((0, dimension or 0), dtype=np.int8)
+        self._scales = np.empty(0, dtype=np.float32)
+        self._keys = []
+        self._positions = {}
+        self._size = 0
+
+        os.makedirs(index_path, exist_ok=True)
+        self._load()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, entity_id: str, entity_type: str, vector: np.ndarray):
+        """
+        添加或更新实体的嵌入向量
+
+        Args:
+            entity_id: 实体唯一标识符
+            entity_type: 实体类型
+            vector: 嵌入向量
+        """
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        if self.dimension is None:
+            self.dimension = vector.shape[0]
+            self._vectors = np.empty((0, self.dimension), dtype=np.int8)
+        if vector.shape[0] != self.dimension:
+            raise ValueError(f"向量维度不匹配: 期望 {self.dimension}，实际 {vector.shape[0]}")
+
+        quantized, scales = quantize_int8(vector)
+        key = (entity_type, entity_id)
+
+        with self._lock:
+            position = self._positions.get(key)
+            if position is None:
+                position = self._size
+                self._reserve(position + 1)
+                self._keys.append(key)
+                self._positions[key] = position
+                self._size += 1
+            self._vectors[position] = quantized[0]
+            self._scales[position] = scales[0]
+
+    def remove(self, entity_id: str, entity_type: str) -> bool:
+        """
+        删除实体的嵌入向量（用最后一行填补空位）
+
+        Returns:
+            是否删除成功
+        """
+        key = (entity_type, entity_id)
+        with self._lock:
+            position = self._positions.pop(key, None)
+            if position is None:
+                return False
+
+            last = self._size - 1
+            if position != last:
+                self._vectors[position] = self._vectors[last]
+                self._scales[position] = self._scales[last]
+                moved_key = self._keys[last]
+                self._keys[position] = moved_key
+                self._positions[moved_key] = position
+            self._keys.pop()
+            self._size -= 1
+            return True
+
+    def search(self, vector: np.ndarray, limit: int = 10,
+               entity_types: Optional[List[str]] = None) -> List[Dict]:
+        """
+        按内积检索最相似的向量
+
+        Args:
+            vector: 查询向量
+            limit: 结果数量限制
+            entity_types: 实体类型过滤列表
+
+        Returns:
+            按得分降序排列的结果列表，每项包含id、type和score
+        """
+        if self._size == 0:
+            return []
+
+        # 查询向量同样量化，使两侧误差对称
+        query, query_scale = quantize_int8(vector)
+        query = query[0].astype(np.float32) * query_scale[0]
+
+        with self._lock:
+            size = self._size
+            scores = np.empty(size, dtype=np.float32)
+            for start in range(0, size, self.SCORE_BLOCK_SIZE):
+                end = min(start + self.SCORE_BLOCK_SIZE, size)
+                # int8 -> float32后走BLAS，int32整数矩阵乘在NumPy中没有BLAS加速
+                block = self._vectors[start:end].astype(np.float32)
+                scores[start:end] = (block @ query) * self._scales[start:end]
+            keys = self._keys[:size]
+
+        if entity_types:
+            allowed = np.fromiter((key[0] in entity_types for key in keys), dtype=bool, count=size)
+            scores[~allowed] = -np.inf
+
+        limit = min(limit, size)
+        top = np.argpartition(-scores, limit - 1)[:limit]
+        top = top[np.argsort(-scores[top])]
+
+        return [
+            {'id': keys[i][1], 'type': keys[i][0], 'score': float(scores[i])}
+            for i in top if np.isfinite(scores[i])
+        ]
+
+    def save(self):
+        """将索引保存到磁盘"""
+        with self._lock:
+            np.save(os.path.join(self.index_path, 'vectors.npy'), self._vectors[:self._size])
+            np.save(os.path.join(self.index_path, 'scales.npy'), self._scales[:self._size])
+            with open(os.path.join(self.index_path, 'keys.json'), 'w', encoding='utf-8') as f:
+                json.dump(self._keys, f, ensure_ascii=False)
+
+    def _load(self):
+        """从磁盘加载索引"""
+        vectors_file = os.path.join(self.index_path, 'vectors.npy')
+        if not os.path.exists(vectors_file):
+            return
+
+        try:
+            vectors = np.load(vectors_file)
+            scales = np.load(os.path.join(self.index_path, 'scales.npy'))
+            with open(os.path.join(self.index_path, 'keys.json'), 'r', encoding='utf-8') as f:
+                keys = [tuple(key) for key in json.load(f)]
+        except Exception as e:
+            logger.error(f"加载向量索引失败: {e}")
+            return
+
+        self._vectors = vectors.astype(np.int8, copy=False)
+        self._scales = scales.astype(np.float32, copy=False)
+        self._keys = keys
+        self._positions = {key: i for i, key in enumerate(keys)}
+        self._size = len(keys)
+        self.dimension = vectors.shape[1]
+
+    def _reserve(self, capacity: int):
+        """按倍数扩容存储数组"""
+        if capacity <= self._vectors.shape[0]:
+            return
+        new_capacity = max(capacity, 2 * self._vectors.shape[0], 1024)
+        vectors = np.empty((new_capacity, self.dimension), dtype=np.int8)
+        scales = np.empty(new_capacity, dtype=np.float32)
+        vectors[:self._size] = self._vectors[:self._size]
+        scales[:self._size] = self._scales[:self._size]
+        self._vectors = vectors
+        self._scales = scales
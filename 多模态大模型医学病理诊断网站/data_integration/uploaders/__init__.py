@@ -1,7 +1,29 @@
 """多渠道数据上传接口模块"""
 
+from typing import Dict, Optional
+
 from .image_uploader import PathologyImageUploader
 from .system_integration import MedicalSystemIntegrator
-from .batch_manager import BatchUploadManager
+from .batch_manager import BatchUploadManager, BatchUploadTask
+
+
+def get_batch_manager(config: Optional[Dict] = None) -> BatchUploadManager:
+    """
+    根据上传配置创建批量上传管理器
+
+    Args:
+        config: 上传配置（upload部分），使用batch_processing.thread_pool_size和max_queue_size
+
+    Returns:
+        BatchUploadManager实例
+    """
+    config = config or {}
+    batch_config = config.get('batch_processing', {})
+    return BatchUploadManager(
+        max_workers=batch_config.get('thread_pool_size', 4),
+        queue_size=config.get('max_queue_size', 32)
+    )
+
 
-__all__ = ['PathologyImageUploader', 'MedicalSystemIntegrator', 'BatchUploadManager']
\ No newline at end of file
+__all__ = ['PathologyImageUploader', 'MedicalSystemIntegrator', 'BatchUploadManager',
+           'BatchUploadTask', 'get_batch_manager']
@@ -3,6 +3,7 @@ import os
 import threading
 import queue
 import time
+from collections import deque
 from typing import Dict, List, Optional, BinaryIO, Callable
 import uuid
 from datetime import datetime
@@ -62,15 +63,23 @@ class BatchUploadManager:
     提供图像批量上传和队列调度功能
     """
     
-    def __init__(self, max_workers: int = 4, upload_handler: Optional[Callable] = None):
+    def __init__(self, max_workers: int = 4, upload_handler: Optional[Callable] = None,
+                 queue_size: int = 32, enqueue_timeout: Optional[float] = 30.0):
         """
         初始化批量上传管理器
+        任务队列有界，队列满时添加任务的调用方等待，避免大批量任务占满内存
         
         Args:
             max_workers: 最大工作线程数
             upload_handler: 上传处理函数
+            queue_size: 任务队列的最大长度
+            enqueue_timeout: 运行中添加任务时等待队列空位的最长时间（秒），None表示一直等待；
+                未运行时队列已满立即失败
         """
-        self.task_queue = queue.Queue()
+        self.task_queue = queue.Queue(maxsize=queue_size)
+        self.enqueue_timeout = enqueue_timeout
+        # 等待重试的任务，由工作线程优先取出，不占用有界的任务队列
+        self._retry_queue = deque()
         self.max_workers = max_workers
         self.upload_handler = upload_handler
         self.workers: List[threading.Thread] = []
@@ -123,13 +132,16 @@ class BatchUploadManager:
             
         Returns:
             任务ID
+            
+        Raises:
+            RuntimeError: 任务队列已满且无法在等待时间内入队
         """
         task = BatchUploadTask(file_obj, metadata, task_type)
         
-        # 添加任务到队列和任务字典
+        # 添加任务到任务字典，队列已满时在锁外等待
         with self.lock:
-            self.task_queue.put(task)
             self.tasks[task.task_id] = task
+        self._enqueue(task)
         
         logger.info(f"添加任务到队列: {task.task_id}")
         return task.task_id
@@ -143,8 +155,11 @@ class BatchUploadManager:
             
         Returns:
             任务ID列表
+            
+        Raises:
+            RuntimeError: 任务队列已满且无法在等待时间内入队，未入队的任务不会保留
         """
-        task_ids = []
+        tasks = []
         
         with self.lock:
             for task_data in tasks_data:
@@ -153,13 +168,44 @@ class BatchUploadManager:
                 task_type = task_data.get("task_type", "image")
                 
                 task = BatchUploadTask(file_obj, metadata, task_type)
-                self.task_queue.put(task)
                 self.tasks[task.task_id] = task
-                task_ids.append(task.task_id)
+                tasks.append(task)
+        
+        # 逐个入队，队列满时等待工作线程消费
+        for index, task in enumerate(tasks):
+            try:
+                self._enqueue(task)
+            except RuntimeError:
+                with self.lock:
+                    for pending in tasks[index + 1:]:
+                        self.tasks.pop(pending.task_id, None)
+                raise
+        task_ids = [task.task_id for task in tasks]
         
         logger.info(f"批量添加任务完成，共添加 {len(task_ids)} 个任务")
         return task_ids
     
+    def _enqueue(self, task: BatchUploadTask):
+        """
+        把任务放入有界任务队列
+        运行中最多等待enqueue_timeout秒；未运行时没有线程消费队列，已满时立即失败
+        
+        Args:
+            task: 上传任务
+            
+        Raises:
+            RuntimeError: 任务未能入队（任务同时从任务字典中移除）
+        """
+        try:
+            if self.running:
+                self.task_queue.put(task, timeout=self.enqueue_timeout)
+            else:
+                self.task_queue.put_nowait(task)
+        except queue.Full:
+            with self.lock:
+                self.tasks.pop(task.task_id, None)
+            raise RuntimeError(f"上传任务队列已满（{self.task_queue.maxsize}），任务未添加: {task.task_id}")
+    
     def get_task_status(self, task_id: str) -> Optional[Dict]:
         """
         获取任务状态
@@ -193,19 +239,68 @@ class BatchUploadManager:
         Returns:
             待处理任务数量
         """
-        return self.task_queue.qsize()
+        return self.task_queue.qsize() + len(self._retry_queue)
+    
+    def get_active_tasks(self) -> List[Dict]:
+        """
+        获取正在处理的任务
+        
+        Returns:
+            处理中任务的状态信息列表
+        """
+        with self.lock:
+            return [task.to_dict() for task in self.tasks.values() if task.status == "processing"]
+    
+    def get_queued_tasks(self) -> List[Dict]:
+        """
+        获取等待处理的任务
+        
+        Returns:
+            等待中任务的状态信息列表
+        """
+        with self.lock:
+            return [task.to_dict() for task in self.tasks.values() if task.status == "pending"]
+    
+    def get_task_counts(self) -> Dict[str, int]:
+        """
+        统计处理中和等待中的任务数量（只计数，不构建任务状态字典）
+        
+        Returns:
+            {'active': 处理中任务数, 'queued': 等待中任务数}
+        """
+        active = queued = 0
+        with self.lock:
+            for task in self.tasks.values():
+                if task.status == "processing":
+                    active += 1
+                elif task.status == "pending":
+                    queued += 1
+        return {'active': active, 'queued': queued}
     
     def _worker_thread(self):
         """
         工作线程函数
         """
         while self.running:
+            # 优先处理等待重试的任务
             try:
-                # 从队列获取任务，设置超时以便定期检查running状态
-                task = self.task_queue.get(timeout=1)
-                
-                # 更新任务状态
+                task = self._retry_queue.popleft()
+                from_queue = False
+            except IndexError:
+                try:
+                    # 从队列获取任务，设置超时以便定期检查running状态
+                    task = self.task_queue.get(timeout=1)
+                except queue.Empty:
+                    # 队列为空，继续循环
+                    continue
+                from_queue = True
+            
+            try:
+                # 跳过已取消的任务
                 with self.lock:
+                    if task.status == "cancelled":
+                        continue
+                    # 更新任务状态
                     task.status = "processing"
                     task.started_at = datetime.now()
                 
@@ -215,48 +310,60 @@ class BatchUploadManager:
                     # 调用上传处理函数
                     if self.upload_handler:
                         result = self.upload_handler(task.file_obj, task.metadata)
-                        task.result = result
-                        task.status = "completed"
-                        logger.info(f"任务处理完成: {task.task_id}")
                     else:
                         # 模拟上传处理
                         time.sleep(2)  # 模拟处理时间
-                        task.result = {"message": "模拟上传成功", "task_id": task.task_id}
-                        task.status = "completed"
-                        logger.info(f"任务模拟处理完成: {task.task_id}")
+                        result = {"message": "模拟上传成功", "task_id": task.task_id}
                 except Exception as e:
-                    # 处理任务执行异常
-                    error_msg = str(e)
-                    with self.lock:
-                        task.status = "failed"
-                        task.error = error_msg
-                    logger.error(f"任务处理失败: {task.task_id}, 错误: {error_msg}")
-                finally:
-                    # 更新任务完成时间
-                    with self.lock:
-                        task.completed_at = datetime.now()
-                    
-                    # 标记任务完成
-                    self.task_queue.task_done()
-                    
-                    # 如果任务失败，根据配置可以选择重试
-                    if task.status == "failed" and task.metadata.get("auto_retry", False):
-                        retry_count = task.metadata.get("retry_count", 0)
-                        max_retries = task.metadata.get("max_retries", 3)
-                        
-                        if retry_count < max_retries:
-                            task.metadata["retry_count"] = retry_count + 1
-                            with self.lock:
-                                self.task_queue.put(task)
-                                task.status = "pending"
-                                task.started_at = None
-                                task.completed_at = None
-                            logger.info(f"任务将重试: {task.task_id}, 重试次数: {retry_count + 1}")
-            except queue.Empty:
-                # 队列为空，继续循环
-                continue
+                    self._finish_task(task, error=str(e))
+                    continue
+                
+                self._finish_task(task, result=result)
             except Exception as e:
                 logger.error(f"工作线程异常: {e}")
+            finally:
+                # 标记任务完成（重试任务不是从任务队列取出的）
+                if from_queue:
+                    self.task_queue.task_done()
+    
+    def _finish_task(self, task: BatchUploadTask, result: Optional[Dict] = None, error: Optional[str] = None):
+        """
+        记录任务结果，失败且开启自动重试时重新入队
+        
+        Args:
+            task: 上传任务
+            result: 处理结果
+            error: 错误信息
+        """
+        with self.lock:
+            task.completed_at = datetime.now()
+            if error is None:
+                task.result = result
+                task.status = "completed"
+            else:
+                task.status = "failed"
+                task.error = error
+        
+        if error is None:
+            logger.info(f"任务处理完成: {task.task_id}")
+            return
+        
+        logger.error(f"任务处理失败: {task.task_id}, 错误: {error}")
+        
+        # 如果任务失败，根据配置可以选择重试
+        if task.metadata.get("auto_retry", False):
+            retry_count = task.metadata.get("retry_count", 0)
+            max_retries = task.metadata.get("max_retries", 3)
+            
+            if retry_count < max_retries:
+                task.metadata["retry_count"] = retry_count + 1
+                with self.lock:
+                    task.status = "pending"
+                    task.started_at = None
+                    task.completed_at = None
+                # 由现有工作线程从重试队列取出，不额外创建线程
+                self._retry_queue.append(task)
+                logger.info(f"任务将重试: {task.task_id}, 重试次数: {retry_count + 1}")
     
     def pause_task(self, task_id: str) -> bool:
         """
@@ -0,0 +1,86 @@
+"""文档存储管理器测试"""
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from data_integration.storage import document_storage
+from data_integration.storage.document_storage import DocumentStorageManager
+
+
+class _NoFTS5Connection(sqlite3.Connection):
+    """模拟未编译FTS5的SQLite：创建FTS5虚拟表时报错"""
+
+    def execute(self, sql, *args):
+        if 'USING fts5' in sql:
+            raise sqlite3.OperationalError('no such module: fts5')
+        return super().execute(sql, *args)
+
+
+class DocumentStorageWithoutFTS5Test(unittest.TestCase):
+    """SQLite不支持FTS5时使用内存倒排表检索"""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        connect = sqlite3.connect
+        with mock.patch.object(document_storage.sqlite3, 'connect',
+                               lambda *args, **kwargs: connect(*args, factory=_NoFTS5Connection, **kwargs)):
+            self.storage = DocumentStorageManager({'storage_path': self._tmp.name})
+
+    def test_store_and_search(self):
+        self.assertFalse(self.storage._fulltext_enabled)
+
+        document_id = self.storage.store_document(
+            'Lung adenocarcinoma with lymph node metastasis.',
+            {'title': 'Pathology report'}
+        )
+        self.storage.store_document('Normal tissue.', {'title': 'Follow-up note'})
+
+        self.assertEqual(self.storage.retrieve_document(document_id)['content'],
+                         'Lung adenocarcinoma with lymph node metastasis.')
+        results = self.storage.search_documents('pathology')
+        self.assertEqual([result['id'] for result in results], [document_id])
+
+
+class DocumentStorageCompactionTest(unittest.TestCase):
+    """更新和删除产生的失效字节按段统计，压缩后回收"""
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        # 段的上限小于每个文档的内容，每次写入都会轮转到新段
+        self.storage = DocumentStorageManager({
+            'storage_path': self._tmp.name,
+            'index_path': os.path.join(self._tmp.name, 'indexes'),
+            'segment_max_bytes': 16
+        })
+
+    def test_dead_bytes_and_compaction(self):
+        content = 'Lung adenocarcinoma with lymph node metastasis.'
+        updated_id = self.storage.store_document(content, {'title': 'Report A'})
+        shared_id = self.storage.store_document('Shared content.', {'title': 'Report B'})
+        duplicate_id = self.storage.store_document('Shared content.', {'title': 'Report C'})
+        self.storage.store_document('Latest content.', {'title': 'Report D'})
+        first_segment = self.storage.get_metadata(updated_id)['segment']['id']
+        shared_segment = self.storage.get_metadata(shared_id)['segment']['id']
+
+        # 仍有文档共用的内容不计入失效字节
+        self.assertTrue(self.storage.delete_document(duplicate_id))
+        self.assertEqual(self.storage.get_storage_statistics()['segment_dead_bytes'], 0)
+
+        self.assertTrue(self.storage.update_document(updated_id, 'Revised content.'))
+        self.assertEqual(self.storage.get_storage_statistics()['segment_dead_bytes'], len(content))
+
+        result = self.storage.compact_segments()
+        self.assertEqual(result, {'compacted_segments': 1, 'reclaimed_bytes': len(content)})
+        self.assertFalse(os.path.exists(self.storage._segment_file(first_segment)))
+        self.assertTrue(os.path.exists(self.storage._segment_file(shared_segment)))
+        self.assertEqual(self.storage.get_storage_statistics()['segment_dead_bytes'], 0)
+        self.assertEqual(self.storage.retrieve_document(updated_id)['content'], 'Revised content.')
+        self.assertEqual(self.storage.retrieve_document(shared_id)['content'], 'Shared content.')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+"""
+切片瓦片服务（独立进程）
+
+通过ZeroMQ REP套接字对外提供病理切片瓦片，瓦片读取和编码不经过Flask/WSGI，
+Web端的 /api/slide/<filename>/tile/... 路由只负责把请求转发到这里。
+
+请求为JSON：{"slide": 文件名, "level": 层级, "row": 行号, "col": 列号, "encoding": "jpeg"|"raw"}
+响应为两帧：第一帧为JSON头（status/shape/dtype/codec），第二帧为瓦片数据。
+  - jpeg: 浏览器直接显示的JPEG字节
+  - raw:  RGB像素数组，安装blosc时使用blosc压缩，供模型推理等客户端使用
+
+用法：
+    python tile_server.py --bind tcp://127.0.0.1:5555 --upload-folder uploads/
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+from collections import OrderedDict
+
+import zmq
+
+try:
+    import blosc
+except ImportError:  # blosc为可选依赖，缺失时raw瓦片不压缩
+    blosc = None
+
+try:
+    import openslide
+except ImportError:
+    openslide = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+TILE_SIZE = 256
+JPEG_QUALITY = 80
+MAX_OPEN_SLIDES = 32
+
+
+class TileServer:
+    """基于ZeroMQ REP套接字的瓦片服务"""
+
+    def __init__(self, upload_folder: str, tile_size: int = TILE_SIZE):
+        """
+        初始化瓦片服务
+
+        Args:
+            upload_folder: 切片文件所在目录
+            tile_size: 瓦片边长
+        """
+        if openslide is None:
+            raise ImportError("瓦片服务需要安装openslide-python")
+        self.upload_folder = upload_folder
+        self.tile_size = tile_size
+        # 最近使用的切片句柄，避免每个瓦片都重新打开文件
+        self._slides = OrderedDict()
+
+    def _open_slide(self, filename: str):
+        """获取切片句柄，超出数量限制时关闭最久未使用的句柄"""
+        slide = self._slides.get(filename)
+        if slide is not None:
+            self._slides.move_to_end(filename)
+            return slide
+
+        filepath = os.path.join(self.upload_folder, os.path.basename(filename))
+        slide = openslide.OpenSlide(filepath)
+        self._slides[filename] = slide
+        if len(self._slides) > MAX_OPEN_SLIDES:
+            _, oldest = self._slides.popitem(last=False)
+            oldest.close()
+        return slide
+
+    def read_tile(self, filename: str, level: int, row: int, col: int):
+        """
+        读取指定层级的单个瓦片
+
+        Returns:
+            RGB格式的PIL图像
+        """
+        slide = self._open_slide(filename)
+        if not 0 <= level < slide.level_count:
+            raise IndexError(f"层级超出范围: {level}")
+
+        width, height = slide.level_dimensions[level]
+        x, y = col * self.tile_size, row * self.tile_size
+        if not (0 <= x < width and 0 <= y < height):
+            raise IndexError(f"瓦片坐标超出范围: ({row}, {col})")
+
+        # read_region的坐标使用第0层坐标系
+        downsample = slide.level_downsamples[level]
+        size = (min(self.tile_size, width - x), min(self.tile_size, height - y))
+        region = slide.read_region((int(x * downsample), int(y * downsample)), level, size)
+        return region.convert('RGB')
+
+    def handle(self, message: bytes):
+        """
+        处理一个请求
+
+        Returns:
+            (响应头, 瓦片数据)
+        """
+        try:
+            request = json.loads(message)
+            tile = self.read_tile(request['slide'], int(request.get('level', 0)),
+                                  int(request['row']), int(request['col']))
+        except (KeyError, ValueError, IndexError) as e:
+            return {'status': 'error', 'error': str(e)}, b''
+        except Exception as e:
+            logger.error(f"读取瓦片失败: {e}")
+            return {'status': 'error', 'error': str(e)}, b''
+
+        if request.get('encoding', 'jpeg') == 'raw':
+            data = tile.tobytes()
+            header = {'status': 'ok', 'shape': [tile.height, tile.width, 3], 'dtype': 'uint8'}
+            if blosc is not None:
+                data = blosc.compress(data, typesize=1, cname='lz4')
+                header['codec'] = 'blosc'
+            else:
+                header['codec'] = 'none'
+            return header, data
+
+        buffer = io.BytesIO()
+        tile.save(buffer, format='JPEG', quality=JPEG_QUALITY)
+        return {'status': 'ok', 'codec': 'jpeg'}, buffer.getvalue()
+
+    def serve(self, bind: str):
+        """在指定地址上循环处理请求"""
+        context = zmq.Context.instance()
+        sock = context.socket(zmq.REP)
+        sock.bind(bind)
+        logger.info(f"瓦片服务已启动: {bind}")
+
+        try:
+            while True:
+                header, data = self.handle(sock.recv())
+                sock.send_multipart([json.dumps(header).encode('utf-8'), data], copy=False)
+        finally:
+            sock.close(linger=0)
+            for slide in self._slides.values():
+                slide.close()
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='病理切片瓦片服务')
+    parser.add_argument('--bind', default='tcp://127.0.0.1:5555', help='ZeroMQ监听地址')
+    parser.add_argument('--upload-folder', default='uploads/', help='切片文件所在目录')
+    parser.add_argument('--tile-size', type=int, default=TILE_SIZE, help='瓦片边长')
+    args = parser.parse_args()
+
+    TileServer(args.upload_folder, args.tile_size).serve(args.bind)
+
+
+if __name__ == '__main__':
+    main()